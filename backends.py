@@ -0,0 +1,266 @@
+"""
+Inference backends running the detection and pose networks.
+
+A backend takes a batch preprocessed by model_config.preprocess_batch, float32
+NCHW RGB in [0, 1], and returns the raw network outputs as NumPy arrays:
+(n, 4 + classes, anchors) for detection and (n, 4 + 1 + keypoints, anchors)
+for pose. NMS and scaling are done once for all backends in postprocess.py.
+
+    torch  ultralytics models in PyTorch eager mode, on CUDA when available.
+    onnx   ONNX Runtime on the CPU. The models are exported from the same
+           weights into MODEL_CACHE_DIR the first time they are used, delete
+           the .onnx files there to export them again. With
+           CV_ONNX_PRECISION=int8 the INT8 models promoted by quantize.py
+           are loaded instead.
+
+The backend is chosen with CV_BACKEND. ONNX Runtime sessions are created on
+first use, so a backend made before serve.py forks its workers is safe to use
+in each of them.
+"""
+
+import ast
+import os
+from abc import ABC, abstractmethod
+import shutil
+import threading
+
+from log import logging
+from settings import (
+    INFERENCE_BACKEND, DETECTION_WEIGHTS, POSE_WEIGHTS, MODEL_CACHE_DIR,
+    ONNX_INTRA_OP_THREADS, ONNX_INTER_OP_THREADS, ONNX_PRECISION, INFERENCE_SIZE,
+)
+
+PRECISIONS = ("fp32", "int8")
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceBackend(ABC):
+    """
+    Detection and pose networks behind one interface. A backend missing any
+    of the abstract members fails when it is made, not on its first frame.
+    """
+
+    name = None
+
+    @property
+    @abstractmethod
+    def detection_classes(self):
+        """Number of classes of the detection network."""
+
+    @property
+    @abstractmethod
+    def pose_classes(self):
+        """Number of classes of the pose network."""
+
+    @property
+    @abstractmethod
+    def kpt_shape(self):
+        """(keypoints, 2 or 3) of the pose network, 3 when keypoints carry a confidence."""
+
+    @abstractmethod
+    def configure_threads(self, detection_threads, pose_threads, detection_cores=None, pose_cores=None):
+        """
+        Threads of one forward pass of each network, and the cores they run on.
+        Args:
+            detection_threads (int): Intra-op threads of the detection network.
+            pose_threads (int): Intra-op threads of the pose network.
+            detection_cores (list[int]): Cores of the detection threads, any if None.
+            pose_cores (list[int]): Cores of the pose threads, any if None.
+        """
+
+    def set_num_threads(self, threads):
+        """Limit the threads of one forward pass of either network."""
+        self.configure_threads(threads, threads)
+
+    @abstractmethod
+    def detect(self, images):
+        """Raw detection output of a preprocessed batch."""
+
+    @abstractmethod
+    def pose(self, images):
+        """Raw pose output of a preprocessed batch."""
+
+
+class TorchBackend(InferenceBackend):
+    """ultralytics models called directly, fused as the predictor would fuse them."""
+
+    name = "torch"
+
+    def __init__(self, detection_weights=DETECTION_WEIGHTS, pose_weights=POSE_WEIGHTS):
+        import torch
+        from ultralytics import YOLO
+
+        self._torch = torch
+        self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        self.detection_model = YOLO(detection_weights).to(self.device)  # YOLOv8 for object detection
+        self.pose_model = YOLO(pose_weights).to(self.device)  # YOLOv8 for pose estimation
+        for model in (self.detection_model, self.pose_model):
+            model.model.fuse(verbose=False).eval()
+
+    @property
+    def detection_classes(self):
+        return len(self.detection_model.names)
+
+    @property
+    def pose_classes(self):
+        return len(self.pose_model.names)
+
+    @property
+    def kpt_shape(self):
+        return tuple(self.pose_model.model.kpt_shape)
+
+    def configure_threads(self, detection_threads, pose_threads, detection_cores=None, pose_cores=None):
+        # One intra-op thread count for the process, and no per-network
+        # affinity. Pin the whole process instead, see planner.py.
+        self._torch.set_num_threads(max(detection_threads, pose_threads))
+
+    def _forward(self, model, images):
+        with self._torch.inference_mode():
+            preds = model.model(self._torch.from_numpy(images).to(self.device))
+        if isinstance(preds, (list, tuple)):
+            preds = preds[0]
+        return preds.float().cpu().numpy()
+
+    def detect(self, images):
+        return self._forward(self.detection_model, images)
+
+    def pose(self, images):
+        return self._forward(self.pose_model, images)
+
+
+def onnx_path(weights, cache_dir=MODEL_CACHE_DIR, suffix=None):
+    """Path in the cache of the ONNX model of a weights file, `suffix` tells variants apart."""
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    name = f"{stem}.{suffix}.onnx" if suffix else f"{stem}.onnx"
+    return os.path.join(cache_dir, name)
+
+
+def export_onnx(weights, cache_dir=MODEL_CACHE_DIR):
+    """
+    Path of the ONNX export of a weights file, exported on the first call.
+    Args:
+        weights (str): ultralytics weights, e.g. "yolov8s.pt".
+        cache_dir (str): Directory the exports are kept in.
+    Returns:
+        str: Path of the .onnx file.
+    """
+    path = onnx_path(weights, cache_dir)
+    if os.path.exists(path):
+        return path
+
+    from ultralytics import YOLO
+
+    logger.info("Exporting %s to %s", weights, path)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Dynamic axes, batches and letterboxed shapes vary
+    exported = YOLO(weights).export(format="onnx", imgsz=INFERENCE_SIZE, dynamic=True)
+    shutil.move(exported, path)
+    return path
+
+
+class OnnxBackend(InferenceBackend):
+    """ONNX Runtime on the CPU."""
+
+    name = "onnx"
+
+    def __init__(self, detection_weights=DETECTION_WEIGHTS, pose_weights=POSE_WEIGHTS, cache_dir=MODEL_CACHE_DIR,
+                 intra_op_threads=ONNX_INTRA_OP_THREADS, inter_op_threads=ONNX_INTER_OP_THREADS,
+                 precision=ONNX_PRECISION, paths=None):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision {precision!r}, expected one of {PRECISIONS}")
+        self.weights = {"detection": detection_weights, "pose": pose_weights}
+        self.cache_dir = cache_dir
+        self.precision = precision
+        # Explicit model files by kind, used instead of the cache
+        self.paths = dict(paths or {})
+        if precision == "int8":
+            for kind, weights in self.weights.items():
+                self.paths.setdefault(kind, onnx_path(weights, cache_dir, "int8"))
+            missing = [path for path in self.paths.values() if not os.path.exists(path)]
+            if missing:
+                raise FileNotFoundError(f"No INT8 models at {missing}, make them with quantize.py")
+        self.intra_op_threads = {"detection": intra_op_threads, "pose": intra_op_threads}
+        self.inter_op_threads = inter_op_threads
+        self.cores = {"detection": None, "pose": None}
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _session(self, kind):
+        """(session, input name, metadata) of a network, created on first use."""
+        loaded = self._sessions.get(kind)
+        if loaded is not None:
+            return loaded
+
+        with self._lock:
+            if kind not in self._sessions:
+                import onnxruntime as ort
+
+                options = ort.SessionOptions()
+                options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                # 0 leaves the choice to ONNX Runtime
+                threads = self.intra_op_threads[kind]
+                options.intra_op_num_threads = threads
+                cores = self.cores[kind]
+                if cores and threads > 1:
+                    # One entry per thread besides the calling one, logical processors counted from 1
+                    affinities = ";".join(str(cores[i % len(cores)] + 1) for i in range(1, threads))
+                    options.add_session_config_entry("session.intra_op_thread_affinities", affinities)
+                options.inter_op_num_threads = self.inter_op_threads
+                if self.inter_op_threads > 1:
+                    options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+
+                path = self.paths.get(kind) or export_onnx(self.weights[kind], self.cache_dir)
+                session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+                metadata = session.get_modelmeta().custom_metadata_map
+                self._sessions[kind] = (session, session.get_inputs()[0].name, metadata)
+                logger.info("Loaded %s model %s with ONNX Runtime", kind, path)
+        return self._sessions[kind]
+
+    @property
+    def detection_classes(self):
+        return len(ast.literal_eval(self._session("detection")[2]["names"]))
+
+    @property
+    def pose_classes(self):
+        return len(ast.literal_eval(self._session("pose")[2]["names"]))
+
+    @property
+    def kpt_shape(self):
+        return tuple(ast.literal_eval(self._session("pose")[2]["kpt_shape"]))
+
+    def configure_threads(self, detection_threads, pose_threads, detection_cores=None, pose_cores=None):
+        # Sessions are created again with the new options on their next use
+        with self._lock:
+            self.intra_op_threads = {"detection": detection_threads, "pose": pose_threads}
+            self.cores = {"detection": detection_cores, "pose": pose_cores}
+            self._sessions = {}
+
+    def _forward(self, kind, images):
+        session, input_name, _ = self._session(kind)
+        return session.run(None, {input_name: images})[0]
+
+    def detect(self, images):
+        return self._forward("detection", images)
+
+    def pose(self, images):
+        return self._forward("pose", images)
+
+
+BACKENDS = {
+    TorchBackend.name: TorchBackend,
+    OnnxBackend.name: OnnxBackend,
+}
+
+
+def create_backend(name=INFERENCE_BACKEND, **kwargs):
+    """
+    The inference backend called `name`.
+    Args:
+        name (str): One of BACKENDS.
+    Returns:
+        InferenceBackend: The backend.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {name!r}, expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name](**kwargs)
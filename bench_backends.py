@@ -0,0 +1,136 @@
+"""
+Parity check and throughput of the inference backends.
+
+Every backend runs on the same preprocessed frames. The raw outputs and the
+resulting ball boxes and ankles are compared with the torch backend, the
+script exits with status 1 when they differ by more than the tolerances.
+Throughput is reported in frames per second for each batch size.
+
+    python bench_backends.py --video drill.mp4 --frames 64
+    python bench_backends.py --images "recordings/*.jpg" --batch-sizes 1 8
+    CV_DETECTION_WEIGHTS=untrained.pt CV_POSE_WEIGHTS=untrained-pose.pt python bench_backends.py --conf 0
+"""
+
+import argparse
+import glob
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from backends import BACKENDS, create_backend
+from model_config import detections_from_output, poses_from_output, preprocess_batch
+from observations import R_ANKLE, L_ANKLE
+from profiles import CONFIDENCE_THRESHOLD, ModelProfile
+
+
+def load_frames(args):
+    if args.video:
+        capture = cv2.VideoCapture(args.video)
+        frames = []
+        while len(frames) < args.frames:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            frames.append(frame)
+        capture.release()
+    elif args.images:
+        frames = [cv2.imread(path) for path in sorted(glob.glob(args.images))[:args.frames]]
+    else:
+        # Without a recording only the raw outputs are compared meaningfully
+        rng = np.random.default_rng(0)
+        frames = [cv2.GaussianBlur(rng.integers(0, 255, (720, 1280, 3), dtype=np.uint8), (0, 0), 5)
+                  for _ in range(args.frames)]
+    if not frames:
+        raise SystemExit("No frames to run on")
+    return frames
+
+
+def run(backend, frames, conf):
+    """Raw outputs, and the ball and ankles of every frame."""
+    batch = preprocess_batch(frames)
+    detect, pose = backend.detect(batch.images), backend.pose(batch.images)
+    profile = ModelProfile(conf=conf)
+    balls, _ = detections_from_output(detect, batch, backend.detection_classes, profile)
+    keypoints, _ = poses_from_output(pose, batch, backend.pose_classes, backend.kpt_shape, profile)
+    return detect, pose, balls, keypoints[:, [R_ANKLE, L_ANKLE]]
+
+
+def compare(reference, other):
+    """Largest differences between the results of two backends."""
+    ref_detect, ref_pose, ref_balls, ref_ankles = reference
+    detect, pose, balls, ankles = other
+    report = {
+        "detect_output": float(np.abs(ref_detect - detect).max()),
+        "pose_output": float(np.abs(ref_pose - pose).max()),
+    }
+    mismatched = compared = 0
+    for name, ref_values, values in (("ball", ref_balls, balls), ("ankle", ref_ankles, ankles)):
+        # A ball or an ankle found by only one of the backends
+        found, ref_found = ~np.isnan(values[..., 0]), ~np.isnan(ref_values[..., 0])
+        mismatched += int((found != ref_found).sum())
+        both = found & ref_found
+        compared += int(both.sum())
+        report[name] = float(np.abs(ref_values[both] - values[both]).max()) if both.any() else 0.0
+    report["mismatched"] = mismatched
+    # Balls and ankles found by both, the differences above are over these
+    report["compared"] = compared
+    return report
+
+
+def throughput(backend, frames, batch_size, iterations):
+    batches = [preprocess_batch(frames[i:i + batch_size]) for i in range(0, len(frames) - batch_size + 1, batch_size)]
+    backend.detect(batches[0].images)  # warm up
+    backend.pose(batches[0].images)
+    start = time.perf_counter()
+    count = 0
+    for _ in range(iterations):
+        for batch in batches:
+            backend.detect(batch.images)
+            backend.pose(batch.images)
+            count += len(batch.shapes)
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video")
+    parser.add_argument("--images", help="glob of recorded frames")
+    parser.add_argument("--frames", type=int, default=32)
+    parser.add_argument("--backends", nargs="+", default=sorted(BACKENDS))
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--box-tolerance", type=float, default=0.01, help="normalised units")
+    parser.add_argument("--ankle-tolerance", type=float, default=0.01, help="normalised units")
+    parser.add_argument("--conf", type=float, default=CONFIDENCE_THRESHOLD,
+                        help="confidence threshold of the ball and person, 0 keeps the most confident one of "
+                             "every frame, e.g. to compare untrained weights")
+    args = parser.parse_args()
+
+    frames = load_frames(args)
+    backends = {name: create_backend(name) for name in args.backends}
+
+    failed = False
+    if "torch" in backends:
+        reference = run(backends["torch"], frames, args.conf)
+        print(f"{'backend':<8}{'detect out':>12}{'pose out':>10}{'ball':>8}{'ankle':>8}{'mismatched':>12}{'compared':>10}")
+        for name, backend in backends.items():
+            report = compare(reference, run(backend, frames, args.conf))
+            print(f"{name:<8}{report['detect_output']:>12.4f}{report['pose_output']:>10.4f}"
+                  f"{report['ball']:>8.4f}{report['ankle']:>8.4f}{report['mismatched']:>12}{report['compared']:>10}")
+            failed |= (report["ball"] > args.box_tolerance or report["ankle"] > args.ankle_tolerance
+                       or report["mismatched"] > 0)
+
+    print(f"{'backend':<8}" + "".join(f"{f'fps@{size}':>10}" for size in args.batch_sizes))
+    for name, backend in backends.items():
+        print(f"{name:<8}" + "".join(f"{throughput(backend, frames, size, args.iterations):>10.1f}"
+                                     for size in args.batch_sizes if size <= len(frames)))
+
+    if failed:
+        print("Backends differ by more than the tolerances")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark of frame preprocessing before inference, over typical phone resolutions.
+
+Compares the previous path (full resolution decode, BGR to RGB conversion,
+then the letterbox the models apply) with decoding at the scale of the model
+input and letterboxing once.
+
+    python bench_preprocess.py --iterations 100
+"""
+
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from bench_protocol import make_jpeg
+from preprocess import decode_to_target, letterbox
+from settings import INFERENCE_SIZE
+
+# Typical phone camera streams, landscape and portrait
+RESOLUTIONS = (
+    (640, 480),
+    (1280, 720),
+    (720, 1280),
+    (1920, 1080),
+    (1080, 1920),
+    (2560, 1440),
+    (3840, 2160),
+)
+
+
+def full_path(jpeg, size):
+    frame = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    return letterbox(frame, size)[0]
+
+
+def target_path(jpeg, size):
+    frame, _ = decode_to_target(jpeg, size)
+    return letterbox(frame, size)[0]
+
+
+def measure(path, jpeg, size, iterations):
+    path(jpeg, size)  # warm up
+    start = time.process_time()
+    for _ in range(iterations):
+        path(jpeg, size)
+    return (time.process_time() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=INFERENCE_SIZE)
+    parser.add_argument("--quality", type=int, default=80)
+    parser.add_argument("--iterations", type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"Letterboxed to {args.size}x{args.size}, JPEG q{args.quality}, {args.iterations} iterations")
+    print(f"{'resolution':<12}{'decoded':>12}{'full ms':>10}{'target ms':>12}{'speedup':>10}")
+    for width, height in RESOLUTIONS:
+        jpeg = make_jpeg(width, height, args.quality)
+        decoded, _ = decode_to_target(jpeg, args.size)
+        full = measure(full_path, jpeg, args.size, args.iterations)
+        target = measure(target_path, jpeg, args.size, args.iterations)
+        print(f"{f'{width}x{height}':<12}{f'{decoded.shape[1]}x{decoded.shape[0]}':>12}"
+              f"{full * 1000:>10.3f}{target * 1000:>12.3f}{full / target:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
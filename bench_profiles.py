@@ -0,0 +1,97 @@
+"""
+Latency and count accuracy of the inference profiles on recorded sessions.
+
+Every session is run through each profile, decoded, preprocessed and
+inferred as the server would do it one frame at a time, and counted with
+trigger.get_trigger. A count is compared with the one in the meta.json of
+the session, or with the count of the default profile when there is none.
+For each drill the cheapest profile whose count error stays within
+--max-count-error is suggested, as a CV_DRILL_PROFILES value.
+
+    python bench_profiles.py recordings/ --profiles default front detail
+"""
+
+import argparse
+import time
+from collections import defaultdict
+
+from model_config import detections_from_output, load_models, poses_from_output, preprocess_batch
+from observations import FrameObservation
+from preprocess import decode_to_target
+from profiles import DEFAULT_PROFILE, PROFILES
+from recordings import load_sessions
+from session import DrillSession
+from trigger import get_trigger
+
+
+def run_session(backend, recorded, profile):
+    """Final count of a recorded session and the mean time per frame in seconds."""
+    drill = DrillSession(recorded.drill_type)
+    elapsed = 0.0
+    for frame_count, jpeg in recorded.frames():
+        started = time.perf_counter()
+        frame, _ = decode_to_target(jpeg, profile.decode_size)
+        batch = preprocess_batch([frame], profile.detection.imgsz)
+        ball, ball_confidence = detections_from_output(backend.detect(batch.images), batch,
+                                                       backend.detection_classes, profile.detection)
+        if profile.pose.imgsz != profile.detection.imgsz:
+            batch = preprocess_batch([frame], profile.pose.imgsz)
+        keypoints, keypoint_confidence = poses_from_output(backend.pose(batch.images), batch, backend.pose_classes,
+                                                           backend.kpt_shape, profile.pose)
+        elapsed += time.perf_counter() - started
+
+        observation = FrameObservation(ball[0], float(ball_confidence[0]), keypoints[0], keypoint_confidence[0])
+        if drill.estimator is not None:
+            drill.estimator.update(frame_count, observation)
+        drill.observations.push(frame_count, observation)
+        get_trigger(drill, recorded.drill_type, frame_count)
+    return drill.prev_count, elapsed / max(len(recorded), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sessions", nargs="+", help="recorded sessions, or directories of them")
+    parser.add_argument("--profiles", nargs="+", default=sorted(PROFILES), choices=sorted(PROFILES))
+    parser.add_argument("--max-count-error", type=float, default=0,
+                        help="largest count error allowed in any session of a drill")
+    args = parser.parse_args()
+
+    sessions = load_sessions(args.sessions)
+    if not sessions:
+        raise SystemExit("No recorded sessions found")
+    names = [DEFAULT_PROFILE.name] + [name for name in args.profiles if name != DEFAULT_PROFILE.name]
+
+    backend = load_models()
+    # drill -> profile -> (worst count error, seconds per frame of each session)
+    results = defaultdict(lambda: defaultdict(lambda: [0, []]))
+    print(f"{'session':<28}{'drill':<22}{'profile':<10}{'expected':>9}{'count':>7}{'ms/frame':>10}")
+    for recorded in sessions:
+        counts = {}
+        for name in names:
+            counts[name], seconds = run_session(backend, recorded, PROFILES[name])
+            expected = recorded.count if recorded.count is not None else counts[DEFAULT_PROFILE.name]
+            result = results[recorded.drill_type][name]
+            result[0] = max(result[0], abs(counts[name] - expected))
+            result[1].append(seconds)
+            print(f"{recorded.name:<28}{recorded.drill_type:<22}{name:<10}{expected:>9}{counts[name]:>7}"
+                  f"{1000 * seconds:>10.1f}")
+
+    suggested = {}
+    print(f"\n{'drill':<22}{'profile':<10}{'max error':>10}{'ms/frame':>10}")
+    for drill_type, by_profile in sorted(results.items()):
+        accurate = []
+        for name, (error, seconds) in by_profile.items():
+            mean_seconds = sum(seconds) / len(seconds)
+            print(f"{drill_type:<22}{name:<10}{error:>10}{1000 * mean_seconds:>10.1f}")
+            if error <= args.max_count_error:
+                accurate.append((mean_seconds, name))
+        if accurate:
+            suggested[drill_type] = min(accurate)[1]
+
+    print("\nCV_DRILL_PROFILES=" + ",".join(f"{drill}={name}" for drill, name in sorted(suggested.items())))
+    for drill_type in sorted(set(results) - set(suggested)):
+        print(f"No profile counts {drill_type} within {args.max_count_error}")
+
+
+if __name__ == "__main__":
+    main()
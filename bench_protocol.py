@@ -0,0 +1,103 @@
+"""
+Benchmark of the JSON/base64 and binary frame ingestion paths.
+
+Reports bytes on the wire per frame and server CPU time per frame for
+everything the server does before inference: parsing the message, getting
+at the JPEG bytes and decoding them.
+
+    python bench_protocol.py --width 1280 --height 720 --iterations 200
+"""
+
+import argparse
+import base64
+import json
+import time
+
+import cv2
+import numpy as np
+from pydantic import BaseModel
+
+from protocol import build_frame_message, parse_frame_message
+
+
+class FrameData(BaseModel):
+    # Mirrors main.FrameData without importing the models.
+    frame: str
+    frame_count: int
+    drill_type: str
+    device: str = "cpu"
+    width: int
+    height: int
+
+
+def make_jpeg(width, height, quality):
+    """Encode a synthetic frame with enough texture to compress like a real one."""
+    rng = np.random.default_rng(0)
+    gradient = np.linspace(0, 255, width, dtype=np.uint8)
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    frame[:] = gradient[None, :, None]
+    noise = rng.integers(0, 40, size=(height, width, 3), dtype=np.uint8)
+    frame = cv2.add(frame, noise)
+    cv2.circle(frame, (width // 2, height // 2), min(width, height) // 8, (255, 255, 255), -1)
+    ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("Failed to encode benchmark frame")
+    return encoded.tobytes()
+
+
+def json_path(message):
+    frame_data = FrameData(**json.loads(message))
+    frame_bytes = base64.b64decode(frame_data.frame)
+    return cv2.imdecode(np.frombuffer(frame_bytes, np.uint8), cv2.IMREAD_COLOR)
+
+
+def binary_path(message):
+    header, payload = parse_frame_message(message)
+    return cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_COLOR)
+
+
+def measure(path, message, iterations):
+    path(message)  # warm up
+    start = time.process_time()
+    for _ in range(iterations):
+        path(message)
+    return (time.process_time() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--quality", type=int, default=80)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    jpeg = make_jpeg(args.width, args.height, args.quality)
+
+    json_message = json.dumps({
+        "frame": base64.b64encode(jpeg).decode("ascii"),
+        "frame_count": 1,
+        "drill_type": "toe_taps",
+        "device": "cpu",
+        "width": args.width,
+        "height": args.height,
+    })
+    binary_message = build_frame_message(jpeg, 1, "toe_taps", args.width, args.height)
+
+    rows = [
+        ("json", len(json_message.encode("utf-8")), measure(json_path, json_message, args.iterations)),
+        ("binary", len(binary_message), measure(binary_path, binary_message, args.iterations)),
+    ]
+
+    print(f"{args.width}x{args.height} JPEG q{args.quality}: {len(jpeg)} bytes, {args.iterations} iterations")
+    print(f"{'path':<8}{'bytes/frame':>14}{'cpu ms/frame':>16}")
+    for name, size, cpu in rows:
+        print(f"{name:<8}{size:>14}{cpu * 1000:>16.3f}")
+
+    (_, json_size, json_cpu), (_, binary_size, binary_cpu) = rows
+    print(f"binary saves {100 * (1 - binary_size / json_size):.1f}% bytes "
+          f"and {100 * (1 - binary_cpu / json_cpu):.1f}% server CPU per frame")
+
+
+if __name__ == "__main__":
+    main()
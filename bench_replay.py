@@ -0,0 +1,197 @@
+"""
+Speed of the offline replay against the streaming path.
+
+Every drill is counted on synthetic sessions twice: one frame at a time
+through DrillSession and trigger.get_trigger as the server does it, and over
+the whole trajectory with replay.replay, with and without state estimation.
+Two kinds of session are used. "drill" sessions perform the drill, a ball
+rolled between tapping feet for the side view drills and the keyframes of
+MOVES for the front view ones. "noise" sessions are uniformly random boxes
+and ankles that fire every transition. Both drop detections and frames.
+A replay is timed as the median of REPLAY_RUNS, as tune.py replays the same
+sessions over and over. test_replay.py checks that both count the same.
+
+    python bench_replay.py --frames 3000 --sessions 5
+"""
+
+import argparse
+import logging
+import time
+
+import numpy as np
+
+from counts import DRILLS
+from estimator import StateEstimator
+from observations import FrameObservation, R_ANKLE, L_ANKLE
+from replay import Trajectory, estimate, replay
+from session import DrillSession
+from trigger import get_trigger
+
+REPLAY_RUNS = 5
+
+# One rep of each front view drill as keyframes of the ball and ankles over
+# the cycle, [0, 1] -> value, interpolated linearly. Unlisted values stay at
+# DEFAULT_POSE. x grows to the right of the image and y downwards, an ankle
+# at y < 0.7 is raised above a ball of the default size.
+DEFAULT_POSE = {"ball_x": 0.5, "ball_y": 0.75, "ball_w": 0.06, "ball_h": 0.1,
+                "right_x": 0.4, "right_y": 0.8, "left_x": 0.6, "left_y": 0.8}
+MOVES = {
+    # The ball grows as it is pushed towards the camera with the foot down, and
+    # shrinks as the raised foot pulls it back
+    "push_pull_left": {
+        "ball_w": ((0, 0.5, 1), (0.06, 0.14, 0.06)),
+        "ball_h": ((0, 0.5, 1), (0.1, 0.22, 0.1)),
+        "left_y": ((0, 0.5, 1), (0.8, 0.5, 0.8)),
+    },
+    "push_pull_right": {
+        "ball_w": ((0, 0.5, 1), (0.06, 0.14, 0.06)),
+        "ball_h": ((0, 0.5, 1), (0.1, 0.22, 0.1)),
+        "right_y": ((0, 0.5, 1), (0.8, 0.5, 0.8)),
+    },
+    # The ball goes from foot to foot, each raises just after the ball turns
+    # to pull it back and lowers to push it across
+    "v_push_pull": {
+        "ball_x": ((0, 0.5, 1), (0.42, 0.58, 0.42)),
+        "right_y": ((0, 0.05, 0.12, 0.2, 1), (0.8, 0.62, 0.62, 0.8, 0.8)),
+        "left_y": ((0, 0.48, 0.55, 0.62, 0.7, 1), (0.8, 0.8, 0.62, 0.62, 0.8, 0.8)),
+    },
+    # The right sole rolls the ball left and the feet step after it, then the
+    # left sole rolls it back
+    "roll_across": {
+        "ball_x": ((0, 0.05, 0.3, 0.4, 0.45, 0.7, 0.8, 1), (0.57, 0.57, 0.4, 0.38, 0.38, 0.55, 0.57, 0.57)),
+        "right_x": ((0, 0.05, 0.3, 0.4, 0.45, 0.7, 0.8, 1), (0.53, 0.57, 0.4, 0.37, 0.36, 0.36, 0.54, 0.53)),
+        "right_y": ((0, 0.05, 0.3, 0.4, 1), (0.8, 0.62, 0.62, 0.8, 0.8)),
+        "left_x": ((0, 0.05, 0.3, 0.4, 0.45, 0.7, 0.8, 1), (0.6, 0.61, 0.61, 0.41, 0.38, 0.55, 0.58, 0.6)),
+        "left_y": ((0, 0.4, 0.45, 0.7, 0.8, 1), (0.8, 0.8, 0.62, 0.62, 0.8, 0.8)),
+    },
+    # The inside of the foot pushes the ball out, the foot goes round it while
+    # it still drifts out, inside_outside_left only counts then, and the
+    # outside of the foot pushes it back
+    "inside_outside_left": {
+        "ball_x": ((0, 0.25, 0.4, 0.75, 1), (0.55, 0.63, 0.64, 0.55, 0.55)),
+        "left_x": ((0, 0.25, 0.4, 0.75, 1), (0.52, 0.58, 0.68, 0.6, 0.52)),
+        "left_y": ((0, 0.3, 0.4, 0.5, 1), (0.8, 0.78, 0.78, 0.8, 0.8)),
+    },
+    "inside_outside_right": {
+        "ball_x": ((0, 0.25, 0.4, 0.7, 1), (0.45, 0.37, 0.365, 0.45, 0.45)),
+        "right_x": ((0, 0.25, 0.4, 0.7, 1), (0.48, 0.42, 0.33, 0.4, 0.48)),
+        "right_y": ((0, 0.3, 0.4, 0.5, 1), (0.8, 0.78, 0.78, 0.8, 0.8)),
+    },
+}
+
+
+def _with_dropouts(rng, t, ball, right, left, noise, size_noise):
+    for values in (ball, right, left):
+        values[:, :2] += rng.normal(0, noise, (len(t), 2))
+    ball[:, 2:] += rng.normal(0, size_noise, (len(t), 2))
+    for values in (ball, right, left):
+        values[rng.random(len(t)) < 0.05] = np.nan
+    return t, ball, right, left
+
+
+def rolled_session(rng, frames, fps=30):
+    """A ball rolled left and right between two feet that tap it, with detector noise and dropouts."""
+    t = np.cumsum(rng.choice([1, 1, 1, 1, 1, 1, 1, 1, 1, 2], frames)) - 1
+    phase = 2 * np.pi * t / fps * rng.uniform(0.5, 1.5)
+    ball = np.stack([0.5 + 0.15 * np.sin(phase), 0.75 + 0.02 * np.cos(2 * phase),
+                     0.06 + 0.01 * np.sin(phase / 3), 0.1 + 0.015 * np.sin(phase / 3)], axis=1)
+    lift = 0.08 * np.clip(np.sin(2 * phase), 0, None)
+    right = np.stack([ball[:, 0] - 0.06 + 0.03 * np.cos(phase), 0.8 - lift], axis=1)
+    left = np.stack([ball[:, 0] + 0.06 + 0.03 * np.cos(phase), 0.8 - 0.08 * np.clip(-np.sin(2 * phase), 0, None)],
+                    axis=1)
+    return _with_dropouts(rng, t, ball, right, left, 0.004, 0.004)
+
+
+def choreographed_session(rng, frames, moves, cycle_frames=(45, 75)):
+    """Reps of the keyframes of a drill at a random tempo, with detector noise and dropouts."""
+    t = np.cumsum(rng.choice([1, 1, 1, 1, 1, 1, 1, 1, 1, 2], frames)) - 1
+    cycle = (t / rng.uniform(*cycle_frames)) % 1
+    pose = {name: np.interp(cycle, *moves[name]) if name in moves else np.full(frames, value)
+            for name, value in DEFAULT_POSE.items()}
+    ball = np.stack([pose["ball_x"], pose["ball_y"], pose["ball_w"], pose["ball_h"]], axis=1)
+    right = np.stack([pose["right_x"], pose["right_y"]], axis=1)
+    left = np.stack([pose["left_x"], pose["left_y"]], axis=1)
+    return _with_dropouts(rng, t, ball, right, left, 0.002, 0.0005)
+
+
+def drill_session(rng, frames, drill_type):
+    """A session of a drill being performed, every drill counts reps on it."""
+    if drill_type in MOVES:
+        return choreographed_session(rng, frames, MOVES[drill_type])
+    return rolled_session(rng, frames)
+
+
+def noise_session(rng, frames, drill_type=None):
+    """Uniformly random boxes and ankles, with dropouts and dropped frames."""
+    t = np.cumsum(rng.choice([1] * 19 + [3], frames)) - 1
+    ball = np.column_stack([rng.random((frames, 2)), rng.uniform(0.05, 0.2, (frames, 2))])
+    right, left = rng.random((frames, 2)), rng.random((frames, 2))
+    for values in (ball, right, left):
+        values[rng.random(frames) < 0.1] = np.nan
+    return t, ball, right, left
+
+
+def stream(drill_type, trajectory, estimated):
+    """Counts after each frame and the seconds taken, one get_trigger call per frame."""
+    session = DrillSession(drill_type)
+    session.estimator = StateEstimator() if estimated else None
+    counts = np.zeros(len(trajectory))
+    elapsed = 0.0
+    for i, frame_count in enumerate(trajectory.frame_counts.tolist()):
+        observation = FrameObservation(trajectory.ball[i].copy())
+        observation.keypoints[R_ANKLE] = trajectory.right_ankle[i]
+        observation.keypoints[L_ANKLE] = trajectory.left_ankle[i]
+        if session.estimator is not None:
+            session.estimator.update(frame_count, observation)
+        started = time.perf_counter()
+        session.observations.push(frame_count, observation)
+        counts[i], _ = get_trigger(session, drill_type, frame_count)
+        elapsed += time.perf_counter() - started
+    return counts, elapsed
+
+
+def replay_seconds(drill, trajectory):
+    """The median seconds of REPLAY_RUNS replays."""
+    seconds = []
+    for _ in range(REPLAY_RUNS):
+        started = time.perf_counter()
+        replay(drill, trajectory)
+        seconds.append(time.perf_counter() - started)
+    return float(np.median(seconds))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=3000)
+    parser.add_argument("--sessions", type=int, default=5, help="sessions of each kind per drill")
+    parser.add_argument("--drills", nargs="+", default=sorted(DRILLS), choices=sorted(DRILLS))
+    args = parser.parse_args()
+    # Time the triggers, not the log records of every count
+    logging.getLogger("trigger").setLevel(logging.WARNING)
+
+    rng = np.random.default_rng(0)
+    print(f"{'drill':<22}{'session':<8}{'estimation':<12}{'count':>8}{'stream ms':>11}{'replay ms':>11}{'speedup':>9}")
+    for drill_type in args.drills:
+        drill = DRILLS[drill_type]
+        sessions = [(kind, Trajectory(*make(rng, args.frames, drill_type)))
+                    for kind, make in (("drill", drill_session), ("noise", noise_session))
+                    for _ in range(args.sessions)]
+        estimated = {id(trajectory): estimate(trajectory) for _, trajectory in sessions}
+        for estimation in (False, True):
+            totals = {}
+            for kind, trajectory in sessions:
+                replayed = estimated[id(trajectory)] if estimation else trajectory
+                streamed, stream_seconds = stream(drill_type, trajectory, estimation)
+                total = totals.setdefault(kind, [0.0, 0.0, 0.0])
+                total[0] += stream_seconds
+                total[1] += replay_seconds(drill, replayed)
+                total[2] += streamed[-1]
+
+            for kind, (stream_seconds, seconds, count) in totals.items():
+                print(f"{drill_type:<22}{kind:<8}{'on' if estimation else 'off':<12}{count / args.sessions:>8.1f}"
+                      f"{1000 * stream_seconds / args.sessions:>11.2f}{1000 * seconds / args.sessions:>11.2f}"
+                      f"{stream_seconds / seconds:>8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
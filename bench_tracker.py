@@ -0,0 +1,101 @@
+"""
+Benchmark of keyframe detection with ball tracking in between.
+
+Reports the share of frames the detector still runs on and how far the
+tracked ball is from the detected one. By default a synthetic toe taps like
+clip is used, with the true ball position standing in for the detector. With
+--video the detector runs on every frame of a recorded clip as the reference.
+
+    python bench_tracker.py --frames 600
+    python bench_tracker.py --video drill.mp4
+"""
+
+import argparse
+import math
+import time
+
+import cv2
+import numpy as np
+
+from preprocess import decode_to_target
+from settings import KEYFRAME_INTERVAL, TRACKER_MIN_CONFIDENCE, TRACKER_SEARCH_SCALE
+from tracker import BallTracker
+
+
+def synthetic_clip(frames, width=960, height=540, fps=30):
+    """Textured ball rolled left and right in front of a noisy background, with its true box."""
+    rng = np.random.default_rng(0)
+    background = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (0, 0), 3)
+    radius = 24
+    for i in range(frames):
+        t = i / fps
+        # Taps every half second, plus a slow drift across the frame
+        cx = width / 2 + 120 * math.sin(2 * math.pi * t) + 60 * math.sin(2 * math.pi * t / 7)
+        cy = height * 0.75 + 10 * abs(math.sin(4 * math.pi * t))
+        frame = background.copy()
+        cv2.circle(frame, (int(cx), int(cy)), radius, (235, 235, 235), -1)
+        cv2.circle(frame, (int(cx) - 8, int(cy) - 6), radius // 3, (30, 30, 30), -1)
+        cv2.circle(frame, (int(cx) + 10, int(cy) + 8), radius // 4, (30, 30, 30), -1)
+        box = [cx / width, cy / height, 2 * radius / width, 2 * radius / height]
+        yield frame, lambda box=box: box
+
+
+def video_clip(path, frames):
+    """Frames of a recorded clip, decoded as the server decodes them, with the detector as reference."""
+    from model_config import get_coordinates_from_frame
+
+    capture = cv2.VideoCapture(path)
+    count = 0
+    while count < frames:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        ok, encoded = cv2.imencode(".jpg", frame)
+        frame, _ = decode_to_target(encoded.tobytes())
+        yield frame, lambda frame=frame: get_coordinates_from_frame(frame)['ball']
+        count += 1
+    capture.release()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", help="recorded drill clip, a synthetic one is used otherwise")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--interval", type=int, default=KEYFRAME_INTERVAL)
+    parser.add_argument("--min-confidence", type=float, default=TRACKER_MIN_CONFIDENCE)
+    parser.add_argument("--search-scale", type=float, default=TRACKER_SEARCH_SCALE)
+    args = parser.parse_args()
+
+    clip = video_clip(args.video, args.frames) if args.video else synthetic_clip(args.frames)
+    tracker = BallTracker(args.interval, args.min_confidence, args.search_scale)
+
+    frames = detections = 0
+    errors = []
+    tracking_time = 0.0
+    for frame_count, (frame, detect) in enumerate(clip):
+        frames += 1
+        started = time.perf_counter()
+        tracked = tracker.track(frame, frame_count)
+        tracking_time += time.perf_counter() - started
+
+        if tracked is None:
+            detections += 1
+            tracker.update(frame, detect(), frame_count)
+            continue
+
+        reference = detect()
+        if reference[0] is not None:
+            height, width = frame.shape[:2]
+            errors.append(math.hypot((tracked[0] - reference[0]) * width, (tracked[1] - reference[1]) * height))
+
+    print(f"{frames} frames, keyframe every {args.interval}, min confidence {args.min_confidence}")
+    print(f"detector ran on {detections} frames ({100 * detections / frames:.1f}%), "
+          f"{frames / max(detections, 1):.2f}x fewer detections")
+    if errors:
+        print(f"tracked centre error px: mean {np.mean(errors):.2f}, p95 {np.percentile(errors, 95):.2f}, "
+              f"max {np.max(errors):.2f}")
+    print(f"tracker cpu {1000 * tracking_time / frames:.3f} ms/frame")
+
+
+if __name__ == "__main__":
+    main()
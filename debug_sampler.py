@@ -0,0 +1,123 @@
+"""
+Rate-limited sampling of decoded frames to disk for debugging.
+
+Sampling is decided on the request path, JPEG encoding and writing happen on
+one background thread. Its queue is bounded and samples are dropped when it
+is full, so a slow disk never slows down frame processing.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+from settings import (
+    DEBUG_SAMPLE_EVERY_N, DEBUG_SAMPLE_EVERY_SECONDS, DEBUG_FRAME_DIR,
+    DEBUG_QUEUE_DEPTH, DEBUG_MAX_BYTES_PER_SESSION,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class DebugFrameWriter:
+    """Background thread encoding and writing sampled frames."""
+
+    def __init__(self, max_queue=DEBUG_QUEUE_DEPTH):
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def submit(self, sampler, frame_count, frame, rgb):
+        """Queue a frame for writing, returns False if it was dropped."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="debug-frames", daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait((sampler, frame_count, frame, rgb))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _run(self):
+        while True:
+            sampler, frame_count, frame, rgb = self._queue.get()
+            try:
+                sampler.write(frame_count, frame, rgb)
+            except Exception as e:
+                logger.error("Error writing debug frame: %s", e)
+
+
+writer = DebugFrameWriter()
+
+
+class DebugFrameSampler:
+    """Decides which frames of one session are kept and where they are written."""
+
+    __slots__ = ("directory", "every_n", "every_seconds", "max_bytes", "frames_seen",
+                 "last_sampled_at", "bytes_written", "written", "dropped")
+
+    def __init__(self, session_id, every_n=DEBUG_SAMPLE_EVERY_N, every_seconds=DEBUG_SAMPLE_EVERY_SECONDS,
+                 output_dir=DEBUG_FRAME_DIR, max_bytes=DEBUG_MAX_BYTES_PER_SESSION):
+        self.directory = os.path.join(output_dir, session_id)
+        self.every_n = every_n
+        self.every_seconds = every_seconds
+        self.max_bytes = max_bytes
+        self.frames_seen = 0
+        self.last_sampled_at = None
+        self.bytes_written = 0
+        self.written = 0
+        self.dropped = 0
+
+    @classmethod
+    def from_settings(cls, session_id):
+        """A sampler configured from settings, or None when sampling is off."""
+        if DEBUG_SAMPLE_EVERY_N <= 0 and DEBUG_SAMPLE_EVERY_SECONDS <= 0:
+            return None
+        return cls(session_id)
+
+    def offer(self, frame_count, frame, rgb=False):
+        """
+        Called for every decoded frame, keeps it if it is due.
+        Args:
+            frame_count (int): Client frame number, used as the file name.
+            frame (np.array): Decoded frame, must not be modified afterwards.
+            rgb (bool): Whether the frame is RGB rather than BGR.
+        """
+        self.frames_seen += 1
+        if self.bytes_written >= self.max_bytes:
+            return
+
+        due = self.every_n > 0 and self.frames_seen % self.every_n == 0
+        if self.every_seconds > 0:
+            now = time.monotonic()
+            if self.last_sampled_at is None or now - self.last_sampled_at >= self.every_seconds:
+                due = True
+        if not due:
+            return
+
+        self.last_sampled_at = time.monotonic()
+        if not writer.submit(self, frame_count, frame, rgb):
+            self.dropped += 1
+
+    def write(self, frame_count, frame, rgb):
+        """Encode and write a frame, runs on the writer thread."""
+        if rgb:
+            frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+        ok, encoded = cv2.imencode(".jpg", frame)
+        if not ok:
+            raise ValueError(f"Failed to encode frame {frame_count}")
+        if self.bytes_written + encoded.nbytes > self.max_bytes:
+            self.bytes_written = self.max_bytes
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, f"{frame_count:08d}.jpg"), "wb") as file:
+            file.write(encoded.tobytes())
+        self.bytes_written += encoded.nbytes
+        self.written += 1
@@ -30,14 +30,11 @@ def display_frames(trigger_queue, stop_flag_trigger, stop_flag_display, drill_ty
             frame = trigger_data[1]
             current_count = trigger_data[2]
             current_trigger = trigger_data[3]
-            merged_data = trigger_data[4]
-
-            detection_data = merged_data['detection']
-            pose_data = merged_data['pose']
+            observation = trigger_data[4]  # FrameObservation
 
             # Overlay bounding box if detection data is available
-            if detection_data and detection_data['ball'][0] is not None:
-                ball_x, ball_y, ball_w, ball_h = detection_data["ball"]
+            if observation.has_ball:
+                ball_x, ball_y, ball_w, ball_h = observation.ball_box
                 start_point = (int((ball_x - ball_w / 2) * frame.shape[1]), int((ball_y - ball_h / 2) * frame.shape[0]))
                 end_point = (int((ball_x + ball_w / 2) * frame.shape[1]), int((ball_y + ball_h / 2) * frame.shape[0]))
                 cv2.rectangle(frame, start_point, end_point, (0, 255, 0), 2)
@@ -48,21 +45,18 @@ def display_frames(trigger_queue, stop_flag_trigger, stop_flag_display, drill_ty
                 cv2.circle(frame, center_point, radius, (255, 0, 0), 2)
 
             # Overlay keypoints if pose data is available
-            if pose_data:
-                if 'r_ankle' in pose_data and pose_data['r_ankle'] is not None:
-                    right_ankle_x, right_ankle_y = pose_data['r_ankle']
-                    if right_ankle_x is not None and right_ankle_y is not None:
-                        center = (int(right_ankle_x * frame.shape[1]), int(right_ankle_y * frame.shape[0]))
-                        cv2.circle(frame, center, 5, (0, 0, 255), -1) # red
-                        label = "R"
-                        cv2.putText(frame, label, (center[0] + 10, center[1]), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
-                if 'l_ankle' in pose_data and pose_data['l_ankle'] is not None:
-                    left_ankle_x, left_ankle_y = pose_data['l_ankle']
-                    if left_ankle_x is not None and left_ankle_y is not None:
-                        center = (int(left_ankle_x * frame.shape[1]), int(left_ankle_y * frame.shape[0]))
-                        cv2.circle(frame, center, 5, (0, 0, 255), -1)
-                        label = "L"
-                        cv2.putText(frame, label, (center[0] + 10, center[1]), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+            right_ankle_x, right_ankle_y = observation.r_ankle
+            if right_ankle_x is not None and right_ankle_y is not None:
+                center = (int(right_ankle_x * frame.shape[1]), int(right_ankle_y * frame.shape[0]))
+                cv2.circle(frame, center, 5, (0, 0, 255), -1) # red
+                label = "R"
+                cv2.putText(frame, label, (center[0] + 10, center[1]), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+            left_ankle_x, left_ankle_y = observation.l_ankle
+            if left_ankle_x is not None and left_ankle_y is not None:
+                center = (int(left_ankle_x * frame.shape[1]), int(left_ankle_y * frame.shape[0]))
+                cv2.circle(frame, center, 5, (0, 0, 255), -1)
+                label = "L"
+                cv2.putText(frame, label, (center[0] + 10, center[1]), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
 
 
             # Overlay text
@@ -0,0 +1,277 @@
+"""
+Engine of the drill state machines declared in counts.py.
+
+A drill is a small state machine whose state is the last action it counted,
+session.prev_trigger_action. On each frame
+
+1. The features every transition reads are computed once: the ball box, the
+   ankles, their distances to the ball, the direction of the ball and the
+   active ankle with its own position and distances. Frames without the
+   ball or an ankle the drill needs count as nothing.
+2. The transitions of the active ankle are tried in order and the first
+   that holds fires. A transition holds when its condition on the frame,
+   `when`, holds as well as the conditions it declares on the state of the
+   drill: a change of ball direction, the debounce, the state it leaves and
+   the position of the last count.
+3. A fired transition counts, adding its increment to its tally and moving
+   the drill to its action, unless the drill is `distinct` and it is already
+   there. The debounce restarts from the frame it counted on.
+4. The count is derived from the tallies by the drill.
+
+Adding a drill is declaring one more Drill in counts.DRILLS.
+"""
+
+import math
+
+from observations import R_ANKLE, L_ANKLE
+
+LEFT = "left"
+RIGHT = "right"
+
+# Filtered ball speed below which the ball counts as still, normalised units per frame
+MIN_BALL_SPEED = 0.002
+
+
+def ball_direction(session, ball_x):
+    """
+    Direction of the ball along x, 1 to the right and -1 to the left. With
+    state estimation it is the sign of the filtered velocity and a still ball
+    keeps the direction of the last trigger, otherwise it is the sign of the
+    raw change since the previous frame.
+    """
+    if session.estimator is not None:
+        return session.estimator.ball_direction(MIN_BALL_SPEED) or session.prev_direction
+    return 1 if ball_x > session.prev_ball_x else -1
+
+
+def ball_area_direction(session, ball_area):
+    """
+    Direction of change of the ball box area, 1 growing and -1 shrinking, like
+    ball_direction.
+    """
+    if session.estimator is not None:
+        return session.estimator.ball_area_direction(MIN_BALL_SPEED) or session.prev_direction
+    return 1 if ball_area > session.prev_ball_area else -1
+
+
+DIRECTIONS = {
+    "x": ball_direction,
+    "area": ball_area_direction,
+}
+
+
+class FrameFeatures:
+    """
+    Everything the transitions of a drill read about one frame, in normalised
+    image coordinates. The ankle_*, distance, dx and other_y features are
+    those of the active ankle. replay.py fills the same slots with arrays
+    over all the frames of a trajectory.
+    """
+
+    __slots__ = ("frame_count", "ball_x", "ball_y", "ball_w", "ball_h", "ball_area", "ball_dx",
+                 "right_x", "right_y", "left_x", "left_y", "right_distance", "left_distance",
+                 "right_dx", "left_dx", "inter_ankle", "direction", "changed", "debounced",
+                 "active", "ankle_x", "ankle_y", "prev_ankle_y", "distance", "dx", "other_y")
+
+
+class Transition:
+    """
+    A transition of a drill into `action`, on frames where `when` holds as
+    well as the conditions on the state of the drill it is declared with.
+    Args:
+        action (str): State the drill moves to when it counts.
+        side (str): LEFT or RIGHT, the active ankle it applies to, None for either.
+        when (callable): when(features) -> bool, the condition on the frame alone. Written with
+                         & and | so that replay.py can evaluate it on arrays of features.
+        increment (float): Added to the tally when it counts.
+        tally (str): Session attribute counting it.
+        changed (bool): Only if the ball direction changed since the last count.
+        debounced (bool): Only once the frame threshold of the drill has passed since the last count.
+        source (str): Only from this state, from any if None.
+        repeat (bool): Whether it fires from its own state.
+        from_mark (callable): from_mark(features, mark) -> bool, the condition on
+                              session.prev_trigger_x, if any.
+        mark (str): Feature kept as session.prev_trigger_x when it counts, if any.
+    """
+
+    __slots__ = ("action", "side", "when", "increment", "tally", "changed", "debounced", "source", "repeat",
+                 "from_mark", "mark")
+
+    def __init__(self, action, side, when, increment=1, tally="prev_trigger_count", changed=False,
+                 debounced=False, source=None, repeat=True, from_mark=None, mark=None):
+        self.action = action
+        self.side = side
+        self.when = when
+        self.increment = increment
+        self.tally = tally
+        self.changed = changed
+        self.debounced = debounced
+        self.source = source
+        self.repeat = repeat
+        self.from_mark = from_mark
+        self.mark = mark
+
+    def holds(self, f, session):
+        """Whether it fires on a frame."""
+        state = session.prev_trigger_action
+        return ((not self.changed or f.changed) and (not self.debounced or f.debounced)
+                and (self.source is None or state == self.source) and (self.repeat or state != self.action)
+                and (self.from_mark is None or self.from_mark(f, session.prev_trigger_x)) and bool(self.when(f)))
+
+
+class Drill:
+    """
+    The state machine of one drill.
+    Args:
+        name (str): Drill type sent by the client.
+        ankles (tuple): Ankles that must be found for a frame to count, LEFT and/or RIGHT.
+        active: The ankle playing the ball, LEFT, RIGHT or a callable active(features) true
+                where it is the left one, written like Transition.when.
+        transitions (tuple): Transitions, tried in order.
+        count (callable): count(session) -> the count reported to the client.
+        direction (str): Ball direction of the features, a key of DIRECTIONS, or None.
+        frame_threshold (int): Frames after a count before features.debounced holds again.
+        debounce_start (bool): Whether the first frame_threshold frames of a session are debounced too.
+        distinct (bool): Whether a transition into the current state fires without counting.
+        pending (bool): Whether a side whose transition held stays pending until it counts. Pending
+                        sides count, in the order of the transitions, on any frame whose active
+                        ankle is not the last one counted, and each transition's action must be its side.
+        follow_direction (bool): Whether a count moves session.prev_direction to the ball direction.
+        trigger_on_count (bool): Whether frames that count report a trigger, frames that
+                                 fire without counting always do.
+    """
+
+    __slots__ = ("name", "ankles", "active", "transitions", "count", "direction", "frame_threshold",
+                 "debounce_start", "distinct", "pending", "follow_direction", "trigger_on_count")
+
+    def __init__(self, name, ankles, active, transitions, count, direction=None, frame_threshold=None,
+                 debounce_start=True, distinct=False, pending=False, follow_direction=True,
+                 trigger_on_count=False):
+        if direction is not None and direction not in DIRECTIONS:
+            raise ValueError(f"Unknown ball direction {direction!r}, expected one of {sorted(DIRECTIONS)}")
+        self.name = name
+        self.ankles = ankles
+        self.active = active
+        self.transitions = transitions
+        self.count = count
+        self.direction = direction
+        self.frame_threshold = frame_threshold
+        self.debounce_start = debounce_start
+        self.distinct = distinct
+        self.pending = pending
+        self.follow_direction = follow_direction
+        self.trigger_on_count = trigger_on_count
+
+    def features(self, session, observation, frame_count):
+        """
+        Features of a frame, and the previous frame values of the session initialised on its first frame.
+        Returns:
+            FrameFeatures: The features, None if the ball or a needed ankle is missing.
+        """
+        ball_x, ball_y, ball_w, ball_h = observation.ball.tolist()
+        # NaN is the only value not equal to itself
+        if ball_x != ball_x or ball_y != ball_y or ball_w != ball_w or ball_h != ball_h:
+            return None
+        (right_x, right_y), (left_x, left_y) = observation.keypoints[[R_ANKLE, L_ANKLE]].tolist()
+        if LEFT in self.ankles and (left_x != left_x or left_y != left_y):
+            return None
+        if RIGHT in self.ankles and (right_x != right_x or right_y != right_y):
+            return None
+
+        ball_area = ball_w * ball_h
+        if session.prev_left_ankle_y is None:
+            session.prev_left_ankle_y = left_y
+        if session.prev_right_ankle_y is None:
+            session.prev_right_ankle_y = right_y
+        if session.prev_ball_x is None:
+            session.prev_ball_x = ball_x
+        if session.prev_ball_area is None:
+            session.prev_ball_area = ball_area
+
+        f = FrameFeatures()
+        f.frame_count = frame_count
+        f.ball_x, f.ball_y, f.ball_w, f.ball_h, f.ball_area = ball_x, ball_y, ball_w, ball_h, ball_area
+        f.ball_dx = abs(ball_x - session.prev_ball_x)
+        f.right_x, f.right_y, f.left_x, f.left_y = right_x, right_y, left_x, left_y
+        f.right_distance = math.sqrt((right_x - ball_x) ** 2 + (right_y - ball_y) ** 2)
+        f.left_distance = math.sqrt((left_x - ball_x) ** 2 + (left_y - ball_y) ** 2)
+        f.right_dx = abs(right_x - ball_x)
+        f.left_dx = abs(left_x - ball_x)
+        f.inter_ankle = abs(left_x - right_x)
+
+        if self.direction is None:
+            f.direction = None
+            f.changed = False
+        else:
+            f.direction = DIRECTIONS[self.direction](session, ball_area if self.direction == "area" else ball_x)
+            f.changed = f.direction != session.prev_direction
+        if self.frame_threshold is None:
+            f.debounced = True
+        else:
+            f.debounced = ((not self.debounce_start and session.prev_trigger_frame == 0)
+                           or frame_count - session.prev_trigger_frame >= self.frame_threshold)
+
+        left = self.active == LEFT if self.active in (LEFT, RIGHT) else self.active(f)
+        f.active = LEFT if left else RIGHT
+        if left:
+            f.ankle_x, f.ankle_y, f.prev_ankle_y = left_x, left_y, session.prev_left_ankle_y
+            f.distance, f.dx, f.other_y = f.left_distance, f.left_dx, right_y
+        else:
+            f.ankle_x, f.ankle_y, f.prev_ankle_y = right_x, right_y, session.prev_right_ankle_y
+            f.distance, f.dx, f.other_y = f.right_distance, f.right_dx, left_y
+        return f
+
+    def commit(self, session, f, transition):
+        """Count a fired transition."""
+        setattr(session, transition.tally, getattr(session, transition.tally) + transition.increment)
+        session.prev_trigger_action = transition.action
+        session.prev_trigger_frame = f.frame_count
+        if transition.mark is not None:
+            session.prev_trigger_x = getattr(f, transition.mark)
+        if self.direction is not None and self.follow_direction:
+            session.prev_direction = f.direction
+
+    def step(self, session, observation, frame_count):
+        """
+        Run the drill on one frame.
+        Args:
+            session (DrillSession): Trigger state of the connection.
+            observation (FrameObservation): Ball and keypoints of the frame.
+            frame_count (int): Client frame number.
+        Returns:
+            tuple: A tuple of (count, trigger), (0, False) when the frame has nothing to count.
+        """
+        f = self.features(session, observation, frame_count)
+        if f is None:
+            return 0, False
+
+        trigger = False
+        if self.pending:
+            for transition in self.transitions:
+                if transition.side == f.active:
+                    if transition.holds(f, session):
+                        session.pending_sides.add(f.active)
+                    else:
+                        session.pending_sides.discard(f.active)
+            for transition in self.transitions:
+                if transition.side in session.pending_sides:
+                    trigger = True
+                    if f.active != session.prev_trigger_action:
+                        self.commit(session, f, transition)
+                        session.pending_sides.discard(transition.side)
+        else:
+            for transition in self.transitions:
+                if (transition.side is None or transition.side == f.active) and transition.holds(f, session):
+                    if self.distinct and transition.action == session.prev_trigger_action:
+                        trigger = True
+                    else:
+                        self.commit(session, f, transition)
+                        trigger = self.trigger_on_count
+                    break
+
+        session.prev_ball_x = f.ball_x
+        session.prev_ball_area = f.ball_area
+        session.prev_left_ankle_y = f.left_y
+        session.prev_right_ankle_y = f.right_y
+        return self.count(session), trigger
+
@@ -0,0 +1,145 @@
+"""
+Filtered state of the ball and the ankles of a session.
+
+Each of them is followed by a constant-velocity Kalman filter in normalised
+coordinates. Detections are smoothed, a dropout of up to
+ESTIMATOR_MAX_PREDICTED_FRAMES frames is filled with the prediction, and the
+velocity is available directly, so the drills do not have to difference two
+noisy frames to know where the ball is going. Velocities are in normalised
+units per client frame, a dropped frame counts as time.
+"""
+
+import numpy as np
+
+from kalman import ConstantVelocityKalman
+from observations import R_ANKLE, L_ANKLE
+from settings import STATE_ESTIMATION, ESTIMATOR_MAX_PREDICTED_FRAMES
+
+# Standard deviations in normalised units, of a detection and of the change of
+# velocity from one frame to the next. The ball box size changes slowly.
+POSITION_NOISE = 0.005
+POSITION_ACCELERATION_NOISE = 0.01
+SIZE_NOISE = 0.005
+SIZE_ACCELERATION_NOISE = 0.002
+
+
+class TrackedPoint:
+    """One filtered 2D quantity and how long it has gone without a measurement."""
+
+    __slots__ = ("measurement_noise", "acceleration_noise", "kalman", "last_frame", "last_measured")
+
+    def __init__(self, measurement_noise=POSITION_NOISE, acceleration_noise=POSITION_ACCELERATION_NOISE):
+        self.measurement_noise = measurement_noise
+        self.acceleration_noise = acceleration_noise
+        self.reset()
+
+    def reset(self):
+        self.kalman = None
+        self.last_frame = None
+        self.last_measured = None
+
+    def step(self, frame_count, x, y, max_predicted=ESTIMATOR_MAX_PREDICTED_FRAMES):
+        """
+        Advance to a frame and correct with its measurement, if any.
+        Args:
+            frame_count (int): Client frame number.
+            x (float): Measured x, None if not detected.
+            y (float): Measured y, None if not detected.
+            max_predicted (int): Frames without a measurement after which the point is lost.
+        Returns:
+            tuple: The filtered (x, y), or None while the point is lost.
+        """
+        measured = x is not None and y is not None
+        if self.kalman is None:
+            if not measured:
+                return None
+            self.kalman = ConstantVelocityKalman(x, y, self.measurement_noise, self.acceleration_noise)
+        else:
+            dt = frame_count - self.last_frame
+            if dt > 0:
+                self.kalman.predict(dt)
+            if measured:
+                self.kalman.update(x, y)
+            elif frame_count - self.last_measured > max_predicted:
+                self.reset()
+                return None
+
+        self.last_frame = frame_count
+        if measured:
+            self.last_measured = frame_count
+        return self.kalman.position
+
+    @property
+    def velocity(self):
+        """Filtered (vx, vy), None while the point is lost."""
+        return None if self.kalman is None else self.kalman.velocity
+
+
+class StateEstimator:
+    """Filtered ball box and ankles of one session."""
+
+    __slots__ = ("ball", "ball_size", "r_ankle", "l_ankle")
+
+    def __init__(self):
+        self.ball = TrackedPoint()
+        self.ball_size = TrackedPoint(SIZE_NOISE, SIZE_ACCELERATION_NOISE)
+        self.r_ankle = TrackedPoint()
+        self.l_ankle = TrackedPoint()
+
+    @classmethod
+    def from_settings(cls):
+        """An estimator, or None when the drills use the raw detections."""
+        return cls() if STATE_ESTIMATION else None
+
+    def reset(self):
+        for point in (self.ball, self.ball_size, self.r_ankle, self.l_ankle):
+            point.reset()
+
+    def update(self, frame_count, observation):
+        """
+        Filter the observation of a frame, its ball and ankles are replaced by
+        their filtered values in place.
+        Args:
+            frame_count (int): Client frame number.
+            observation (FrameObservation): Ball and keypoints of the frame.
+        """
+        x, y, w, h = observation.ball_box
+        center = self.ball.step(frame_count, x, y)
+        size = self.ball_size.step(frame_count, w, h)
+        if center is None or size is None:
+            observation.ball[:] = np.nan
+        else:
+            observation.ball[:] = (center[0], center[1], size[0], size[1])
+
+        for index, ankle, point in ((R_ANKLE, observation.r_ankle, self.r_ankle),
+                                    (L_ANKLE, observation.l_ankle, self.l_ankle)):
+            filtered = point.step(frame_count, *ankle)
+            observation.keypoints[index] = np.nan if filtered is None else filtered
+
+    def ball_direction(self, min_speed):
+        """
+        Horizontal direction of the ball from its filtered velocity.
+        Args:
+            min_speed (float): Below this speed the ball is not going anywhere.
+        Returns:
+            int: 1 to the right, -1 to the left, 0 if it is still or lost.
+        """
+        velocity = self.ball.velocity
+        if velocity is None or abs(velocity[0]) < min_speed:
+            return 0
+        return 1 if velocity[0] > 0 else -1
+
+    def ball_area_direction(self, min_speed):
+        """
+        Direction of change of the ball box area, 1 growing as the ball comes
+        closer, -1 shrinking and 0 if it is steady or lost.
+        """
+        size, velocity = self.ball_size.kalman, self.ball_size.velocity
+        if velocity is None:
+            return 0
+        w, h = size.position
+        # d(w * h) / dt
+        rate = w * velocity[1] + h * velocity[0]
+        if abs(rate) < min_speed * (w + h):
+            return 0
+        return 1 if rate > 0 else -1
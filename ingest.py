@@ -0,0 +1,67 @@
+"""
+Per-session frame ingestion with latest-frame-wins backpressure.
+
+When inference is slower than the client frame rate, queued frames only add
+latency. LatestFrameQueue keeps at most `maxsize` unprocessed frames, a new
+frame replaces the oldest one, and frames that waited longer than
+`max_age_ms` are skipped when dequeued. Both kinds of drop are counted.
+"""
+
+import asyncio
+import time
+from collections import deque
+
+from settings import SESSION_QUEUE_DEPTH, MAX_FRAME_AGE_MS
+
+
+class LatestFrameQueue:
+    """A bounded queue of received messages where newer frames win."""
+
+    def __init__(self, maxsize=SESSION_QUEUE_DEPTH, max_age_ms=MAX_FRAME_AGE_MS):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.max_age = max_age_ms / 1000
+        self._frames = deque()
+        self._ready = asyncio.Event()
+        self._error = None
+
+        # Frames dropped because a newer one arrived, and because they went stale.
+        self.replaced = 0
+        self.stale = 0
+
+    @property
+    def dropped(self):
+        return self.replaced + self.stale
+
+    def put(self, message):
+        """Queue a received message, never waits."""
+        if len(self._frames) >= self.maxsize:
+            self._frames.popleft()
+            self.replaced += 1
+        self._frames.append((time.monotonic(), message))
+        self._ready.set()
+
+    def close(self, error):
+        """Make the next get() raise `error`, e.g. the disconnect of the client."""
+        self._error = error
+        self._ready.set()
+
+    async def get(self):
+        """Oldest frame that is still fresh enough to be worth processing."""
+        while True:
+            if self._error is not None:
+                raise self._error
+            if not self._frames:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+
+            received_at, message = self._frames.popleft()
+            if self.max_age and time.monotonic() - received_at > self.max_age:
+                self.stale += 1
+                continue
+            return message
+
+    def qsize(self):
+        return len(self._frames)
@@ -0,0 +1,53 @@
+"""
+Constant-velocity Kalman filter of a 2D position.
+"""
+
+import numpy as np
+
+
+class ConstantVelocityKalman:
+    """
+    Position and velocity of a point moving at constant velocity, time is in
+    frames. Noise is given as standard deviations in the units of the position:
+    of a measurement, and of the change of velocity from one frame to the next.
+    """
+
+    __slots__ = ("state", "covariance", "measurement_noise", "acceleration_noise")
+
+    def __init__(self, x, y, measurement_noise, acceleration_noise):
+        self.measurement_noise = measurement_noise
+        self.acceleration_noise = acceleration_noise
+        self.state = np.array([x, y, 0.0, 0.0])
+        self.covariance = np.diag([measurement_noise ** 2] * 2 + [(4 * acceleration_noise) ** 2] * 2)
+
+    def predict(self, dt=1):
+        """Advance by `dt` frames, returns the predicted position."""
+        transition = np.eye(4)
+        transition[0, 2] = transition[1, 3] = dt
+        q = self.acceleration_noise ** 2
+        noise = q * np.array([
+            [dt ** 4 / 4, 0, dt ** 3 / 2, 0],
+            [0, dt ** 4 / 4, 0, dt ** 3 / 2],
+            [dt ** 3 / 2, 0, dt ** 2, 0],
+            [0, dt ** 3 / 2, 0, dt ** 2],
+        ])
+        self.state = transition @ self.state
+        self.covariance = transition @ self.covariance @ transition.T + noise
+        return self.state[0], self.state[1]
+
+    def update(self, x, y):
+        """Correct with a measured position, returns the filtered position."""
+        innovation = np.array([x, y]) - self.state[:2]
+        innovation_covariance = self.covariance[:2, :2] + np.eye(2) * self.measurement_noise ** 2
+        gain = self.covariance[:, :2] @ np.linalg.inv(innovation_covariance)
+        self.state = self.state + gain @ innovation
+        self.covariance = self.covariance - gain @ self.covariance[:2, :]
+        return self.state[0], self.state[1]
+
+    @property
+    def position(self):
+        return self.state[0], self.state[1]
+
+    @property
+    def velocity(self):
+        return self.state[2], self.state[3]
@@ -1,11 +1,109 @@
-"This module is created to Records the logs"
-import os
+"""
+This module is created to Records the logs.
+
+Importing it configures the root logger once per process. Records are put on
+a queue by the calling thread and formatted and written by a listener thread,
+into a single size-rotated file under LOG_DIR and to stderr. Messages with
+arguments that may still change, like arrays, and tracebacks are rendered
+by the calling thread.
+"""
+import atexit
+import copy
 import logging
-from datetime import datetime
-
-LogFile = f'{datetime.now().strftime("%d_%m_%Y_%H_%M_%S")}.log'
-LogPath = os.path.join(os.getcwd(), 'logs', LogFile)
-os.makedirs(LogPath, exist_ok=True)
-log_path = os.path.join(LogPath,LogFile)
-logging.basicConfig(filename=log_path,
-format='[%(asctime)s]%(lineno)d%(levelname)s-%(message)s', level=logging.INFO)
+import logging.handlers
+import os
+import queue
+
+from settings import (
+    LOG_DIR, LOG_FILE, LOG_LEVEL, LOG_MAX_BYTES, LOG_BACKUP_COUNT,
+    FRAME_LOGGING, FRAME_LOG_EVERY_N,
+)
+
+LOG_FORMAT = '[%(asctime)s]%(name)s:%(lineno)d %(levelname)s-%(message)s'
+
+# Renders tracebacks on the logging thread
+_formatter = logging.Formatter(LOG_FORMAT)
+# Arguments that cannot change before the listener thread formats them
+IMMUTABLE_ARGS = (str, int, float, bool, bytes, type(None))
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue records unformatted, the listener thread does the formatting."""
+
+    def prepare(self, record):
+        # The stock handler formats every record here, on the logging thread.
+        # The queue never leaves the process, so only what may change or keep
+        # objects alive before the listener gets to it is rendered: messages
+        # with arrays, dicts or lists as arguments, and tracebacks.
+        args = record.args
+        eager = bool(args) and (isinstance(args, dict) or
+                                not all(isinstance(arg, IMMUTABLE_ARGS) for arg in args))
+        if not eager and record.exc_info is None:
+            return record
+        record = copy.copy(record)
+        if eager:
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener = None
+
+
+def setup_logging(log_file=LOG_FILE, force=False):
+    """
+    Route all logging through the queue to the rotating file and stderr.
+    Args:
+        log_file (str): File name inside LOG_DIR.
+        force (bool): Set up again, e.g. in a forked worker, which inherits
+                      the queue but not the listener thread of its parent.
+    """
+    global _listener
+    if _listener is not None and not force:
+        return
+
+    os.makedirs(LOG_DIR, exist_ok=True)
+    formatter = logging.Formatter(LOG_FORMAT)
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        os.path.join(LOG_DIR, log_file), maxBytes=LOG_MAX_BYTES,
+        backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+    file_handler.setFormatter(formatter)
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(LOG_LEVEL)
+
+
+if FRAME_LOGGING:
+    def log_frame(logger, frame_count, msg, *args, level=logging.INFO, force=False):
+        """
+        Log a per-frame message for one in every FRAME_LOG_EVERY_N frames.
+        Args:
+            logger (logging.Logger): Logger of the calling module.
+            frame_count (int): Frame the message is about.
+            msg (str): %-style message, only formatted if the record is kept.
+            level (int): Logging level.
+            force (bool): Log regardless of sampling, for triggers and errors.
+        """
+        if force or frame_count % FRAME_LOG_EVERY_N == 0:
+            logger.log(level, msg, *args)
+else:
+    def log_frame(logger, frame_count, msg, *args, level=logging.INFO, force=False):
+        """Per-frame logging is switched off."""
+
+
+setup_logging()
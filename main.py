@@ -1,22 +1,26 @@
-import torch
 import time
-import numpy as np
-import base64
-import cv2
-from PIL import Image
+# Start of the import phase, the models are loaded after it, see start_pipeline
+import_started = time.perf_counter()
 import asyncio
 from fastapi import FastAPI, WebSocket
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 import json
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from detection import process_detection
-from pose import process_pose
+from pipeline import FramePipeline, decode_base64, decode_frame
+import metrics
+import model_config
+import planner
+from ingest import LatestFrameQueue
 from trigger import get_trigger
+from session import DrillSession
+from roi import pose_roi
+from profiles import profile_for
+from settings import POSE_ROI
+from protocol import parse_frame_message
 from starlette.websockets import WebSocketDisconnect
-import logging
+from log import logging, log_frame
 
 app = FastAPI()
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class FrameData(BaseModel):
@@ -30,81 +34,97 @@ class FrameData(BaseModel):
 # Global counter
 frame_counter = 0
 
-detection_results_dict = {}
-pose_results_dict = {}
-trigger_results_dict = {}
+# Shared by every session so frames from all clients are inferred in batches
+pipeline = FramePipeline()
 
-async def process_frame(frame_data: FrameData):
+async def process_frame(frame_data: FrameData, session: DrillSession):
+    try:
+        # Decode base64 JPEG
+        frame_bytes = await pipeline.decode.run(decode_base64, frame_data.frame)
+    except Exception as e:
+        logger.error("Error decoding frame %s: %s", frame_data.frame_count, e)
+        return {
+            "message": f"Error processing frame: {str(e)}",
+            "count": frame_data.frame_count,
+        }
+
+    return await process_jpeg(
+        session,
+        frame_bytes,
+        frame_data.frame_count,
+        frame_data.drill_type,
+        frame_data.device,
+        frame_data.width,
+        frame_data.height
+    )
+
+async def process_binary_frame(message: bytes, session: DrillSession):
+    try:
+        header, payload = parse_frame_message(message)
+    except ValueError as e:
+        logger.error("Error parsing frame message: %s", e)
+        # The frame number is unknown, report the last frame of the session and its count so far
+        return {
+            "message": f"Error processing frame: {str(e)}",
+            "count": session.last_frame_count or 0,
+            "trigger_result": session.prev_count,
+            "trigger_bool": False,
+        }
+
+    return await process_jpeg(
+        session,
+        payload,
+        header.frame_count,
+        header.drill_type,
+        "cpu",
+        header.width,
+        header.height
+    )
+
+async def process_jpeg(session, frame_bytes, frame_count, drill_type, device, expected_width, expected_height):
     global frame_counter
-    frame = frame_data.frame
-    frame_count = frame_data.frame_count
-    drill_type = frame_data.drill_type
-    device = frame_data.device
-    expected_width = frame_data.width
-    expected_height = frame_data.height
-
- 
-    torch.device("cuda" if device == "cuda" else "cpu")
-    
+
     start_time = time.time()
+    profile = profile_for(drill_type)
     
     try:
-        # Decode base64 JPEG
-        frame_bytes = base64.b64decode(frame)
-        
-        # Convert bytes to numpy array
-        frame_np = cv2.imdecode(np.frombuffer(frame_bytes, np.uint8), cv2.IMREAD_COLOR)
-        
-        if frame_np is None:
-            raise ValueError("Failed to decode image")
-        
-        # Convert BGR to RGB
-        frame_np = cv2.cvtColor(frame_np, cv2.COLOR_BGR2RGB)
-
-        # frame_np = cv2.rotate(frame_np, cv2.ROTATE_90_COUNTERCLOCKWISE)
-
-
-        height, width, channels = frame_np.shape
-
-        logger.info(f"Image dimensions: {width}x{height}x{channels}")
-        logger.info(f"Expected dimensions: {expected_width}x{expected_height}")
-
-        if width != expected_width or height != expected_height:
-            logger.warning(f"Image dimensions do not match expected dimensions")
-            frame_np = cv2.resize(frame_np, (expected_width, expected_height))
-            logger.info(f"Resized image to {expected_width}x{expected_height}")
-
-        # For debugging: Save the image to disk to verify its correctness
-        img = Image.fromarray(frame_np, 'RGB') 
-        img.save(f'debug_image.jpg')
-        # logger.info(f'Saved image to debug_image_{frame_count}.jpg in RGB format')
-
-        data = (frame_count, frame_np)
-
-        with ThreadPoolExecutor(max_workers=2) as executor:
-            futures = {
-                executor.submit(process_detection, data): 'detection',
-                executor.submit(process_pose, data): 'pose'
-            }
-
-            for future in as_completed(futures):
-                task_type = futures[future]
-                if task_type == 'detection':
-                    detection_results_dict[frame_count] = future.result()
-                elif task_type == 'pose':
-                    pose_results_dict[frame_count] = future.result()
-
-            trigger_result = get_trigger(
-                drill_type, 
-                detection_results_dict, 
-                pose_results_dict, 
-                frame_count
-            )
+        frame_np = await pipeline.decode.run(decode_frame, frame_bytes, frame_count, expected_width, expected_height,
+                                             profile.decode_size)
+        if session.debug_sampler is not None:
+            session.debug_sampler.offer(frame_count, frame_np)
+
+        tracked = None
+        if session.ball_tracker is not None:
+            tracked = await pipeline.decode.run(session.ball_tracker.track, frame_np, frame_count)
+
+        roi = pose_roi(session.observations, frame_count) if POSE_ROI else None
+        observation = await pipeline.infer(frame_np, roi, detect=tracked is None, profile=profile)
+        if tracked is None:
+            if session.ball_tracker is not None:
+                session.ball_tracker.update(frame_np, observation.ball_box, frame_count)
+            metrics.BALL_DETECTED.inc()
+        else:
+            observation.ball[:] = tracked
+            observation.ball_confidence = session.ball_tracker.confidence
+            observation.source = 'tracked'
+            metrics.BALL_TRACKED.inc()
+        if not observation.has_ball:
+            metrics.BALL_NOT_DETECTED.inc()
+        if not observation.has_ankles:
+            metrics.ANKLES_MISSING.inc()
+        if session.estimator is not None:
+            session.estimator.update(frame_count, observation)
+        session.observations.push(frame_count, observation)
+        if session.trajectory_recorder is not None:
+            session.trajectory_recorder.append(frame_count, observation, drill_type)
+
+        trigger_result = await pipeline.trigger.run(timed_trigger, session, drill_type, frame_count)
 
         end_time = time.time()
-        print(f"Request processing time: {end_time - start_time:.2f} seconds")
+        log_frame(logger, frame_count, "Frame %s processed in %.3f seconds", frame_count, end_time - start_time)
 
         frame_counter += 1
+        metrics.FRAMES.inc()
 
         return {
             "message": "Image processed successfully", 
@@ -113,43 +133,150 @@ async def process_frame(frame_data: FrameData):
             "trigger_bool": trigger_result[1]   
         }
     except Exception as e:
-        logger.error(f"Error processing frame: {e}")
+        logger.error("Error processing frame %s: %s", frame_count, e)
         return {
             "message": f"Error processing frame: {str(e)}",
             "count": frame_count,
         }
 
+def timed_trigger(session, drill_type, frame_count):
+    with metrics.TRIGGER_SECONDS.time():
+        return get_trigger(session, drill_type, frame_count)
+
+async def serve_frames(websocket: WebSocket, receive, process):
+    """
+    Receive frames on their own task and process them in order, so the next
+    frame of a connection is received while the current one is in the pipeline.
+    When processing falls behind, the newest frame wins and stale frames are
+    skipped, see ingest.LatestFrameQueue.
+    Args:
+        websocket (WebSocket): Accepted connection.
+        receive (callable): Coroutine function returning the next message.
+        process (callable): Coroutine function turning a message and the session into a response.
+    """
+    session = DrillSession()
+    frames = LatestFrameQueue()
+
+    async def receiver():
+        try:
+            while True:
+                frames.put(await receive())
+        except Exception as e:
+            frames.close(e)
+
+    receiver_task = asyncio.create_task(receiver())
+    replaced, stale = 0, 0
+    metrics.ACTIVE_SESSIONS.inc()
+    try:
+        while True:
+            message = await frames.get()
+
+            pipeline.frames_replaced += frames.replaced - replaced
+            pipeline.frames_stale += frames.stale - stale
+            replaced, stale = frames.replaced, frames.stale
+            session.frames_dropped = frames.dropped
+
+            result = await process(message, session)
+            result["dropped_frames"] = session.frames_dropped
+            # Frame numbers the drill never saw, dropped here or never sent by the client
+            result["skipped_frames"] = session.frames_skipped
+            with metrics.SEND_SECONDS.time():
+                await websocket.send_text(json.dumps(result))
+    finally:
+        metrics.ACTIVE_SESSIONS.dec()
+        receiver_task.cancel()
+        if session.trajectory_recorder is not None:
+            session.trajectory_recorder.close()
+
+# Load and warmup of the models, None until the app starts
+models_task = None
+# Threads of the models in this worker, None until the models are loaded
+concurrency_plan = None
+
+def prepare_models():
+    global concurrency_plan
+    backend = model_config.load_models()
+    concurrency_plan = planner.choose_plan(backend)
+    pipeline.scheduler.parallel = concurrency_plan.parallel
+    model_config.warmup()
+
+async def load_models():
+    try:
+        await asyncio.get_running_loop().run_in_executor(pipeline.inference.executor, prepare_models)
+    except Exception:
+        logger.exception("Loading the models failed, the worker stays unready")
+
+@app.on_event("startup")
+async def start_pipeline():
+    global models_task
+    await pipeline.start()
+    # The models are loaded in the background so /healthz answers meanwhile,
+    # /readyz only once they are warmed up.
+    models_task = asyncio.create_task(load_models())
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    if model_config.models_ready():
+        return {"status": "ready"}
+    status = "failed" if models_task is not None and models_task.done() else "loading"
+    return JSONResponse({"status": status}, status_code=503)
+
+@app.on_event("shutdown")
+async def stop_pipeline():
+    await pipeline.stop()
+
+@app.get("/stats")
+async def stats():
+    result = pipeline.stats()
+    result["concurrency"] = concurrency_plan.as_dict() if concurrency_plan is not None else None
+    return result
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
+
+    async def receive():
+        data = await websocket.receive_text()
+        return FrameData(**json.loads(data))
+
     try:
-        while True:
-            data = await websocket.receive_text()
-            frame_data = FrameData(**json.loads(data))
-            result = await process_frame(frame_data)
-            await websocket.send_text(json.dumps(result))
+        await serve_frames(websocket, receive, process_frame)
     except WebSocketDisconnect:
-        print("WebSocket disconnected")
+        logger.info("WebSocket disconnected")
     except Exception as e:
-        print(f"An error occurred: {e}")
+        logger.error("An error occurred: %s", e)
     finally:
         # Attempt to close the connection if it's still open
         try:
-            print("closing connection ")
+            logger.info("Closing connection")
+            await websocket.close()
+        except RuntimeError:
+            pass
+
+@app.websocket("/ws/bin")
+async def binary_websocket_endpoint(websocket: WebSocket):
+    await websocket.accept()
+    try:
+        await serve_frames(websocket, websocket.receive_bytes, process_binary_frame)
+    except WebSocketDisconnect:
+        logger.info("WebSocket disconnected")
+    except Exception as e:
+        logger.error("An error occurred: %s", e)
+    finally:
+        try:
+            logger.info("Closing connection")
             await websocket.close()
         except RuntimeError:
             pass
 
- 
-# @app.websocket("/ws")
-# async def websocket_endpoint(websocket: WebSocket):
-#     await websocket.accept()
-#     try:
-#         while True:
-#             data = await websocket.receive_text()
-#             frame_data = FrameData(**json.loads(data))
-#             result = await process_frame(frame_data)
-#             await websocket.send_text(json.dumps(result))
-#     except Exception as e:
-#         print(f"WebSocket connection closed: {e}")
-#         await websocket.close()       
\ No newline at end of file
+import_seconds = time.perf_counter() - import_started
+metrics.IMPORT_SECONDS.set(import_seconds)
+logger.info("Imported the app in %.2fs", import_seconds)
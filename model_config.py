@@ -2,61 +2,108 @@
 This module is dedicated to the configuration of the model.
 """
 
+import threading
+import time
+
 import numpy as np
-from cv2 import rectangle
 from log import logging
-from ultralytics import YOLO
-import torch
-import traceback
-
-# Load models
-device = 'cuda' if torch.cuda.is_available() else 'cpu'
+import metrics
+from backends import create_backend
+from observations import FrameObservation, NUM_KEYPOINTS, R_ANKLE, L_ANKLE
+from postprocess import non_max_suppression, scale_boxes, scale_keypoints, xyxy_to_xywhn
+from preprocess import letterbox, letterbox_shape
+from profiles import DEFAULT_PROFILE, profiles_in_use
+from roi import crop, pose_to_frame
+from settings import INFERENCE_SIZE, POSE_ROI, POSE_ROI_SIZE, MAX_BATCH_SIZE, WARMUP_ITERATIONS
 
-yolo_model_detection = YOLO("yolov8s.pt").to(device)  # YOLOv8 for object detection
-yolo_model_pose = YOLO("yolov8s-pose.pt").to(device)  # YOLOv8 for pose estimation
+# Created by load_models, the backend is chosen with CV_BACKEND and CV_ONNX_PRECISION
+backend = None
+_load_lock = threading.Lock()
+_ready = threading.Event()
 
 
 # Global variables
 EPSILON = 0.01
-WIDTH = 800
-HEIGHT = 800
 MIN_CONFIDENCE = 0.5
 SPORTS_BALL_CLASS_INDEX = 32
 
+# Postprocessing, the defaults of the ultralytics predictor. The confidence
+# threshold and detection limit are set by the inference profile.
+IOU_THRESHOLD = 0.7
+KEYPOINT_CONFIDENCE = 0.5  # poses_from_output masks keypoints below it
+
+logger = logging.getLogger(__name__)
+
+
 ############### Functions ################
 
+def load_models():
+    """
+    Create the inference backend on the first call, later calls return it.
+    Returns:
+        InferenceBackend: The backend running both models.
+    """
+    global backend
+    if backend is None:
+        with _load_lock:
+            if backend is None:
+                started = time.perf_counter()
+                loaded = create_backend()
+                elapsed = time.perf_counter() - started
+                metrics.LOAD_SECONDS.set(elapsed)
+                logger.info("Loaded the %s models in %.2fs", loaded.name, elapsed)
+                backend = loaded
+    return backend
+
+def warmup_inputs():
+    """(size, run detection) of every input size the models see while serving."""
+    detect = {}
+    for profile in profiles_in_use():
+        detect[profile.detection.imgsz] = True
+        detect.setdefault(profile.pose.imgsz, False)
+    if POSE_ROI:
+        detect.setdefault(POSE_ROI_SIZE, False)
+    return sorted(detect.items())
+
+def warmup(iterations=WARMUP_ITERATIONS):
+    """
+    Run blank frames through the models at every input size and at the
+    smallest and largest batch, so that lazy initialisation and allocations
+    happen before the first client frame. Errors are raised, not logged.
+    Args:
+        iterations (int): Forward passes of each input shape, 0 skips the warmup.
+    """
+    model = load_models()
+    started = time.perf_counter()
+    for size, detect in warmup_inputs():
+        # A landscape frame, as the clients send them
+        frame = np.full((size * 9 // 16, size, 3), 114, dtype=np.uint8)
+        for batch_size in sorted({1, MAX_BATCH_SIZE}):
+            batch = preprocess_batch([frame] * batch_size, size)
+            for _ in range(iterations):
+                if detect:
+                    detections_from_output(model.detect(batch.images), batch, model.detection_classes)
+                poses_from_output(model.pose(batch.images), batch, model.pose_classes, model.kpt_shape)
+    elapsed = time.perf_counter() - started
+    metrics.WARMUP_SECONDS.set(elapsed)
+    logger.info("Warmed up the models in %.2fs", elapsed)
+    _ready.set()
+
+def models_ready():
+    """Whether the models are loaded and warmed up."""
+    return _ready.is_set()
+
 def get_coordinates_from_frame(frame):
     """
     Get the coordinates of the objects in the frame.
     Args:
         frame (np.array): Frame from the video.
     Returns:
-        tuple: A tuple containing the results and frame.
+        dict: A dictionary containing the normalised ball box.
     """
-    print(f"yolo detect shape : {frame.shape}")
-    try:
-        results = {}
-        color = (0, 255, 0)  # Green for bounding boxes
-
-        detect_results = yolo_model_detection(frame)
-        for dr in detect_results:
-            if dr.boxes is not None and len(dr.boxes) > 0:
-                for i, cls in enumerate(dr.boxes.cls):
-                    if cls == SPORTS_BALL_CLASS_INDEX:
-                        box = dr.boxes.xywhn[i]
-                        x, y, w, h = box.tolist()
-                        print("ball in results")
-                        results['ball'] = [x, y, w, h]
-
-        if 'ball' not in results:
-            print("Ball not in results")
-            results['ball'] = [None, None, None, None]
-
-        return results
-    
-    except Exception as e:
-        print("An error occurred in object detection: %s", str(e))
-        return {'ball': [None, None, None, None]}
+    logger.debug("yolo detect shape : %s", frame.shape)
+    balls, confidences = get_coordinates_from_batch(preprocess_batch([frame]))
+    return FrameObservation(balls[0], float(confidences[0])).detection_dict()
     
 def get_pose_from_frame(frame):
     """
@@ -66,71 +113,204 @@ def get_pose_from_frame(frame):
     Returns:
         dict: A dictionary containing the pose data.
     """
-    print(f"yolo pose shape : {frame.shape}")
+    logger.debug("yolo pose shape : %s", frame.shape)
+    keypoints, confidences = get_pose_from_batch(preprocess_batch([frame]))
+    results = FrameObservation(keypoints=keypoints[0], keypoint_confidence=confidences[0]).pose_dict()
+    logger.debug("returning pose result: %s", results)
+    return results
+
+class FrameBatch:
+    """Frames of a batch preprocessed once into the input shared by both models."""
+
+    __slots__ = ("images", "shapes", "ratio_pads")
+
+    def __init__(self, images, shapes, ratio_pads):
+        self.images = images          # (n, 3, height, width) float32 RGB in [0, 1], contiguous
+        self.shapes = shapes          # (height, width) of each original frame
+        self.ratio_pads = ratio_pads  # ((ratio, ratio), (left, top)) of each letterbox
+
+    def select(self, indices):
+        """The batch of the frames at `indices`."""
+        if len(indices) == len(self.shapes):
+            return self
+        return FrameBatch(self.images[indices], [self.shapes[i] for i in indices],
+                          [self.ratio_pads[i] for i in indices])
+
+def preprocess_batch(frames, size=INFERENCE_SIZE):
+    """
+    Letterbox, convert and normalise a batch of frames in one go.
+    Args:
+        frames (list[np.array]): BGR frames, possibly from different sessions and of different sizes.
+        size (int): Longest side of a letterboxed frame.
+    Returns:
+        FrameBatch: The batch, ready for any backend.
+    """
+    shapes = [frame.shape[:2] for frame in frames]
+    shape = letterbox_shape(shapes, size)
+
+    images = np.empty((len(frames), shape[0], shape[1], 3), dtype=np.uint8)
+    ratio_pads = []
+    for i, frame in enumerate(frames):
+        images[i], ratio, pad = letterbox(frame, shape)
+        ratio_pads.append(((ratio, ratio), pad))
+
+    # BGR HWC to RGB CHW, converted to float in the same copy
+    images = np.ascontiguousarray(images[..., ::-1].transpose(0, 3, 1, 2), dtype=np.float32)
+    images /= 255
+    return FrameBatch(images, shapes, ratio_pads)
+
+def empty_detections(n):
+    """(balls, confidences) of `n` frames without a ball."""
+    return np.full((n, 4), np.nan, dtype=np.float32), np.full(n, np.nan, dtype=np.float32)
+
+def empty_poses(n):
+    """(keypoints, confidences) of `n` frames without a person."""
+    return (np.full((n, NUM_KEYPOINTS, 2), np.nan, dtype=np.float32),
+            np.full((n, NUM_KEYPOINTS), np.nan, dtype=np.float32))
+
+def detections_from_output(preds, batch, nc, profile=DEFAULT_PROFILE.detection):
+    """
+    Most confident ball of each frame from the raw detection output of a batch.
+    Args:
+        preds (np.array): (n, 4 + nc, anchors) output of the detection network.
+        batch (FrameBatch): The batch it was run on.
+        nc (int): Number of classes of the detection network.
+        profile (ModelProfile): Confidence threshold and detection limit.
+    Returns:
+        tuple: A tuple of (balls, confidences), (n, 4) normalised [x, y, w, h]
+               and (n,) scores in input order, NaN where there is no ball.
+    """
+    balls, confidences = empty_detections(len(preds))
+    for i, (pred, shape, ratio_pad) in enumerate(zip(preds, batch.shapes, batch.ratio_pads)):
+        # Class-aware NMS, other classes never suppress a ball
+        det = non_max_suppression(pred, profile.conf, IOU_THRESHOLD, nc,
+                                  classes=[SPORTS_BALL_CLASS_INDEX], max_det=profile.max_det)
+        if len(det) == 0:
+            continue
+        best = det[det[:, 4].argmax()]
+        balls[i] = xyxy_to_xywhn(scale_boxes(best[None, :4], ratio_pad, shape)[0], shape)
+        confidences[i] = best[4]
+    return balls, confidences
+
+def poses_from_output(preds, batch, nc, kpt_shape, profile=DEFAULT_PROFILE.pose):
+    """
+    Keypoints of the most confident person of each frame from the raw pose output of a batch.
+    Args:
+        preds (np.array): (n, 4 + nc + keypoints, anchors) output of the pose network.
+        batch (FrameBatch): The batch it was run on.
+        nc (int): Number of classes of the pose network.
+        kpt_shape (tuple): (keypoints, 2 or 3) of the pose network.
+        profile (ModelProfile): Confidence threshold and detection limit.
+    Returns:
+        tuple: A tuple of (keypoints, confidences), (n, 17, 2) normalised
+               (x, y) and (n, 17) scores in input order. Keypoints below
+               KEYPOINT_CONFIDENCE or with a zero coordinate are NaN.
+    """
+    keypoints, confidences = empty_poses(len(preds))
+    for i, (pred, shape, ratio_pad) in enumerate(zip(preds, batch.shapes, batch.ratio_pads)):
+        people = non_max_suppression(pred, profile.conf, IOU_THRESHOLD, nc, max_det=profile.max_det)
+        if len(people) == 0:
+            continue
+        # NMS returns the most confident person first
+        person = scale_keypoints(people[0, 6:].reshape(kpt_shape), ratio_pad, shape)
+        xy = person[:, :2] / (shape[1], shape[0])
+        # Keypoints below KEYPOINT_CONFIDENCE are masked here, the network's raw
+        # output keeps them. Any keypoint with a zero coordinate counts as not found.
+        missing = (xy == 0).any(axis=1)
+        if kpt_shape[1] == 3:
+            confidences[i] = person[:, 2]
+            missing |= person[:, 2] < KEYPOINT_CONFIDENCE
+        xy[missing] = np.nan
+        keypoints[i] = xy
+    return keypoints, confidences
+
+def get_coordinates_from_batch(batch, profile=DEFAULT_PROFILE.detection):
+    """
+    Run object detection on a preprocessed batch in a single forward pass.
+    Args:
+        batch (FrameBatch): Frames, possibly from different sessions.
+        profile (ModelProfile): Postprocessing of the detections.
+    Returns:
+        tuple: A tuple of (balls, confidences) as returned by detections_from_output.
+    """
     try:
-        results = {}
-        color = (0, 0, 255)  # Red for keypoints
-
-        pose_results = yolo_model_pose(frame)
-
-        for pr in pose_results:
-            # print(f"pose results>> ${pr.keypoints.xyn[0]}")
-            if pr.keypoints is not None and len(pr.keypoints) > 0:
-                keypoint_mapping = {
-                    'nose': 0, 'r_eye': 1, 'l_eye': 2, 'r_ear': 3, 'l_ear': 4,
-                    'r_shoulder': 5, 'l_shoulder': 6, 'r_elbow': 7, 'l_elbow': 8,
-                    'r_wrist': 9, 'l_wrist': 10, 'r_hip': 11, 'l_hip': 12,
-                    'r_knee': 13, 'l_knee': 14, 'r_ankle': 15, 'l_ankle': 16
-                }
-                for key, idx in keypoint_mapping.items():
-
-                    if len(pr.keypoints.xyn[0]) > 0:
-                        if pr.keypoints.xyn[0][idx][0] != 0 and pr.keypoints.xyn[0][idx][1] != 0:
-                            keypoint_list = pr.keypoints.xyn[0][idx].tolist()
-                            results[key] = keypoint_list  
-                        
-                # # Calculate neck point
-                # if 'r_shoulder' in results and 'l_shoulder' in results:
-                #     neck_x = (results['r_shoulder'][0] + results['l_shoulder'][0]) // 2
-                #     neck_y = (results['r_shoulder'][1] + results['l_shoulder'][1]) // 2
-                #     results['neck'] = [neck_x, neck_y]
-                # # Calculate head point
-                # if 'nose' in results and 'l_ear' in results and 'r_eye' in results:
-                #     l_ear = results['l_ear']
-                #     r_eye = results['r_eye']
-                #     distance_between_ears = np.linalg.norm(np.array(l_ear) - np.array(r_eye))
-                #     head_x = results['nose'][0]
-                #     head_y = results['nose'][1] - int(distance_between_ears)
-                #     results['head'] = [head_x, head_y]
-
-        if 'r_ankle' not in results:
-            results['r_ankle'] = [None, None]
-        
-        if 'l_ankle' not in results:
-            results['l_ankle'] = [None, None]
-
-        print(f"retuning pose result: ${results}")    
-
-        return results
+        model = load_models()
+        return detections_from_output(model.detect(batch.images), batch, model.detection_classes, profile)
 
     except Exception as e:
-        print("An error occurred in processing the video: %s", str(e))
-        traceback.print_exc()
-        return {'r_ankle' : [None, None], 'l_ankle' : [None, None]}
-    
+        logger.error("An error occurred in batched object detection: %s", str(e))
+        return empty_detections(len(batch.shapes))
 
+def get_pose_from_batch(batch, profile=DEFAULT_PROFILE.pose):
+    """
+    Run pose estimation on a preprocessed batch in a single forward pass.
+    Args:
+        batch (FrameBatch): Frames, possibly from different sessions.
+        profile (ModelProfile): Postprocessing of the people found.
+    Returns:
+        tuple: A tuple of (keypoints, confidences) as returned by poses_from_output.
+    """
+    try:
+        model = load_models()
+        return poses_from_output(model.pose(batch.images), batch, model.pose_classes, model.kpt_shape, profile)
 
+    except Exception as e:
+        logger.exception("An error occurred in batched pose estimation: %s", str(e))
+        return empty_poses(len(batch.shapes))
+
+def get_coordinates_from_keyframes(batch, keyframes, profile=DEFAULT_PROFILE.detection):
+    """
+    Run object detection on the keyframes of a batch only.
+    Args:
+        batch (FrameBatch): Frames, possibly from different sessions.
+        keyframes (list[bool]): Whether the detector runs on each frame.
+        profile (ModelProfile): Postprocessing of the detections.
+    Returns:
+        tuple: A tuple of (balls, confidences) of every frame, NaN for the frames that are not keyframes.
+    """
+    balls, confidences = empty_detections(len(keyframes))
+    indices = [i for i, keyframe in enumerate(keyframes) if keyframe]
+    if indices:
+        balls[indices], confidences[indices] = get_coordinates_from_batch(batch.select(indices), profile)
+    return balls, confidences
+
+def get_pose_with_rois(batch, frames, rois, profile=DEFAULT_PROFILE.pose):
+    """
+    Run pose estimation on the full frame or on a region of interest of each frame.
+    Frames cropped to their region of interest are batched together at
+    POSE_ROI_SIZE. When an ankle is lost in the crop the frame is run again
+    in full, its next region of interest is then based on that result.
+    Args:
+        batch (FrameBatch): The full frames, preprocessed at profile.imgsz, or None to preprocess
+            only the frames run in full.
+        frames (list[np.array]): The same frames, decoded.
+        rois (list[tuple]): Normalised region of interest of each frame, None for the full frame.
+        profile (ModelProfile): Postprocessing of the people found.
+    Returns:
+        tuple: A tuple of (keypoints, confidences) as returned by poses_from_output.
+    """
+    keypoints, confidences = empty_poses(len(frames))
+    full = [i for i, roi in enumerate(rois) if roi is None]
+    cropped = [i for i, roi in enumerate(rois) if roi is not None]
 
+    if cropped:
+        crops, boxes = zip(*(crop(frames[i], rois[i]) for i in cropped))
+        crop_keypoints, crop_confidences = get_pose_from_batch(preprocess_batch(crops, POSE_ROI_SIZE), profile)
+        metrics.POSE_ROI_FRAMES.inc(len(cropped))
+        lost = np.isnan(crop_keypoints[:, [R_ANKLE, L_ANKLE], 0]).any(axis=1)
+        for j, (i, box) in enumerate(zip(cropped, boxes)):
+            if lost[j]:
+                full.append(i)
+                metrics.POSE_ROI_FALLBACKS.inc()
+            else:
+                keypoints[i] = pose_to_frame(crop_keypoints[j], box, frames[i].shape)
+                confidences[i] = crop_confidences[j]
 
-# if len(pr.keypoints.xyn[0]) > 0:
-#     print(f"value of idx> {idx}")
-#     print(f"length of list is {len(pr.keypoints.xyn[0])}")
-#     keypoint_list = pr.keypoints.xyn[0][idx].tolist()
-#     confidence = pr.keypoints.conf[0][idx] if hasattr(pr.keypoints, 'conf') else 1.0
-#     # print(f"Detected {key}: {keypoint_list} with confidence {confidence}")
-#     if keypoint_list[0] != 0 and keypoint_list[1] != 0:
-#         results[key] = keypoint_list
-#     else:
-#         print(f"{key} coordinates are zero.")
-# else:
-    # print(f"{key} not detected or keypoints array is empty.")          
\ No newline at end of file
+    if full:
+        full.sort()
+        if batch is None:
+            batch = preprocess_batch([frames[i] for i in full], profile.imgsz)
+        else:
+            batch = batch.select(full)
+        keypoints[full], confidences[full] = get_pose_from_batch(batch, profile)
+    return keypoints, confidences
@@ -0,0 +1,157 @@
+"""
+Per-frame observations of a session: the typed record of one frame and the
+fixed-capacity storage of the recent ones.
+"""
+
+import numpy as np
+
+from settings import OBSERVATION_DEPTH
+
+KEYPOINT_MAPPING = {
+    'nose': 0, 'r_eye': 1, 'l_eye': 2, 'r_ear': 3, 'l_ear': 4,
+    'r_shoulder': 5, 'l_shoulder': 6, 'r_elbow': 7, 'l_elbow': 8,
+    'r_wrist': 9, 'l_wrist': 10, 'r_hip': 11, 'l_hip': 12,
+    'r_knee': 13, 'l_knee': 14, 'r_ankle': 15, 'l_ankle': 16
+}
+NUM_KEYPOINTS = len(KEYPOINT_MAPPING)
+R_ANKLE = KEYPOINT_MAPPING['r_ankle']
+L_ANKLE = KEYPOINT_MAPPING['l_ankle']
+
+
+def _none_if_nan(values):
+    return [None if np.isnan(v) else float(v) for v in values]
+
+
+class FrameObservation:
+    """
+    Ball and keypoints of one frame as the models and the tracker found them.
+    Values that were not found are NaN, the properties return them as None
+    in the lists the triggers unpack.
+    """
+
+    __slots__ = ("ball", "ball_confidence", "keypoints", "keypoint_confidence", "source")
+
+    def __init__(self, ball=None, ball_confidence=np.nan, keypoints=None, keypoint_confidence=None, source=None):
+        # Normalised [x, y, w, h] of the ball
+        self.ball = np.full(4, np.nan, dtype=np.float32) if ball is None else ball
+        self.ball_confidence = ball_confidence
+        # Normalised (x, y) of each keypoint in KEYPOINT_MAPPING, and its confidence
+        self.keypoints = np.full((NUM_KEYPOINTS, 2), np.nan, dtype=np.float32) if keypoints is None else keypoints
+        self.keypoint_confidence = (np.full(NUM_KEYPOINTS, np.nan, dtype=np.float32)
+                                    if keypoint_confidence is None else keypoint_confidence)
+        # 'detected' or 'tracked'
+        self.source = source
+
+    @property
+    def has_ball(self):
+        return not np.isnan(self.ball[0])
+
+    @property
+    def has_ankles(self):
+        return not np.isnan(self.keypoints[[R_ANKLE, L_ANKLE], 0]).any()
+
+    @property
+    def ball_box(self):
+        """[x, y, w, h] of the ball, None values if it was not found."""
+        return _none_if_nan(self.ball)
+
+    def point(self, key):
+        """[x, y] of the keypoint called `key`, None values if it was not found."""
+        return _none_if_nan(self.keypoints[KEYPOINT_MAPPING[key]])
+
+    @property
+    def r_ankle(self):
+        return _none_if_nan(self.keypoints[R_ANKLE])
+
+    @property
+    def l_ankle(self):
+        return _none_if_nan(self.keypoints[L_ANKLE])
+
+    def detection_dict(self):
+        """The ball in the dictionary format of the detection results, {'ball': [x, y, w, h]}."""
+        return {'ball': self.ball_box}
+
+    def pose_dict(self):
+        """The keypoints found, by name, with both ankles always present."""
+        pose = {'r_ankle': [None, None], 'l_ankle': [None, None]}
+        for key, idx in KEYPOINT_MAPPING.items():
+            if not np.isnan(self.keypoints[idx, 0]):
+                pose[key] = self.keypoints[idx].tolist()
+        return pose
+
+
+class ObservationRing:
+    """
+    Ring buffer of the ball box and keypoints of the last `capacity` frames.
+
+    Everything is stored in arrays preallocated at construction, a frame lives
+    in slot `frame_count % capacity` so lookups by frame number are O(1) and
+    memory does not grow with the length of the session. Missing values are NaN.
+    """
+
+    __slots__ = ("capacity", "frames", "ball", "ball_confidence", "keypoints", "keypoint_confidence", "sources",
+                 "latest")
+
+    def __init__(self, capacity=OBSERVATION_DEPTH):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.frames = np.full(capacity, -1, dtype=np.int64)
+        self.ball = np.full((capacity, 4), np.nan, dtype=np.float32)
+        self.ball_confidence = np.full(capacity, np.nan, dtype=np.float32)
+        self.keypoints = np.full((capacity, NUM_KEYPOINTS, 2), np.nan, dtype=np.float32)
+        self.keypoint_confidence = np.full((capacity, NUM_KEYPOINTS), np.nan, dtype=np.float32)
+        self.sources = [None] * capacity
+        self.latest = None
+
+    def push(self, frame_count, observation):
+        """
+        Store the observation of a frame, overwriting the oldest slot.
+        Args:
+            frame_count (int): Client frame number.
+            observation (FrameObservation): Ball and keypoints of the frame.
+        """
+        slot = frame_count % self.capacity
+        self.frames[slot] = frame_count
+        self.ball[slot] = observation.ball
+        self.ball_confidence[slot] = observation.ball_confidence
+        self.keypoints[slot] = observation.keypoints
+        self.keypoint_confidence[slot] = observation.keypoint_confidence
+        self.sources[slot] = observation.source
+        self.latest = frame_count
+
+    def __contains__(self, frame_count):
+        return frame_count >= 0 and self.frames[frame_count % self.capacity] == frame_count
+
+    def get(self, frame_count):
+        """
+        Observation of a frame.
+        Args:
+            frame_count (int): Client frame number.
+        Returns:
+            FrameObservation: A copy of the stored observation, or None if the
+                              frame was never stored or has been overwritten.
+        """
+        if frame_count not in self:
+            return None
+        slot = frame_count % self.capacity
+        return FrameObservation(self.ball[slot].copy(), float(self.ball_confidence[slot]),
+                                self.keypoints[slot].copy(), self.keypoint_confidence[slot].copy(),
+                                self.sources[slot])
+
+    def window(self, size):
+        """
+        The most recent stored frames, oldest first.
+        Args:
+            size (int): Number of frame numbers to look back from the latest one.
+        Returns:
+            tuple: A tuple of (frames, ball, keypoints) arrays holding only the
+                   frames still stored in that range.
+        """
+        if self.latest is None:
+            return self.frames[:0], self.ball[:0], self.keypoints[:0]
+        size = min(size, self.capacity)
+        wanted = np.arange(max(self.latest - size + 1, 0), self.latest + 1)
+        slots = wanted % self.capacity
+        slots = slots[self.frames[slots] == wanted]
+        return self.frames[slots], self.ball[slots], self.keypoints[slots]
@@ -0,0 +1,165 @@
+"""
+Staged frame pipeline: decode -> inference -> trigger.
+
+Each stage owns a long-lived worker pool and admits a bounded number of
+frames at a time. The event loop only awaits the futures of the stages, so
+while one frame is being inferred the loop keeps receiving frames and sending
+responses for every other connection.
+"""
+
+import asyncio
+import base64
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from log import logging, log_frame
+import metrics
+from preprocess import decode_to_target
+from profiles import DEFAULT_PROFILE
+from scheduler import BatchScheduler
+from settings import (
+    INFERENCE_SIZE,
+    DECODE_WORKERS, INFERENCE_WORKERS, TRIGGER_WORKERS,
+    DECODE_QUEUE_DEPTH, INFERENCE_QUEUE_DEPTH, TRIGGER_QUEUE_DEPTH,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Stage:
+    """A worker pool with a bounded number of frames in flight and timing statistics."""
+
+    def __init__(self, name, max_workers, queue_depth):
+        self.name = name
+        self.queue_depth = queue_depth
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = asyncio.Semaphore(queue_depth)
+
+        self.waiting = 0
+        self.running = 0
+        self.processed = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    async def run(self, fn, *args):
+        """Run `fn(*args)` on the worker pool of the stage."""
+        loop = asyncio.get_running_loop()
+        return await self.wrap(lambda: loop.run_in_executor(self.executor, fn, *args))
+
+    async def wrap(self, start):
+        """Admit and time the awaitable returned by `start()` as work of the stage."""
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.running += 1
+        started = time.perf_counter()
+        try:
+            return await start()
+        finally:
+            elapsed = time.perf_counter() - started
+            self.running -= 1
+            self._slots.release()
+            self.processed += 1
+            self.total_seconds += elapsed
+            if elapsed > self.max_seconds:
+                self.max_seconds = elapsed
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        return {
+            "waiting": self.waiting,
+            "running": self.running,
+            "queue_depth": self.queue_depth,
+            "processed": self.processed,
+            "mean_ms": 1000 * self.total_seconds / self.processed if self.processed else 0.0,
+            "max_ms": 1000 * self.max_seconds,
+        }
+
+
+def decode_base64(frame):
+    """Decode the base64 JPEG of a JSON frame message."""
+    with metrics.BASE64_DECODE_SECONDS.time():
+        return base64.b64decode(frame)
+
+
+def decode_frame(frame_bytes, frame_count, expected_width, expected_height, target=INFERENCE_SIZE):
+    """
+    Decode a JPEG into the frame handed to the models, at the scale they run
+    at. The frame stays BGR as ultralytics expects, and is not resized to the
+    announced size since the models return normalised coordinates anyway.
+    Args:
+        frame_bytes (bytes | memoryview): Encoded JPEG.
+        frame_count (int): Client frame number, for logging.
+        expected_width (int): Width announced by the client.
+        expected_height (int): Height announced by the client.
+        target (int): Largest input size of the models the frame is run at.
+    Returns:
+        np.array: Decoded BGR frame.
+    """
+    # frame_bytes may be a memoryview into the message
+    with metrics.IMDECODE_SECONDS.time():
+        frame_np, size = decode_to_target(frame_bytes, target)
+
+    if frame_np is None:
+        raise ValueError("Failed to decode image")
+
+    log_frame(logger, frame_count, "Image dimensions: %s, decoded %s, expected %sx%s",
+              size, frame_np.shape, expected_width, expected_height, level=logging.DEBUG)
+
+    if size is not None and size != (expected_width, expected_height):
+        log_frame(logger, frame_count, "Image dimensions %sx%s do not match expected dimensions %sx%s",
+                  size[0], size[1], expected_width, expected_height, level=logging.WARNING)
+
+    return frame_np
+
+
+class FramePipeline:
+    """The decode, inference and trigger stages shared by every connection."""
+
+    def __init__(self):
+        self.decode = Stage("decode", DECODE_WORKERS, DECODE_QUEUE_DEPTH)
+        self.inference = Stage("inference", INFERENCE_WORKERS, INFERENCE_QUEUE_DEPTH)
+        self.trigger = Stage("trigger", TRIGGER_WORKERS, TRIGGER_QUEUE_DEPTH)
+        self.scheduler = BatchScheduler(executor=self.inference.executor)
+        # Frames dropped on ingestion over all sessions
+        self.frames_replaced = 0
+        self.frames_stale = 0
+        self._register_metrics()
+
+    def _register_metrics(self):
+        """Metrics read from the pipeline when /metrics is scraped."""
+        dropped_help = "Frames dropped on ingestion."
+        metrics.Counter("cv_frames_dropped_total", dropped_help, {"reason": "replaced"},
+                        function=lambda: self.frames_replaced)
+        metrics.Counter("cv_frames_dropped_total", dropped_help, {"reason": "stale"},
+                        function=lambda: self.frames_stale)
+        depth_help = "Frames waiting for or running in a pipeline stage."
+        for stage in (self.decode, self.inference, self.trigger):
+            metrics.Gauge("cv_queue_depth", depth_help, {"queue": stage.name},
+                          function=lambda stage=stage: stage.waiting + stage.running)
+        metrics.Gauge("cv_queue_depth", depth_help, {"queue": "batch"},
+                      function=lambda: self.scheduler.stats()["queue_depth"])
+
+    async def start(self):
+        await self.scheduler.start()
+
+    async def stop(self):
+        await self.scheduler.stop()
+        for stage in (self.decode, self.inference, self.trigger):
+            stage.shutdown()
+
+    async def infer(self, frame, pose_roi=None, detect=True, profile=DEFAULT_PROFILE):
+        """Detection and pose results of a decoded frame, batched with other sessions."""
+        return await self.inference.wrap(lambda: self.scheduler.submit(frame, pose_roi, detect, profile))
+
+    def stats(self):
+        return {
+            "stages": {stage.name: stage.stats() for stage in (self.decode, self.inference, self.trigger)},
+            "scheduler": self.scheduler.stats(),
+            "dropped": {"replaced": self.frames_replaced, "stale": self.frames_stale},
+        }
@@ -0,0 +1,188 @@
+"""
+Plan of the threads and cores the detection and pose networks run on.
+
+The cores of the machine are split evenly between the serve.py workers. In
+a worker the two networks either run side by side on a batch, each with
+half of the cores of the worker, or one after the other with all of them.
+
+    parallel    detection threads + pose threads = worker cores
+    sequential  detection threads = pose threads = worker cores
+
+With CV_CONCURRENCY_MODE=auto both are timed on a blank frame at startup and
+the faster one is kept. With CV_CPU_AFFINITY=1 each worker is pinned to its
+cores, and with the onnx backend in parallel mode each network to its half
+of them. The torch backend has a single thread pool per process, so its
+networks share the cores of the worker.
+
+The plan is logged and reported on /stats.
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from log import logging
+from model_config import preprocess_batch
+from settings import CONCURRENCY_MODE, CONCURRENCY_BENCHMARK_ITERATIONS, CPU_AFFINITY, INFERENCE_SIZE
+
+MODES = ("parallel", "sequential")
+
+logger = logging.getLogger(__name__)
+
+# Cores and inference threads of this worker, set by serve.py
+_worker_cores = None
+_worker_threads = 0
+
+
+class ConcurrencyPlan:
+    """Threads and cores of each network in one worker."""
+
+    __slots__ = ("mode", "cores", "detection_threads", "pose_threads", "detection_cores", "pose_cores",
+                 "timings")
+
+    def __init__(self, mode, cores, detection_threads, pose_threads, detection_cores=None, pose_cores=None):
+        self.mode = mode
+        self.cores = cores
+        self.detection_threads = detection_threads
+        self.pose_threads = pose_threads
+        self.detection_cores = detection_cores
+        self.pose_cores = pose_cores
+        # Seconds per frame of each mode when chosen by benchmark
+        self.timings = {}
+
+    @property
+    def parallel(self):
+        return self.mode == "parallel"
+
+    def apply(self, backend):
+        backend.configure_threads(self.detection_threads, self.pose_threads, self.detection_cores, self.pose_cores)
+
+    def as_dict(self):
+        return {
+            "mode": self.mode,
+            "cores": self.cores,
+            "detection_threads": self.detection_threads,
+            "pose_threads": self.pose_threads,
+            "detection_cores": self.detection_cores,
+            "pose_cores": self.pose_cores,
+            "timings_ms": {mode: 1000 * seconds for mode, seconds in self.timings.items()},
+        }
+
+
+def available_cores():
+    """Cores the process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def worker_cores(cores, workers, index):
+    """
+    The contiguous share of `cores` of one worker.
+    Args:
+        cores (list[int]): Cores of the machine.
+        workers (int): Number of workers.
+        index (int): Index of the worker.
+    Returns:
+        list[int]: Its cores, shared with other workers when there are more workers than cores.
+    """
+    if workers >= len(cores):
+        return [cores[index % len(cores)]]
+    share, extra = divmod(len(cores), workers)
+    start = index * share + min(index, extra)
+    return cores[start:start + share + (index < extra)]
+
+
+def set_worker(index, workers, threads=0, affinity=CPU_AFFINITY):
+    """
+    Record the cores of a forked worker, and pin it to them if `affinity`.
+    Args:
+        index (int): Index of the worker.
+        workers (int): Number of workers.
+        threads (int): Inference threads of the worker, 0 for one per core.
+        affinity (bool): Whether the worker only runs on its cores.
+    """
+    global _worker_cores, _worker_threads
+    _worker_cores = worker_cores(available_cores(), workers, index)
+    _worker_threads = threads
+    if affinity and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, _worker_cores)
+
+
+def make_plan(mode, cores, threads=0, affinity=CPU_AFFINITY):
+    """
+    The plan of one mode.
+    Args:
+        mode (str): One of MODES.
+        cores (list[int]): Cores of the worker.
+        threads (int): Inference threads of the worker, 0 for one per core.
+        affinity (bool): Whether each network is pinned to its cores.
+    Returns:
+        ConcurrencyPlan: The plan.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown concurrency mode {mode!r}, expected one of {MODES}")
+    threads = threads or len(cores)
+    if mode == "sequential" or threads < 2:
+        pinned = cores if affinity else None
+        return ConcurrencyPlan(mode, cores, threads, threads, pinned, pinned)
+
+    # Detection gets the odd thread, it runs at the larger input size
+    detection_threads = (threads + 1) // 2
+    pose_threads = threads - detection_threads
+    detection_cores = pose_cores = None
+    if affinity and len(cores) >= 2:
+        split = max(1, len(cores) * detection_threads // threads)
+        detection_cores, pose_cores = cores[:split], cores[split:]
+    return ConcurrencyPlan(mode, cores, detection_threads, pose_threads, detection_cores, pose_cores)
+
+
+def benchmark(backend, plan, images, iterations):
+    """Seconds to run both networks on `images` under a plan, the best of `iterations`."""
+    plan.apply(backend)
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="planner") as executor:
+        best = float("inf")
+        # The first run creates the sessions and is not timed
+        for run in range(iterations + 1):
+            started = time.perf_counter()
+            if plan.parallel:
+                detect = executor.submit(backend.detect, images)
+                pose = executor.submit(backend.pose, images)
+                detect.result()
+                pose.result()
+            else:
+                backend.detect(images)
+                backend.pose(images)
+            elapsed = time.perf_counter() - started
+            if run > 0:
+                best = min(best, elapsed)
+    return best
+
+
+def choose_plan(backend, mode=CONCURRENCY_MODE, iterations=CONCURRENCY_BENCHMARK_ITERATIONS):
+    """
+    Plan the threads of this worker and apply it to the backend.
+    Args:
+        backend (InferenceBackend): The loaded backend.
+        mode (str): One of MODES, or "auto" to time both.
+        iterations (int): Timed runs of each mode when "auto".
+    Returns:
+        ConcurrencyPlan: The plan applied.
+    """
+    cores = _worker_cores or available_cores()
+    if mode != "auto":
+        plan = make_plan(mode, cores, _worker_threads)
+        plan.apply(backend)
+    else:
+        frame = np.full((INFERENCE_SIZE * 9 // 16, INFERENCE_SIZE, 3), 114, dtype=np.uint8)
+        images = preprocess_batch([frame]).images
+        plans = [make_plan(candidate, cores, _worker_threads) for candidate in MODES]
+        timings = {candidate.mode: benchmark(backend, candidate, images, iterations) for candidate in plans}
+        plan = min(plans, key=lambda candidate: timings[candidate.mode])
+        plan.timings = timings
+        plan.apply(backend)
+
+    logger.info("Concurrency plan: %s", plan.as_dict())
+    return plan
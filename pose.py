@@ -1,8 +1,8 @@
-import torch
+from log import logging
 from model_config import get_pose_from_frame
 
 def process_pose(pose_data):
     frame_count, frame = pose_data
     pose_results = get_pose_from_frame(frame)
-    print(f"Finished processing pose for frame: {frame_count}")
+    logging.debug("Finished processing pose for frame: %s", frame_count)
     return pose_results
@@ -0,0 +1,130 @@
+"""
+NumPy postprocessing of raw YOLOv8 outputs, shared by every inference backend.
+
+Follows ultralytics: a candidate's class is its best scoring class, NMS is
+class-aware and greedy, boxes and keypoints are mapped back through the
+letterbox and clipped to the frame.
+"""
+
+import numpy as np
+
+# Offset separating the boxes of different classes in class-aware NMS
+MAX_WH = 7680
+# Candidates kept for NMS, by confidence
+MAX_NMS = 30000
+
+
+def xywh_to_xyxy(boxes):
+    xyxy = np.empty_like(boxes)
+    half_width, half_height = boxes[:, 2] / 2, boxes[:, 3] / 2
+    xyxy[:, 0] = boxes[:, 0] - half_width
+    xyxy[:, 1] = boxes[:, 1] - half_height
+    xyxy[:, 2] = boxes[:, 0] + half_width
+    xyxy[:, 3] = boxes[:, 1] + half_height
+    return xyxy
+
+
+def xyxy_to_xywhn(box, shape):
+    """One (x1, y1, x2, y2) box as [x, y, w, h] normalised to a frame of `shape`."""
+    height, width = shape[:2]
+    x1, y1, x2, y2 = (float(v) for v in box[:4])
+    return [(x1 + x2) / 2 / width, (y1 + y2) / 2 / height, (x2 - x1) / width, (y2 - y1) / height]
+
+
+def nms(boxes, scores, iou_threshold, max_det):
+    """
+    Greedy non-maximum suppression.
+    Args:
+        boxes (np.array): (n, 4) boxes as (x1, y1, x2, y2).
+        scores (np.array): (n,) scores.
+        iou_threshold (float): Boxes overlapping a kept one more than this are dropped.
+        max_det (int): Boxes kept at most.
+    Returns:
+        np.array: Indices of the kept boxes, best score first.
+    """
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+
+    keep = []
+    while order.size > 0 and len(keep) < max_det:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        width = np.maximum(0.0, np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]))
+        height = np.maximum(0.0, np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]))
+        intersection = width * height
+        iou = intersection / (areas[i] + areas[rest] - intersection + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def non_max_suppression(pred, conf_threshold, iou_threshold, nc, classes=None, max_det=300):
+    """
+    Detections of one image from its raw network output.
+    Args:
+        pred (np.array): (4 + nc + extra, anchors) output of one image, boxes as centre and size.
+        conf_threshold (float): Minimum best class score.
+        iou_threshold (float): NMS overlap threshold.
+        nc (int): Number of classes.
+        classes (list[int]): Classes kept, all if None.
+        max_det (int): Detections kept at most.
+    Returns:
+        np.array: (k, 6 + extra) rows of (x1, y1, x2, y2, conf, class, extra...), best first.
+    """
+    pred = pred.T
+    scores = pred[:, 4:4 + nc]
+    conf = scores.max(1)
+    candidates = conf > conf_threshold
+    pred, scores, conf = pred[candidates], scores[candidates], conf[candidates]
+
+    cls = scores.argmax(1)
+    if classes is not None:
+        wanted = np.isin(cls, classes)
+        pred, conf, cls = pred[wanted], conf[wanted], cls[wanted]
+    if len(pred) == 0:
+        return np.zeros((0, 6 + pred.shape[1] - 4 - nc), dtype=np.float32)
+    if len(pred) > MAX_NMS:
+        best = conf.argsort()[::-1][:MAX_NMS]
+        pred, conf, cls = pred[best], conf[best], cls[best]
+
+    boxes = xywh_to_xyxy(pred[:, :4])
+    keep = nms(boxes + cls[:, None] * MAX_WH, conf, iou_threshold, max_det)
+    return np.concatenate([boxes[keep], conf[keep, None], cls[keep, None].astype(pred.dtype),
+                           pred[keep, 4 + nc:]], axis=1)
+
+
+def scale_boxes(boxes, ratio_pad, shape):
+    """
+    Map (x1, y1, x2, y2) boxes from the letterboxed input back to the frame.
+    Args:
+        boxes (np.array): (n, 4) boxes in input pixels.
+        ratio_pad (tuple): ((ratio, ratio), (left, top)) of the letterbox.
+        shape (tuple): Shape of the frame.
+    Returns:
+        np.array: The boxes in frame pixels, clipped to the frame.
+    """
+    (ratio, _), (left, top) = ratio_pad
+    boxes = boxes.copy()
+    boxes[:, [0, 2]] = (boxes[:, [0, 2]] - left) / ratio
+    boxes[:, [1, 3]] = (boxes[:, [1, 3]] - top) / ratio
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, shape[1])
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, shape[0])
+    return boxes
+
+
+def scale_keypoints(keypoints, ratio_pad, shape):
+    """
+    Map keypoints from the letterboxed input back to the frame.
+    Args:
+        keypoints (np.array): (k, 2 or 3) keypoints in input pixels, with their confidence if 3.
+        ratio_pad (tuple): ((ratio, ratio), (left, top)) of the letterbox.
+        shape (tuple): Shape of the frame.
+    Returns:
+        np.array: The keypoints in frame pixels, clipped to the frame.
+    """
+    (ratio, _), (left, top) = ratio_pad
+    keypoints = keypoints.copy()
+    keypoints[:, 0] = ((keypoints[:, 0] - left) / ratio).clip(0, shape[1])
+    keypoints[:, 1] = ((keypoints[:, 1] - top) / ratio).clip(0, shape[0])
+    return keypoints
@@ -0,0 +1,131 @@
+"""
+Decoding of client frames at the scale the models run at.
+
+The models letterbox every frame to INFERENCE_SIZE, so decoding a 1080p or 4K
+JPEG at full resolution only to shrink it again is wasted work. libjpeg can
+decode at 1/2, 1/4 or 1/8 scale for a fraction of the cost, the largest of
+those that is still at least INFERENCE_SIZE is used. Frames stay BGR, which
+is what ultralytics expects, and every coordinate the models return is
+normalised, so nothing downstream depends on the decoded size.
+"""
+
+import math
+
+import cv2
+import numpy as np
+
+from settings import INFERENCE_SIZE
+
+# Start of frame markers, they carry the image size
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+LETTERBOX_COLOR = (114, 114, 114)
+
+# Largest stride of the YOLOv8 models, their input sides are multiples of it
+STRIDE = 32
+
+
+def jpeg_size(buffer):
+    """
+    Read the size of a JPEG from its header without decoding it.
+    Args:
+        buffer (bytes | memoryview): Encoded JPEG.
+    Returns:
+        tuple: A tuple of (width, height), or None if no frame header was found.
+    """
+    data = memoryview(buffer)
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            # Fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            # Markers without a length
+            i += 2
+            continue
+        if marker in SOF_MARKERS:
+            height = (data[i + 5] << 8) | data[i + 6]
+            width = (data[i + 7] << 8) | data[i + 8]
+            return width, height
+        i += 2 + ((data[i + 2] << 8) | data[i + 3])
+    return None
+
+
+def decode_flag(width, height, target=INFERENCE_SIZE):
+    """The cheapest imdecode flag whose output still has a side of at least `target`."""
+    longest = max(width, height)
+    for factor, flag in REDUCED_FLAGS:
+        if longest // factor >= target:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+def decode_to_target(buffer, target=INFERENCE_SIZE):
+    """
+    Decode a JPEG straight to the scale of the model input.
+    Args:
+        buffer (bytes | memoryview): Encoded JPEG.
+        target (int): Model input size.
+    Returns:
+        tuple: A tuple of (BGR frame or None if decoding failed, (width, height)
+               of the encoded image or None if it could not be read).
+    """
+    size = jpeg_size(buffer)
+    flag = decode_flag(*size, target) if size is not None else cv2.IMREAD_COLOR
+    return cv2.imdecode(np.frombuffer(buffer, np.uint8), flag), size
+
+
+def letterbox_shape(shapes, size=INFERENCE_SIZE, stride=STRIDE):
+    """
+    Smallest model input holding every frame of a batch letterboxed to `size`.
+    Args:
+        shapes (list[tuple]): (height, width) of each frame.
+        size (int): Longest side of a letterboxed frame.
+        stride (int): The input sides are rounded up to a multiple of it.
+    Returns:
+        tuple: The (height, width) of the model input.
+    """
+    height = width = 0
+    for frame_height, frame_width in shapes:
+        ratio = size / max(frame_height, frame_width)
+        height = max(height, math.ceil(round(frame_height * ratio) / stride) * stride)
+        width = max(width, math.ceil(round(frame_width * ratio) / stride) * stride)
+    return height, width
+
+
+def letterbox(image, shape=INFERENCE_SIZE, color=LETTERBOX_COLOR):
+    """
+    Resize keeping the aspect ratio and pad to `shape`, in one pass.
+    Args:
+        image (np.array): BGR frame.
+        shape (int | tuple): Side of the square output, or its (height, width).
+        color (tuple): Padding colour.
+    Returns:
+        tuple: A tuple of (letterboxed frame, scale ratio, (left, top) padding).
+    """
+    if isinstance(shape, int):
+        shape = (shape, shape)
+    height, width = image.shape[:2]
+    ratio = min(shape[0] / height, shape[1] / width)
+    new_width, new_height = round(width * ratio), round(height * ratio)
+    if (new_width, new_height) != (width, height):
+        image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+
+    pad_x, pad_y = (shape[1] - new_width) / 2, (shape[0] - new_height) / 2
+    top, bottom = round(pad_y - 0.1), round(pad_y + 0.1)
+    left, right = round(pad_x - 0.1), round(pad_x + 0.1)
+    image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
+    return image, ratio, (left, top)
@@ -0,0 +1,111 @@
+"""
+Inference profiles: the input size, confidence threshold and detection limit
+of each model, chosen per drill.
+
+Front view drills have a large ball close to the camera and are served at a
+smaller input size, the other drills keep the full CV_INFERENCE_SIZE. The
+profile of a drill can be overridden with CV_DRILL_PROFILES, e.g.
+
+    CV_DRILL_PROFILES="inside_taps=default,roll_across=detail"
+
+Frames are batched per profile, see scheduler.py. bench_profiles.py measures
+the latency and count accuracy of every profile on recorded sessions.
+"""
+
+from settings import INFERENCE_SIZE, DRILL_PROFILES
+
+# The defaults of the ultralytics predictor
+CONFIDENCE_THRESHOLD = 0.25
+MAX_DETECTIONS = 300
+
+
+class ModelProfile:
+    """Input size and postprocessing of one model."""
+
+    __slots__ = ("imgsz", "conf", "max_det")
+
+    def __init__(self, imgsz=INFERENCE_SIZE, conf=CONFIDENCE_THRESHOLD, max_det=MAX_DETECTIONS):
+        self.imgsz = imgsz
+        self.conf = conf
+        self.max_det = max_det
+
+    def __repr__(self):
+        return f"ModelProfile(imgsz={self.imgsz}, conf={self.conf}, max_det={self.max_det})"
+
+
+class InferenceProfile:
+    """Settings of the detection and pose models for a group of drills."""
+
+    __slots__ = ("name", "detection", "pose")
+
+    def __init__(self, name, detection, pose):
+        self.name = name
+        self.detection = detection
+        self.pose = pose
+
+    @property
+    def decode_size(self):
+        """Side the frames are decoded to, the larger input size of the two models."""
+        return max(self.detection.imgsz, self.pose.imgsz)
+
+    def __repr__(self):
+        return f"InferenceProfile({self.name!r}, detection={self.detection}, pose={self.pose})"
+
+
+DEFAULT_PROFILE = InferenceProfile("default", ModelProfile(), ModelProfile())
+
+PROFILES = {
+    DEFAULT_PROFILE.name: DEFAULT_PROFILE,
+    # Ball and athlete fill much of the frame. Only the most confident ball
+    # box and person are used, so few detections are kept.
+    "front": InferenceProfile("front", ModelProfile(480, 0.25, 10), ModelProfile(480, 0.25, 5)),
+    # Small ball far from the camera
+    "detail": InferenceProfile("detail", ModelProfile(800, 0.2, 10), ModelProfile(640, 0.25, 5)),
+}
+
+# Drills without an entry use the default profile
+DRILL_PROFILE_NAMES = {
+    "inside_taps": "front",
+    "v_push_pull": "front",
+}
+
+
+def parse_drill_profiles(value):
+    """
+    Drill to profile name overrides from "drill=profile,drill=profile".
+    Args:
+        value (str): The overrides, may be empty.
+    Returns:
+        dict: Profile name by drill type.
+    """
+    overrides = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        drill_type, _, name = item.partition("=")
+        name = name.strip()
+        if name not in PROFILES:
+            raise ValueError(f"Unknown inference profile {name!r} for {drill_type.strip()!r}, "
+                             f"expected one of {sorted(PROFILES)}")
+        overrides[drill_type.strip()] = name
+    return overrides
+
+
+DRILL_PROFILE_NAMES.update(parse_drill_profiles(DRILL_PROFILES))
+
+
+def profile_for(drill_type):
+    """
+    The inference profile of a drill.
+    Args:
+        drill_type (str): Drill being performed, may be None.
+    Returns:
+        InferenceProfile: Its profile, DEFAULT_PROFILE if it has none.
+    """
+    return PROFILES[DRILL_PROFILE_NAMES.get(drill_type, DEFAULT_PROFILE.name)]
+
+
+def profiles_in_use():
+    """The default profile and every profile a drill is served with."""
+    names = {DEFAULT_PROFILE.name, *DRILL_PROFILE_NAMES.values()}
+    return [PROFILES[name] for name in sorted(names)]
@@ -0,0 +1,93 @@
+"""
+Binary WebSocket frame protocol.
+
+A binary frame message is a fixed-size little-endian header followed by the
+raw encoded image bytes:
+
+    magic (2s) | version (B) | codec (B) | drill id (B) | pad (x) |
+    frame_count (I) | width (H) | height (H) | payload ...
+
+The payload is handed to the decoder as a memoryview, so no copy of the
+image bytes is made between the socket and `cv2.imdecode`.
+"""
+
+import struct
+from typing import NamedTuple
+
+MAGIC = b"CV"
+# Version 1 also carried the capture time as a double, which the server never read
+VERSION = 2
+HEADER = struct.Struct("<2sBBBxIHH")
+
+# Codecs
+CODEC_JPEG = 0
+CODECS = (CODEC_JPEG,)
+
+# Drill ids are the index of the drill type in this tuple, never reorder it.
+DRILL_TYPES = (
+    "toe_taps",
+    "push_pull",
+    "push_pull_left",
+    "push_pull_right",
+    "inside_taps",
+    "inside_outside_right",
+    "inside_outside_left",
+    "v_push_pull",
+    "roll_across",
+)
+DRILL_IDS = {drill_type: drill_id for drill_id, drill_type in enumerate(DRILL_TYPES)}
+
+
+class FrameHeader(NamedTuple):
+    frame_count: int
+    drill_type: str
+    width: int
+    height: int
+    codec: int
+
+
+def parse_frame_message(message):
+    """
+    Split a binary frame message into its header and payload.
+    Args:
+        message (bytes): Message received from the WebSocket.
+    Returns:
+        tuple: A tuple of (FrameHeader, memoryview) where the memoryview
+               references the encoded image inside `message`.
+    Raises:
+        ValueError: If the message is truncated or the header is invalid.
+    """
+    if len(message) <= HEADER.size:
+        raise ValueError(f"Frame message too short: {len(message)} bytes")
+
+    view = memoryview(message)
+    magic, version, codec, drill_id, frame_count, width, height = HEADER.unpack_from(view)
+
+    if magic != MAGIC:
+        raise ValueError(f"Invalid frame magic: {magic!r}")
+    if version != VERSION:
+        raise ValueError(f"Unsupported protocol version: {version}")
+    if codec not in CODECS:
+        raise ValueError(f"Unsupported codec: {codec}")
+    if drill_id >= len(DRILL_TYPES):
+        raise ValueError(f"Unknown drill id: {drill_id}")
+
+    header = FrameHeader(frame_count, DRILL_TYPES[drill_id], width, height, codec)
+    return header, view[HEADER.size:]
+
+
+def build_frame_message(payload, frame_count, drill_type, width, height, codec=CODEC_JPEG):
+    """
+    Build a binary frame message, as sent by clients.
+    Args:
+        payload (bytes): Encoded image bytes.
+        frame_count (int): Client side frame number.
+        drill_type (str): One of DRILL_TYPES.
+        width (int): Width of the encoded image.
+        height (int): Height of the encoded image.
+        codec (int): Payload codec.
+    Returns:
+        bytes: The header followed by the payload.
+    """
+    header = HEADER.pack(MAGIC, VERSION, codec, DRILL_IDS[drill_type], frame_count, width, height)
+    return header + bytes(payload)
@@ -0,0 +1,202 @@
+"""
+INT8 static quantization of the detection and pose models, with an accuracy gate.
+
+    python quantize.py recordings/ --calibration-frames 200 --max-count-error 0
+
+1. Both models are exported to FP32 ONNX, as the onnx backend uses them.
+2. INT8 candidates are made with ONNX Runtime static quantization, QDQ with
+   per-channel weights. They are calibrated on frames of the recorded
+   sessions, decoded and preprocessed as the server does it. The detection
+   and pose heads, whose outputs mix box coordinates and scores, stay FP32.
+3. The FP32 and INT8 models are run on every frame of every session. Ball
+   boxes and ankles are compared, and the drill of each session is counted
+   with trigger.get_trigger from the results of each model.
+4. The candidates are promoted to the files CV_ONNX_PRECISION=int8 loads only
+   if no session count differs from FP32 by more than --max-count-error.
+   Otherwise they are kept as *.int8.candidate.onnx and the script exits with
+   status 1.
+
+The report is written to quantize_report.json in the model cache. See
+recordings.py for the layout of recorded sessions.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+import onnx
+import onnxruntime as ort
+from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+from onnxruntime.quantization.shape_inference import quant_pre_process
+
+from backends import OnnxBackend, export_onnx, onnx_path
+from model_config import detections_from_output, poses_from_output, preprocess_batch
+from preprocess import decode_to_target
+from observations import FrameObservation, R_ANKLE, L_ANKLE
+from recordings import load_sessions
+from session import DrillSession
+from settings import DETECTION_WEIGHTS, POSE_WEIGHTS, MODEL_CACHE_DIR
+from trigger import get_trigger
+
+# Nodes of the YOLOv8 Detect and Pose heads in the ultralytics ONNX export
+HEAD_PREFIX = "/model.22/"
+REPORT_FILE = "quantize_report.json"
+
+
+class FrameCalibrationReader(CalibrationDataReader):
+    """Calibration batches of one frame, spread evenly over the recorded sessions."""
+
+    def __init__(self, sessions, input_name, limit):
+        self.input_name = input_name
+        frames = [path for session in sessions for path in session.frame_paths]
+        step = max(len(frames) // max(limit, 1), 1)
+        self.paths = frames[::step][:limit]
+        self.index = 0
+
+    def get_next(self):
+        if self.index >= len(self.paths):
+            return None
+        with open(self.paths[self.index], "rb") as file:
+            frame, _ = decode_to_target(file.read())
+        self.index += 1
+        return {self.input_name: preprocess_batch([frame]).images}
+
+    def rewind(self):
+        self.index = 0
+
+
+def quantize(fp32_path, output_path, sessions, calibration_frames):
+    """Make an INT8 candidate of an FP32 ONNX model."""
+    prepared_path = output_path + ".prepared.onnx"
+    quant_pre_process(fp32_path, prepared_path)
+
+    input_name = ort.InferenceSession(fp32_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+    reader = FrameCalibrationReader(sessions, input_name, calibration_frames)
+    fp32_model = onnx.load(fp32_path)
+    head = [node.name for node in fp32_model.graph.node if node.name.startswith(HEAD_PREFIX)]
+
+    quantize_static(prepared_path, output_path, reader, quant_format=QuantFormat.QDQ, per_channel=True,
+                    weight_type=QuantType.QInt8, activation_type=QuantType.QUInt8, nodes_to_exclude=head)
+    os.remove(prepared_path)
+
+    # The backends read class names and the keypoint shape from the metadata
+    model = onnx.load(output_path)
+    del model.metadata_props[:]
+    model.metadata_props.extend(fp32_model.metadata_props)
+    onnx.save(model, output_path)
+
+
+def run_session(backend, recorded):
+    """Ball boxes, ankles, final count and forward time of one recorded session."""
+    drill = DrillSession(recorded.drill_type)
+    balls, ankles = [], []
+    forward = 0.0
+    for frame_count, jpeg in recorded.frames():
+        frame, _ = decode_to_target(jpeg)
+        batch = preprocess_batch([frame])
+
+        started = time.perf_counter()
+        detect, pose = backend.detect(batch.images), backend.pose(batch.images)
+        forward += time.perf_counter() - started
+
+        ball, ball_confidence = detections_from_output(detect, batch, backend.detection_classes)
+        keypoints, keypoint_confidence = poses_from_output(pose, batch, backend.pose_classes, backend.kpt_shape)
+        balls.append(ball[0])
+        ankles.append(keypoints[0, [R_ANKLE, L_ANKLE]])
+
+        observation = FrameObservation(ball[0], float(ball_confidence[0]), keypoints[0], keypoint_confidence[0])
+        if drill.estimator is not None:
+            drill.estimator.update(frame_count, observation)
+        drill.observations.push(frame_count, observation)
+        get_trigger(drill, recorded.drill_type, frame_count)
+
+    return np.array(balls), np.array(ankles), drill.prev_count, forward
+
+
+def compare_points(reference, candidate):
+    """Mean and largest distance where both found the points, and the share of frames only one did."""
+    found_reference = ~np.isnan(reference).any(axis=-1)
+    found_candidate = ~np.isnan(candidate).any(axis=-1)
+    both = found_reference & found_candidate
+    distance = np.linalg.norm(reference[both] - candidate[both], axis=-1)
+    return {
+        "mean_error": float(distance.mean()) if distance.size else 0.0,
+        "max_error": float(distance.max()) if distance.size else 0.0,
+        "mismatched": float((found_reference != found_candidate).mean()) if found_reference.size else 0.0,
+    }
+
+
+def evaluate(fp32, int8, sessions):
+    """Compare the two backends on every session."""
+    report = []
+    for recorded in sessions:
+        fp32_balls, fp32_ankles, fp32_count, fp32_time = run_session(fp32, recorded)
+        int8_balls, int8_ankles, int8_count, int8_time = run_session(int8, recorded)
+        report.append({
+            "session": recorded.name,
+            "drill_type": recorded.drill_type,
+            "frames": len(recorded),
+            "expected_count": recorded.count,
+            "fp32_count": fp32_count,
+            "int8_count": int8_count,
+            "count_error": abs(int8_count - fp32_count),
+            # Ball centres, and both ankles as two points
+            "ball": compare_points(fp32_balls[:, :2], int8_balls[:, :2]),
+            "ankles": compare_points(fp32_ankles, int8_ankles),
+            "speedup": fp32_time / int8_time if int8_time else 0.0,
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sessions", nargs="+", help="recorded sessions, or directories of them")
+    parser.add_argument("--calibration-frames", type=int, default=200)
+    parser.add_argument("--max-count-error", type=float, default=0,
+                        help="largest count difference from FP32 allowed in any session")
+    parser.add_argument("--cache-dir", default=MODEL_CACHE_DIR)
+    args = parser.parse_args()
+
+    sessions = load_sessions(args.sessions)
+    if not sessions:
+        raise SystemExit("No recorded sessions found")
+
+    candidates = {}
+    for kind, weights in (("detection", DETECTION_WEIGHTS), ("pose", POSE_WEIGHTS)):
+        fp32_path = export_onnx(weights, args.cache_dir)
+        candidates[kind] = (onnx_path(weights, args.cache_dir, "int8.candidate"),
+                            onnx_path(weights, args.cache_dir, "int8"))
+        print(f"Quantizing {fp32_path} on {args.calibration_frames} frames")
+        quantize(fp32_path, candidates[kind][0], sessions, args.calibration_frames)
+
+    fp32 = OnnxBackend(cache_dir=args.cache_dir, precision="fp32")
+    int8 = OnnxBackend(cache_dir=args.cache_dir, precision="int8",
+                       paths={kind: candidate for kind, (candidate, _) in candidates.items()})
+    report = evaluate(fp32, int8, sessions)
+
+    print(f"{'session':<28}{'drill':<22}{'fp32':>6}{'int8':>6}{'ball err':>10}{'ankle err':>10}{'speedup':>9}")
+    for row in report:
+        print(f"{row['session']:<28}{row['drill_type']:<22}{row['fp32_count']:>6}{row['int8_count']:>6}"
+              f"{row['ball']['mean_error']:>10.4f}{row['ankles']['mean_error']:>10.4f}{row['speedup']:>8.2f}x")
+
+    worst = max(row["count_error"] for row in report)
+    promoted = worst <= args.max_count_error
+    if promoted:
+        for candidate, target in candidates.values():
+            shutil.move(candidate, target)
+
+    with open(os.path.join(args.cache_dir, REPORT_FILE), "w") as file:
+        json.dump({"promoted": promoted, "max_count_error": args.max_count_error, "sessions": report}, file, indent=2)
+
+    if not promoted:
+        print(f"Not promoted, a count differs from FP32 by {worst} (allowed {args.max_count_error})")
+        sys.exit(1)
+    print("Promoted, load with CV_BACKEND=onnx CV_ONNX_PRECISION=int8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Drill sessions recorded to disk, for calibrating and evaluating models offline.
+
+A recorded session is a directory of the JPEG frames the client sent, named
+by frame number as the debug sampler names them, with a meta.json:
+
+    recordings/2024-05-01-toe-taps/
+        meta.json           {"drill_type": "toe_taps", "count": 25}
+        00000000.jpg
+        00000001.jpg
+        ...
+
+"count" is the count of the drill as judged by a person, it is optional, as
+is "rep_frames", the frame numbers the person counted each rep on.
+Running the server with CV_DEBUG_SAMPLE_EVERY_N=1 writes the frames of every
+session in this layout, only meta.json has to be added.
+"""
+
+import glob
+import json
+import os
+
+META_FILE = "meta.json"
+
+
+class RecordedSession:
+    """Frames and metadata of one recorded session."""
+
+    __slots__ = ("path", "drill_type", "count", "rep_frames", "frame_counts", "frame_paths")
+
+    def __init__(self, path):
+        with open(os.path.join(path, META_FILE)) as file:
+            meta = json.load(file)
+        self.path = path
+        self.drill_type = meta["drill_type"]
+        self.count = meta.get("count")
+        self.rep_frames = meta.get("rep_frames")
+
+        frames = []
+        for frame_path in glob.glob(os.path.join(path, "*.jpg")):
+            name = os.path.splitext(os.path.basename(frame_path))[0]
+            if name.isdigit():
+                frames.append((int(name), frame_path))
+        frames.sort()
+        self.frame_counts = [frame_count for frame_count, _ in frames]
+        self.frame_paths = [frame_path for _, frame_path in frames]
+
+    @property
+    def name(self):
+        return os.path.basename(os.path.normpath(self.path))
+
+    def __len__(self):
+        return len(self.frame_paths)
+
+    def frames(self):
+        """(frame number, encoded JPEG) of every frame, in order."""
+        for frame_count, frame_path in zip(self.frame_counts, self.frame_paths):
+            with open(frame_path, "rb") as file:
+                yield frame_count, file.read()
+
+
+def load_sessions(paths):
+    """
+    Recorded sessions from directories, or directories of them.
+    Args:
+        paths (list[str]): Session directories, or directories holding session directories.
+    Returns:
+        list[RecordedSession]: The sessions, in path order.
+    """
+    sessions = []
+    for path in paths:
+        if os.path.exists(os.path.join(path, META_FILE)):
+            sessions.append(RecordedSession(path))
+            continue
+        for child in sorted(os.listdir(path)):
+            if os.path.exists(os.path.join(path, child, META_FILE)):
+                sessions.append(RecordedSession(os.path.join(path, child)))
+    return sessions
@@ -0,0 +1,621 @@
+"""
+Offline replay of the drills of counts.py over whole recorded trajectories.
+
+The streaming path, trigger.get_trigger, steps a drill one frame at a time.
+replay() takes the ball box and ankles of every frame of a session as arrays
+instead, and computes with NumPy what does not depend on the state of the
+drill for all frames at once: which frames count, the values of the previous
+frame, distances, ball direction, active ankle, and the `when` condition of
+every transition.
+
+What is left depends on the state: the change of direction since the last
+count, the debounce, the state a transition leaves and the position of the
+last count. All of it is set by the last count, so every candidate frame of
+a transition is a node, the count it would make there, and the next count
+after every node is searched at once with NumPy. A Python loop then follows
+the links from the first count, one lookup per count.
+
+The counts are those the streaming path reports, test_replay.py checks this
+on the synthetic sessions of bench_replay.py for every drill with and without
+state estimation. The trigger flags are not reproduced, the frames each count
+happened on are returned instead.
+
+A replay of 3000 frames costs about 0.2 to 0.4 ms for most drills however
+often they count, against 5 to 9 us per frame for the streaming path. Speedups on the
+3000 frame drill sessions of bench_replay.py, raw and with state estimation,
+which makes the streaming path slower:
+
+    inside_outside_left, inside_outside_right       ~60-65x    ~105-130x
+    inside_taps, push_pull_left, push_pull_right    ~60x       ~105-110x
+    push_pull                                       ~55x       ~95x
+    toe_taps                                        ~45x       ~70x
+    v_push_pull                                     ~25x       ~45x
+    roll_across                                     ~12x       ~20x
+
+toe_taps, v_push_pull and roll_across fall short of 50x without estimation.
+Their nodes are searched with more NumPy calls: toe_taps also follows the
+switches of the active ankle and counts with the builtin min one count at a
+time, v_push_pull searches three transitions from every state, and the
+from_mark condition of each roll_across transition is evaluated with the mark
+of every node, over as many candidates as it takes to hold.
+"""
+
+from functools import cached_property
+
+import numpy as np
+
+from drills import LEFT, RIGHT, MIN_BALL_SPEED
+from estimator import StateEstimator
+from observations import FrameObservation, R_ANKLE, L_ANKLE
+
+
+class Trajectory:
+    """
+    Ball box and ankles of the frames of a session.
+    Args:
+        frame_counts (np.ndarray): (n,) client frame numbers, increasing.
+        ball (np.ndarray): (n, 4) normalised [x, y, w, h], NaN where not found.
+        right_ankle (np.ndarray): (n, 2) normalised [x, y], NaN where not found.
+        left_ankle (np.ndarray): (n, 2) normalised [x, y], NaN where not found.
+        ball_direction (np.ndarray): (n,) direction of the ball from the state
+                                     estimator, 0 while it is still, None without state estimation.
+        ball_area_direction (np.ndarray): (n,) the same for the area of the ball box.
+    """
+
+    __slots__ = ("frame_counts", "ball", "right_ankle", "left_ankle", "ball_direction", "ball_area_direction")
+
+    def __init__(self, frame_counts, ball, right_ankle, left_ankle, ball_direction=None, ball_area_direction=None):
+        self.frame_counts = np.asarray(frame_counts, dtype=np.int64)
+        self.ball = np.asarray(ball, dtype=np.float32)
+        self.right_ankle = np.asarray(right_ankle, dtype=np.float32)
+        self.left_ankle = np.asarray(left_ankle, dtype=np.float32)
+        self.ball_direction = ball_direction
+        self.ball_area_direction = ball_area_direction
+
+    @classmethod
+    def from_observations(cls, frame_counts, observations):
+        """The trajectory of FrameObservation objects."""
+        observations = list(observations)
+        keypoints = np.array([observation.keypoints for observation in observations], dtype=np.float32)
+        return cls(frame_counts, np.array([observation.ball for observation in observations], dtype=np.float32),
+                   keypoints[:, R_ANKLE], keypoints[:, L_ANKLE])
+
+    @classmethod
+    def load(cls, path):
+        """A trajectory written by save(), without the directions of the state estimator."""
+        with np.load(path) as arrays:
+            return cls(arrays["frame_counts"], arrays["ball"], arrays["right_ankle"], arrays["left_ankle"])
+
+    def save(self, path):
+        """Write the raw detections to a .npz file."""
+        np.savez(path, frame_counts=self.frame_counts, ball=self.ball, right_ankle=self.right_ankle,
+                 left_ankle=self.left_ankle)
+
+    def __len__(self):
+        return len(self.frame_counts)
+
+    @property
+    def estimated(self):
+        return self.ball_direction is not None
+
+
+def estimate(trajectory):
+    """
+    The trajectory filtered by a StateEstimator as the server filters each
+    frame, with the directions the estimator reports.
+    Args:
+        trajectory (Trajectory): Raw detections.
+    Returns:
+        Trajectory: The filtered trajectory.
+    """
+    estimator = StateEstimator()
+    ball = trajectory.ball.copy()
+    right, left = trajectory.right_ankle.copy(), trajectory.left_ankle.copy()
+    direction = np.zeros(len(trajectory), dtype=np.int8)
+    area_direction = np.zeros(len(trajectory), dtype=np.int8)
+    for i, frame_count in enumerate(trajectory.frame_counts.tolist()):
+        observation = FrameObservation(ball[i])
+        observation.keypoints[R_ANKLE], observation.keypoints[L_ANKLE] = right[i], left[i]
+        estimator.update(frame_count, observation)
+        right[i], left[i] = observation.keypoints[R_ANKLE], observation.keypoints[L_ANKLE]
+        direction[i] = estimator.ball_direction(MIN_BALL_SPEED)
+        area_direction[i] = estimator.ball_area_direction(MIN_BALL_SPEED)
+    return Trajectory(trajectory.frame_counts, ball, right, left, direction, area_direction)
+
+
+class FeatureSeries:
+    """
+    The features of drills.FrameFeatures as arrays over the frames of a
+    trajectory, each computed on first use. changed and debounced depend on
+    the state and are not available, active is the mask of frames where the
+    left ankle is active.
+    """
+
+    def __init__(self, drill, trajectory):
+        self.drill = drill
+        self.trajectory = trajectory
+        self.frame_count = trajectory.frame_counts
+        self.ball_x, self.ball_y, self.ball_w, self.ball_h = trajectory.ball.T.astype(np.float64)
+        self.right_x, self.right_y = trajectory.right_ankle.T.astype(np.float64)
+        self.left_x, self.left_y = trajectory.left_ankle.T.astype(np.float64)
+        valid = ~(np.isnan(self.ball_x) | np.isnan(self.ball_y) | np.isnan(self.ball_w) | np.isnan(self.ball_h))
+        if LEFT in drill.ankles:
+            valid &= ~(np.isnan(self.left_x) | np.isnan(self.left_y))
+        if RIGHT in drill.ankles:
+            valid &= ~(np.isnan(self.right_x) | np.isnan(self.right_y))
+        # Frames the drill counts on
+        self.valid = valid
+        self.index = np.flatnonzero(valid)
+
+    def previous(self, values):
+        """Values of the previous frame the drill counted on, its own on the first."""
+        shifted = values.copy()
+        shifted[self.index[1:]] = values[self.index[:-1]]
+        return shifted
+
+    @cached_property
+    def ball_area(self):
+        return self.ball_w * self.ball_h
+
+    @cached_property
+    def prev_ball_x(self):
+        return self.previous(self.ball_x)
+
+    @cached_property
+    def ball_dx(self):
+        return np.abs(self.ball_x - self.prev_ball_x)
+
+    @cached_property
+    def right_distance(self):
+        return np.sqrt((self.right_x - self.ball_x) ** 2 + (self.right_y - self.ball_y) ** 2)
+
+    @cached_property
+    def left_distance(self):
+        return np.sqrt((self.left_x - self.ball_x) ** 2 + (self.left_y - self.ball_y) ** 2)
+
+    @cached_property
+    def right_dx(self):
+        return np.abs(self.right_x - self.ball_x)
+
+    @cached_property
+    def left_dx(self):
+        return np.abs(self.left_x - self.ball_x)
+
+    @cached_property
+    def inter_ankle(self):
+        return np.abs(self.left_x - self.right_x)
+
+    @cached_property
+    def direction(self):
+        trajectory = self.trajectory
+        if self.drill.direction == "x":
+            if trajectory.estimated:
+                return trajectory.ball_direction
+            return np.where(self.ball_x > self.prev_ball_x, 1, -1)
+        if self.drill.direction == "area":
+            if trajectory.estimated:
+                return trajectory.ball_area_direction
+            return np.where(self.ball_area > self.previous(self.ball_area), 1, -1)
+        return None
+
+    @cached_property
+    def active(self):
+        active = self.drill.active
+        if active in (LEFT, RIGHT):
+            return np.full(len(self.frame_count), active == LEFT)
+        return np.asarray(active(self), dtype=bool)
+
+    def _of_active(self, left, right):
+        return np.where(self.active, left, right)
+
+    @cached_property
+    def ankle_x(self):
+        return self._of_active(self.left_x, self.right_x)
+
+    @cached_property
+    def ankle_y(self):
+        return self._of_active(self.left_y, self.right_y)
+
+    @cached_property
+    def prev_ankle_y(self):
+        return self._of_active(self.previous(self.left_y), self.previous(self.right_y))
+
+    @cached_property
+    def distance(self):
+        return self._of_active(self.left_distance, self.right_distance)
+
+    @cached_property
+    def dx(self):
+        return self._of_active(self.left_dx, self.right_dx)
+
+    @cached_property
+    def other_y(self):
+        return self._of_active(self.right_y, self.left_y)
+
+
+class FrameView:
+    """
+    Features of frame i of a FeatureSeries, read like drills.FrameFeatures,
+    or of the frames of i when it is an array of indices.
+    """
+
+    __slots__ = ("series", "i")
+
+    def __init__(self, series, i):
+        self.series = series
+        self.i = i
+
+    def __getattr__(self, name):
+        return getattr(self.series, name)[self.i]
+
+
+# Candidate frames a from_mark condition is evaluated on at once, doubling
+# for the counts it holds on none of them
+MARK_WINDOW = 8
+
+
+class Tallies:
+    """The session attributes the drills count into."""
+
+    __slots__ = ("prev_trigger_count", "prev_count_left", "prev_count_right")
+
+    def __init__(self):
+        self.prev_trigger_count = 0
+        self.prev_count_left = 0
+        self.prev_count_right = 0
+
+
+class ReplayResult:
+    """
+    Counts of a drill over a trajectory.
+        counts: (n,) count reported after each frame, as get_trigger reports it.
+        count_frames: (k,) frame numbers the drill counted on.
+    """
+
+    __slots__ = ("counts", "count_frames")
+
+    def __init__(self, counts, count_frames):
+        self.counts = counts
+        self.count_frames = count_frames
+
+    @property
+    def final_count(self):
+        return self.counts[-1].item() if len(self.counts) else 0
+
+
+class _Replay:
+    """
+    State of one replay, the sequential part of replay(). Every candidate
+    frame of a transition is a node, the count that transition would make
+    there. Which count comes next only depends on the last one, so the next
+    node of every node is found at once with NumPy and the loop only follows
+    them from the first count.
+    """
+
+    def __init__(self, drill, trajectory, features=None):
+        self.drill = drill
+        self.f = f = features if features is not None else FeatureSeries(drill, trajectory)
+        self.n = n = len(trajectory)
+        self.frame_counts = trajectory.frame_counts
+
+        transitions = drill.transitions
+        if any(transition.from_mark is not None for transition in transitions) and (
+                drill.distinct or any(transition.mark is None for transition in transitions)):
+            raise ValueError(f"{drill.name}: from_mark is only replayed when every transition sets the mark, "
+                             f"and not in distinct drills")
+        # candidates[k][p] are the frames where transition k may fire before the
+        # state is known, with prev_direction -1 for p = 0 and 1 for p = 1, and
+        # n appended
+        self.masks, self.candidates = [], []
+        with np.errstate(invalid="ignore"):
+            sides = {None: f.valid}
+            if any(transition.side is not None for transition in transitions):
+                sides[LEFT] = f.valid & f.active
+                sides[RIGHT] = f.valid & ~f.active
+            if any(transition.changed for transition in transitions):
+                # Frames the direction differs from -1, then from 1, a still ball never changes it
+                turns = (f.direction == 1, f.direction == -1)
+            for transition in transitions:
+                mask = sides[transition.side] & np.asarray(transition.when(f), dtype=bool)
+                if transition.changed:
+                    by_direction = (mask & turns[0], mask & turns[1])
+                    self.candidates.append([np.append(np.flatnonzero(m), n) for m in by_direction])
+                else:
+                    by_direction = (mask, mask)
+                    self.candidates.append([np.append(np.flatnonzero(mask), n)] * 2)
+                self.masks.append(by_direction)
+
+        # Frames, each block of nodes ending with n, and the transitions
+        # counting on them
+        self.node_frames, self.node_commits, self.size = [], [], 0
+        # Frame and transition of each count
+        self.count_indices = self.count_transitions = None
+
+    def run(self):
+        if self.drill.pending:
+            self.run_pending()
+        else:
+            self.run_transitions()
+        return self.result()
+
+    def add_nodes(self, frames, commits):
+        """
+        A block of nodes, counts on `frames` by the transitions `commits` in
+        order. The last frame is n, the node after the last count. Returns
+        the id of the first.
+        """
+        base = self.size
+        self.node_frames.append(frames)
+        self.node_commits.append(commits)
+        self.size += len(frames)
+        return base
+
+    def follow(self, first, next_nodes):
+        """The counts of the nodes from `first` on, the last ones are not linked."""
+        links = memoryview(next_nodes)
+        path, node, end = [], first, self.size
+        while node < end:
+            path.append(node)
+            node = links[node]
+        path = np.array(path, dtype=np.intp)
+        frames = np.concatenate(self.node_frames)[path]
+        if len(path) and frames[-1] == self.n:
+            path, frames = path[:-1], frames[:-1]
+
+        width = max(map(len, self.node_commits))
+        commits = np.array([(*ks, *[-1] * (width - len(ks))) for ks in self.node_commits], dtype=np.intp)
+        bases = np.cumsum([0, *map(len, self.node_frames)])
+        commits = commits[np.searchsorted(bases, path, side="right") - 1]
+        # Nodes counting twice on their frame, in the order of the commits
+        counted = commits >= 0
+        self.count_indices = np.repeat(frames, counted.sum(axis=1))
+        self.count_transitions = commits[counted]
+
+    def debounce(self):
+        """
+        The index the debounce has passed at after a count on each frame, and
+        before the first count. (None, 0) without a debounce.
+        """
+        drill, frame_counts = self.drill, self.frame_counts
+        if drill.frame_threshold is None:
+            return None, 0
+        after = np.searchsorted(frame_counts, frame_counts + drill.frame_threshold)
+        if not drill.debounce_start:
+            # After a count on frame number 0 the drill debounces as if it never counted
+            after[frame_counts == 0] = 0
+            return after, 0
+        return after, int(np.searchsorted(frame_counts, drill.frame_threshold))
+
+    def targets(self, state, p, bases):
+        """
+        The transitions that count first from the state, in order, as
+        (transition, frames, base, positions). frames are the candidates, the
+        nodes from base on, or those at `positions` when not None. A
+        transition into the current state of a distinct drill fires without
+        counting, it is left out and its frames are taken from the
+        transitions after it.
+        """
+        drill, targets, blocked = self.drill, [], None
+        for k, transition in enumerate(drill.transitions):
+            if not ((transition.source is None or state == transition.source)
+                    and (transition.repeat or state != transition.action)):
+                continue
+            if drill.distinct and transition.action == state:
+                blocked = self.masks[k][p] if blocked is None else blocked | self.masks[k][p]
+                continue
+            frames = self.candidates[k][p]
+            if blocked is None:
+                targets.append((transition, frames, bases[k, p], None))
+            else:
+                positions = np.append(np.flatnonzero(~blocked[frames[:-1]]), len(frames) - 1)
+                targets.append((transition, frames[positions], bases[k, p], positions))
+        return targets
+
+    def marked(self, from_mark, frames, j, marks):
+        """
+        The first of frames[j] on where from_mark holds with the mark of each
+        count, the index of the appended n if none.
+        """
+        last = len(frames) - 1
+        rows = np.flatnonzero(j < last)
+        # Most of the time the first candidate holds
+        holds = np.asarray(from_mark(FrameView(self.f, frames[j[rows]]), marks[rows]), dtype=bool)
+        rows = rows[~holds]
+        j[rows] += 1
+        rows = rows[j[rows] < last]
+        width = MARK_WINDOW
+        while len(rows):
+            window = j[rows, None] + np.arange(width)
+            inside = window < last
+            window = np.minimum(window, last - 1)
+            holds = np.asarray(from_mark(FrameView(self.f, frames[window]), marks[rows, None]), dtype=bool) & inside
+            found = holds.any(axis=1)
+            j[rows[found]] = window[found, holds[found].argmax(axis=1)]
+            rows = rows[~found]
+            j[rows] = np.minimum(j[rows] + width, last)
+            rows = rows[j[rows] < last]
+            width *= 2
+        return j
+
+    def next_counts(self, targets, plain, debounced, marks):
+        """
+        The node of the next count from each of `plain`, or `debounced` for
+        debounced transitions, with the mark `marks`, one after the last
+        count if there is none.
+        """
+        firsts, nodes = [], []
+        for transition, frames, base, positions in targets:
+            j = np.searchsorted(frames, debounced if transition.debounced else plain)
+            if transition.from_mark is not None:
+                j = self.marked(transition.from_mark, frames, j, marks)
+            firsts.append(frames[j])
+            nodes.append(base + (j if positions is None else positions[j]))
+        if not nodes:
+            return np.full(len(plain), self.size)
+        if len(nodes) == 1:
+            return nodes[0]
+        # The first frame, on ties the first transition
+        return np.array(nodes)[np.argmin(firsts, axis=0), np.arange(len(plain))]
+
+    def run_transitions(self):
+        """
+        The state, the direction of the last count, the debounce and the mark
+        after a count only depend on its transition and frame, and on the
+        direction before it when the ball is still. A node is a candidate
+        frame of a transition for each direction before it. Nodes leaving the
+        same state and direction search the same transitions at once.
+        """
+        drill, f = self.drill, self.f
+        transitions = drill.transitions
+        directions = f.direction if drill.follow_direction else None
+        parities = (0, 1) if directions is not None else (0,)
+        bases = {(k, p): self.add_nodes(self.candidates[k][p], (k,))
+                 for k in range(len(transitions)) for p in parities}
+        after, ready = self.debounce()
+
+        # (nodes, plain, debounced, marks) of the counts leaving each state and direction
+        leaving = {}
+        for (k, p), base in bases.items():
+            frames, transition = self.candidates[k][p][:-1], transitions[k]
+            if not len(frames):
+                continue
+            nodes = np.arange(base, base + len(frames))
+            plain = frames + 1
+            debounced = plain if after is None else np.maximum(plain, after[frames])
+            marks = None if transition.mark is None else getattr(f, transition.mark)[frames]
+            if directions is None:
+                after_p = p
+            elif transition.changed:
+                # Its candidates are the frames the direction turned on
+                after_p = 1 - p
+            else:
+                # A still ball keeps the direction of the last count, see drills.ball_direction
+                direction = directions[frames]
+                after_p = np.where(direction > 0, 1, np.where(direction < 0, 0, p))
+            for q in parities:
+                if np.ndim(after_p) == 0:
+                    if q != after_p:
+                        continue
+                    part = (nodes, plain, debounced, marks)
+                else:
+                    rows = np.flatnonzero(after_p == q)
+                    part = (nodes[rows], plain[rows], debounced[rows], None if marks is None else marks[rows])
+                leaving.setdefault((transition.action, q), []).append(part)
+
+        next_nodes = np.full(self.size, self.size)
+        for (state, q), parts in leaving.items():
+            if len(parts) > 1:
+                parts = [[None if values[0] is None else np.concatenate(values) for values in zip(*parts)]]
+            nodes, plain, debounced, marks = parts[0]
+            next_nodes[nodes] = self.next_counts(self.targets(state, q, bases), plain, debounced, marks)
+
+        first = self.next_counts(self.targets("", 0, bases), np.zeros(1, dtype=np.intp), np.array([ready]),
+                                 np.zeros(1))
+        self.follow(first.item(), next_nodes)
+
+    def run_pending(self):
+        """
+        A count of a pending drill leaves the side that counted, the state.
+        The next is the first candidate of the other side, or the first frame
+        after a switch to the other ankle when the side is left pending, see
+        drills.Drill. On a frame with both, the other side counts, after the
+        state when its transition comes first. The nodes are the candidates
+        of each side, the same counting after the other side, and the first
+        frames after the switches of each side.
+        """
+        drill, f, n = self.drill, self.f, self.n
+        transitions = drill.transitions
+        for transition in transitions:
+            if transition.changed or transition.source is not None or transition.from_mark is not None:
+                raise ValueError(f"{drill.name}: transitions of pending drills only use `when` and the debounce")
+        by_side = {transition.side: k for k, transition in enumerate(transitions)}
+        others = {k: by_side[RIGHT if transition.side == LEFT else LEFT] for k, transition in enumerate(transitions)}
+        index = f.index
+        left = f.active[index]
+        switch = np.flatnonzero(left[1:] != left[:-1])
+        before, after_switch = index[switch], index[switch + 1]
+
+        # For each transition its candidates and the (last frame before, first
+        # frame) of the switches where it is left pending, with n appended
+        candidates, switches = {}, {}
+        for k, transition in enumerate(transitions):
+            held = (left[switch] == (transition.side == LEFT)) & self.masks[k][0][before]
+            candidates[k] = self.candidates[k][0]
+            switches[k] = (before[held], np.append(after_switch[held], n))
+        fires = {k: self.add_nodes(candidates[k], (k,)) for k in candidates}
+        stale = {k: self.add_nodes(switches[k][1], (k,)) for k in candidates}
+        # The other side counting after the state, which comes first
+        twice = {k: self.add_nodes(candidates[k], (others[k], k)) for k in candidates if others[k] < k}
+
+        after, ready = self.debounce()
+        next_nodes = np.full(self.size, self.size)
+        for k, other in others.items():
+            blocks = [(fires[k], candidates[k]), (stale[k], switches[k][1])]
+            if k in twice:
+                blocks.append((twice[k], candidates[k]))
+            for base, frames in blocks:
+                frames = frames[:-1]
+                start = frames + 1 if after is None else np.maximum(frames + 1, after[frames])
+                j = np.searchsorted(candidates[other], start)
+                s = np.searchsorted(switches[k][0], start)
+                fired, left_pending = candidates[other][j], switches[k][1][s]
+                nodes = np.where(fired <= left_pending, fires[other] + j, stale[k] + s)
+                if other in twice:
+                    nodes = np.where(fired == left_pending, twice[other] + j, nodes)
+                next_nodes[base:base + len(frames)] = nodes
+
+        # The first count is on the side of the active ankle
+        first = self.size
+        i = min(values[np.searchsorted(values, ready)] for values in candidates.values())
+        if i < n:
+            k = by_side[LEFT if f.active[i] else RIGHT]
+            first = fires[k] + int(np.searchsorted(candidates[k], i))
+        self.follow(first, next_nodes)
+
+    def tallies(self):
+        """The count after each count, summing the tallies with NumPy when drill.count takes arrays."""
+        drill, counted = self.drill, self.count_transitions
+        if len(counted) == 0:
+            return np.zeros(0)
+        tallies = Tallies()
+        for name in Tallies.__slots__:
+            increments = np.array([transition.increment if transition.tally == name else 0
+                                   for transition in drill.transitions])
+            setattr(tallies, name, np.cumsum(increments[counted]))
+        try:
+            values = np.asarray(drill.count(tallies), dtype=np.float64)
+            if values.shape == counted.shape:
+                return values
+        except (TypeError, ValueError):
+            pass
+        # Like the builtin min of toe_taps, one count at a time
+        columns = [getattr(tallies, name).tolist() for name in Tallies.__slots__]
+        values, tallies = [], Tallies()
+        for tallies.prev_trigger_count, tallies.prev_count_left, tallies.prev_count_right in zip(*columns):
+            values.append(drill.count(tallies))
+        return np.array(values, dtype=np.float64)
+
+    def result(self):
+        indices = self.count_indices
+        values = self.tallies()
+        # get_trigger keeps the last positive count, each frame reports the last
+        # one up to it and the last one of a frame wins
+        positive = values > 0
+        counts = np.repeat(np.concatenate(([0.0], values[positive])),
+                           np.diff(indices[positive], prepend=0, append=self.n))
+        return ReplayResult(counts, self.frame_counts[indices])
+
+
+def replay(drill, trajectory, features=None):
+    """
+    Count a drill over a whole trajectory.
+    Args:
+        drill (drills.Drill): The drill, e.g. counts.DRILLS["toe_taps"].
+        trajectory (Trajectory): Its frames, filtered by estimate() to replay with state estimation.
+        features (FeatureSeries): Features of the drill over the trajectory from an earlier replay, to
+                                  reuse those computed already. They do not depend on the constants of
+                                  counts.py, only the `when` conditions are evaluated again.
+    Returns:
+        ReplayResult: The count after each frame and the frames counted on.
+    """
+    return _Replay(drill, trajectory, features).run()
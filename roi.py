@@ -0,0 +1,97 @@
+"""
+Region of interest of pose estimation.
+
+The drills only use the ankles relative to the ball, so once both are known
+pose runs on a padded crop around the ball and the lower body of the previous
+frame, at POSE_ROI_SIZE instead of INFERENCE_SIZE. Keypoints found in the crop
+are mapped back to coordinates normalised to the full frame.
+"""
+
+import math
+
+import numpy as np
+
+from observations import KEYPOINT_MAPPING
+from settings import POSE_ROI_PADDING
+
+ANKLES = [KEYPOINT_MAPPING['r_ankle'], KEYPOINT_MAPPING['l_ankle']]
+LOWER_BODY = [KEYPOINT_MAPPING[key] for key in ('r_hip', 'l_hip', 'r_knee', 'l_knee', 'r_ankle', 'l_ankle')]
+
+# Smallest side of a crop, normalised, so the person stays recognisable
+MIN_ROI_SIZE = 0.25
+# Above this share of the frame a crop saves too little to be worth it
+MAX_ROI_AREA = 0.6
+# The previous observation is too old to place the crop after this many frames
+MAX_ROI_FRAME_GAP = 5
+
+
+def pose_roi(observations, frame_count, padding=POSE_ROI_PADDING):
+    """
+    Crop to run pose on for a frame, from the latest observation of the session.
+    Args:
+        observations (ObservationRing): Recent results of the session.
+        frame_count (int): Frame the crop is for.
+        padding (float): Added on each side, as a fraction of the largest side.
+    Returns:
+        tuple: Normalised (x0, y0, x1, y1) of the crop, or None to run on the full frame.
+    """
+    latest = observations.latest
+    if latest is None or not 0 < frame_count - latest <= MAX_ROI_FRAME_GAP:
+        return None
+
+    slot = latest % observations.capacity
+    ball = observations.ball[slot]
+    keypoints = observations.keypoints[slot]
+    if np.isnan(ball).any() or np.isnan(keypoints[ANKLES]).any():
+        return None
+
+    points = keypoints[LOWER_BODY]
+    points = points[~np.isnan(points[:, 0])]
+    x0 = min(points[:, 0].min(), ball[0] - ball[2] / 2)
+    x1 = max(points[:, 0].max(), ball[0] + ball[2] / 2)
+    y0 = min(points[:, 1].min(), ball[1] - ball[3] / 2)
+    y1 = max(points[:, 1].max(), ball[1] + ball[3] / 2)
+
+    side = max(x1 - x0, y1 - y0, MIN_ROI_SIZE)
+    pad = padding * side
+    cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+    half_width = max(x1 - x0, MIN_ROI_SIZE) / 2 + pad
+    half_height = max(y1 - y0, MIN_ROI_SIZE) / 2 + pad
+
+    roi = (max(cx - half_width, 0.0), max(cy - half_height, 0.0),
+           min(cx + half_width, 1.0), min(cy + half_height, 1.0))
+    if (roi[2] - roi[0]) * (roi[3] - roi[1]) > MAX_ROI_AREA:
+        return None
+    return tuple(float(v) for v in roi)
+
+
+def crop(frame, roi):
+    """
+    Cut a region of interest out of a frame.
+    Args:
+        frame (np.array): Full frame.
+        roi (tuple): Normalised (x0, y0, x1, y1).
+    Returns:
+        tuple: A tuple of (crop as a view into the frame, its (x0, y0, x1, y1) in pixels).
+    """
+    height, width = frame.shape[:2]
+    x0, y0 = int(roi[0] * width), int(roi[1] * height)
+    x1, y1 = max(math.ceil(roi[2] * width), x0 + 1), max(math.ceil(roi[3] * height), y0 + 1)
+    return frame[y0:y1, x0:x1], (x0, y0, x1, y1)
+
+
+def pose_to_frame(keypoints, box, shape):
+    """
+    Map keypoints normalised to a crop back to the full frame.
+    Args:
+        keypoints (np.array): (k, 2) keypoints normalised to the crop, NaN where not found.
+        box (tuple): The crop in pixels, as returned by `crop`.
+        shape (tuple): Shape of the full frame.
+    Returns:
+        np.array: The keypoints normalised to the full frame.
+    """
+    x0, y0, x1, y1 = box
+    height, width = shape[:2]
+    scale = np.array([(x1 - x0) / width, (y1 - y0) / height], dtype=keypoints.dtype)
+    offset = np.array([x0 / width, y0 / height], dtype=keypoints.dtype)
+    return keypoints * scale + offset
@@ -0,0 +1,173 @@
+"""
+Cross-session micro-batching of the detection and pose models.
+
+Every connected session submits its frames to one BatchScheduler. Frames are
+collected into a batch until either `max_batch_size` frames are waiting or the
+oldest one has waited `max_wait_ms`, then both models run once on the whole
+batch and each result is handed back to the coroutine that submitted it.
+
+A batch is letterboxed and converted to a tensor once, both models run on
+that same tensor and only their postprocessing is separate. Frames submitted
+with a pose region of interest run pose on that crop instead, see roi.py.
+Detection only runs on the frames submitted as keyframes, see tracker.py.
+Frames of different inference profiles are letterboxed to different sizes,
+so a batch runs one forward pass per profile, see profiles.py.
+"""
+
+import asyncio
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from model_config import get_coordinates_from_keyframes, get_pose_with_rois, preprocess_batch
+from observations import FrameObservation
+from profiles import DEFAULT_PROFILE
+from settings import MAX_BATCH_SIZE, MAX_BATCH_WAIT_MS, MAX_QUEUE_DEPTH
+
+
+def _timed(histogram, fn, *args):
+    """Run `fn(*args)` on a worker thread and observe its duration."""
+    started = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        histogram.observe(time.perf_counter() - started)
+
+
+class BatchScheduler:
+    """Gather frames from all sessions and run batched forward passes."""
+
+    def __init__(self, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_BATCH_WAIT_MS,
+                 max_queue_depth=MAX_QUEUE_DEPTH, executor=None):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue_depth = max_queue_depth
+        # Detection and pose of a batch run side by side, hence two workers.
+        self._executor = executor or ThreadPoolExecutor(max_workers=2, thread_name_prefix="inference")
+        # Set from the concurrency plan, see planner.py
+        self.parallel = True
+        self._queue = None
+        self._task = None
+
+        self.batch_sizes = Counter()
+        self.frames = 0
+
+    async def start(self):
+        """Start collecting batches on the running event loop."""
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue_depth)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop collecting batches, frames still queued are cancelled."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while self._queue is not None and not self._queue.empty():
+            *_, future = self._queue.get_nowait()
+            future.cancel()
+
+    async def submit(self, frame, pose_roi=None, detect=True, profile=DEFAULT_PROFILE):
+        """
+        Queue a frame for the next batch and wait for its results.
+        Args:
+            frame (np.array): Decoded frame.
+            pose_roi (tuple): Normalised region of interest pose runs on, None for the full frame.
+            detect (bool): Whether detection runs on the frame.
+            profile (InferenceProfile): Input sizes and postprocessing of the models.
+        Returns:
+            FrameObservation: Ball and keypoints of the frame, with source 'detected' if
+                              detection ran on it and no ball otherwise.
+        """
+        if self._task is None:
+            raise RuntimeError("BatchScheduler has not been started")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((frame, pose_roi, detect, profile, future))
+        return await future
+
+    async def _collect(self):
+        """Wait for the first frame, then fill the batch until it is full or the wait expires."""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            groups = {}
+            for item in await self._collect():
+                groups.setdefault(item[3], []).append(item)
+            for profile, batch in groups.items():
+                await self._infer(profile, batch)
+                self.batch_sizes[len(batch)] += 1
+                self.frames += len(batch)
+
+    async def _infer(self, profile, batch):
+        """Run both models on the frames of one profile and resolve their futures."""
+        loop = asyncio.get_running_loop()
+        frames = [frame for frame, _, _, _, _ in batch]
+        rois = [roi for _, roi, _, _, _ in batch]
+        keyframes = [detect for _, _, detect, _, _ in batch]
+
+        try:
+            # Detection needs the full frames of keyframes only. Pose reuses them when both models of the
+            # profile share an input size, otherwise it preprocesses just the frames it runs in full,
+            # those without a region of interest or that lost an ankle in theirs
+            detection_input = None
+            if any(keyframes):
+                detection_input = await loop.run_in_executor(self._executor, _timed, metrics.PREPROCESS_SECONDS,
+                                                             preprocess_batch, frames, profile.detection.imgsz)
+            pose_input = detection_input if profile.pose.imgsz == profile.detection.imgsz else None
+            detect = (self._executor, _timed, metrics.DETECTION_FORWARD_SECONDS, get_coordinates_from_keyframes,
+                      detection_input, keyframes, profile.detection)
+            pose = (self._executor, _timed, metrics.POSE_FORWARD_SECONDS, get_pose_with_rois,
+                    pose_input, frames, rois, profile.pose)
+            if self.parallel:
+                (balls, ball_confidences), (keypoints, keypoint_confidences) = await asyncio.gather(
+                    loop.run_in_executor(*detect), loop.run_in_executor(*pose))
+            else:
+                balls, ball_confidences = await loop.run_in_executor(*detect)
+                keypoints, keypoint_confidences = await loop.run_in_executor(*pose)
+        except Exception as e:
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for i, (*_, detected, _, future) in enumerate(batch):
+            if not future.done():
+                future.set_result(FrameObservation(balls[i], float(ball_confidences[i]), keypoints[i],
+                                                   keypoint_confidences[i], 'detected' if detected else None))
+
+    def stats(self):
+        """Achieved batch size statistics."""
+        batches = sum(self.batch_sizes.values())
+        return {
+            "batches": batches,
+            "frames": self.frames,
+            "mean_batch_size": self.frames / batches if batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "parallel": self.parallel,
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+        }
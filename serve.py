@@ -0,0 +1,165 @@
+"""
+Multi-process serving of the FastAPI app in main.py.
+
+    python serve.py --host 0.0.0.0 --port 8000 --workers 4
+
+The supervisor binds the listening socket, imports main and loads the
+detection and pose weights, then forks the workers. The weights are shared
+with every worker copy-on-write instead of being loaded once per worker.
+Each worker warms the models up after the fork, with its own threads, and
+reports ready on /readyz once done. /healthz answers from the start.
+
+Workers accept connections from the shared socket. A WebSocket connection is
+served from start to end by the worker that accepted it, so its DrillSession
+never leaves that process. A worker that exits is restarted on its own, the
+sessions of the other workers are not affected. Each worker limits the
+inference backend to its share of the cores so the workers do not
+oversubscribe the CPU, see planner.py. With the onnx backend the weights are not shared, each
+worker creates its ONNX Runtime sessions on its first frame.
+
+Metrics on /metrics are per worker.
+"""
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+from log import logging, setup_logging
+from settings import WORKERS, WORKER_THREADS, WORKER_RESTART_BACKOFF_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+def bind_socket(host, port, backlog=2048):
+    """Listening socket shared by all workers."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def threads_per_worker(workers, threads=WORKER_THREADS):
+    """Inference threads of each worker."""
+    if threads > 0:
+        return threads
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def run_worker(index, workers, sock, threads, host, port):
+    """Body of a forked worker, never returns."""
+    import uvicorn
+    import main
+    import planner
+    from model_config import load_models
+
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    setup_logging(log_file=f"worker{index}.log", force=True)
+
+    # The threads of each model are planned when the worker starts the app
+    planner.set_worker(index, workers, threads)
+    logger.info("Worker %s (pid %s) serving with %s %s threads", index, os.getpid(), threads, load_models().name)
+
+    config = uvicorn.Config(main.app, host=host, port=port, log_config=None)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Supervisor:
+    """Forks the workers and restarts the ones that exit."""
+
+    def __init__(self, sock, workers, threads, host, port):
+        self.sock = sock
+        self.workers = workers
+        self.threads = threads
+        self.host = host
+        self.port = port
+        self.pids = {}  # pid -> (worker index, start time)
+        self.stopping = False
+
+    def spawn(self, index):
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                run_worker(index, self.workers, self.sock, self.threads, self.host, self.port)
+            except BaseException:
+                logger.exception("Worker %s failed", index)
+                status = 1
+            finally:
+                logging.shutdown()
+                os._exit(status)
+        self.pids[pid] = (index, time.monotonic())
+        logger.info("Started worker %s with pid %s", index, pid)
+
+    def stop(self, signum, frame):
+        self.stopping = True
+        for pid in list(self.pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+
+        for index in range(self.workers):
+            self.spawn(index)
+
+        while self.pids:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+
+            index, started = self.pids.pop(pid, (None, None))
+            if index is None or self.stopping:
+                continue
+
+            logger.error("Worker %s (pid %s) exited with status %s, restarting",
+                         index, pid, os.waitstatus_to_exitcode(status))
+            if time.monotonic() - started < WORKER_RESTART_BACKOFF_SECONDS:
+                time.sleep(WORKER_RESTART_BACKOFF_SECONDS)
+            if not self.stopping:
+                self.spawn(index)
+
+        logger.info("All workers stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--threads", type=int, default=WORKER_THREADS,
+                        help="inference threads per worker, 0 splits the cores evenly")
+    args = parser.parse_args()
+
+    sock = bind_socket(args.host, args.port)
+    threads = threads_per_worker(args.workers, args.threads)
+
+    # Loads the weights in the supervisor so the workers share them.
+    import main as app_module  # noqa: F401
+    from model_config import load_models
+    load_models()
+
+    # Objects alive now are never collected, so the collector of a worker
+    # does not write to, and so copy, the pages holding the weights.
+    gc.collect()
+    gc.freeze()
+
+    logger.info("Serving on %s:%s with %s workers", args.host, args.port, args.workers)
+    Supervisor(sock, args.workers, threads, args.host, args.port).run()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Per-connection drill state.
+"""
+
+import uuid
+
+from debug_sampler import DebugFrameSampler
+from estimator import StateEstimator
+from observations import ObservationRing
+from tracker import BallTracker
+from trajectory_recorder import TrajectoryRecorder
+from settings import OBSERVATION_DEPTH
+
+
+class DrillSession:
+    """
+    All of the state the drill state machines of counts.py carry from one
+    frame to the next. One instance is created per connection, so concurrent
+    athletes never share counts. Uses __slots__ to keep idle sessions small.
+    """
+
+    __slots__ = (
+        "session_id",
+        "debug_sampler",
+        "trajectory_recorder",
+        "ball_tracker",
+        "estimator",
+        "drill_type",
+        "prev_count",
+        "observations",
+        # Frames
+        "last_frame_count",
+        "frames_dropped",
+        "frames_skipped",
+        # Ball
+        "prev_ball_x",
+        "prev_ball_area",
+        # Right & left ankles
+        "prev_right_ankle_y",
+        "prev_left_ankle_y",
+        # Triggers
+        "prev_direction",
+        "prev_trigger_frame",
+        "prev_trigger_action",
+        "prev_trigger_x",
+        "pending_sides",
+        "prev_count_left",
+        "prev_count_right",
+        "prev_trigger_count",
+    )
+
+    def __init__(self, drill_type=None, observation_depth=OBSERVATION_DEPTH):
+        self.session_id = uuid.uuid4().hex[:12]
+        # None unless debug frame sampling is configured
+        self.debug_sampler = DebugFrameSampler.from_settings(self.session_id)
+        # None unless trajectory recording is configured
+        self.trajectory_recorder = TrajectoryRecorder.from_settings(self.session_id)
+        # None when the detector runs on every frame
+        self.ball_tracker = BallTracker.from_settings()
+        # None unless the drills run on filtered state
+        self.estimator = StateEstimator.from_settings()
+        self.drill_type = drill_type
+        self.observations = ObservationRing(observation_depth)
+        self.reset()
+
+    def reset(self):
+        """Return to the state of a freshly started drill."""
+        # Count last reported to the client
+        self.prev_count = 0
+
+        # Last frame that reached the trigger, frames dropped on ingestion and
+        # frame numbers the trigger never saw. Frame numbers are the client's,
+        # a dropped frame leaves a gap instead of being renumbered.
+        self.last_frame_count = None
+        self.frames_dropped = 0
+        self.frames_skipped = 0
+
+        self.prev_ball_x = None
+        self.prev_ball_area = None
+
+        self.prev_right_ankle_y = None
+        self.prev_left_ankle_y = None
+
+        self.prev_direction = -1
+        self.prev_trigger_frame = 0
+        # State of the drill, the last action it counted
+        self.prev_trigger_action = ""
+        self.prev_trigger_x = 0
+        # Sides whose guard held and that have not counted yet, see drills.Drill
+        self.pending_sides = set()
+        self.prev_count_left = 0
+        self.prev_count_right = 0
+        # Raw trigger count of the drill, scaled into prev_count by each drill
+        self.prev_trigger_count = 0
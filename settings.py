@@ -0,0 +1,146 @@
+"""
+Runtime settings of the server, each one can be overridden by an environment variable.
+"""
+
+import os
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return default if value in (None, "") else int(value)
+
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    return default if value in (None, "") else float(value)
+
+
+########## Inference ##########
+
+# Backend running the models, "torch" or "onnx", see backends.py. The ONNX
+# exports are cached in MODEL_CACHE_DIR. ONNX Runtime threads of one forward
+# pass and of independent graph branches, 0 lets ONNX Runtime choose.
+INFERENCE_BACKEND = os.environ.get("CV_BACKEND", "torch")
+DETECTION_WEIGHTS = os.environ.get("CV_DETECTION_WEIGHTS", "yolov8s.pt")
+POSE_WEIGHTS = os.environ.get("CV_POSE_WEIGHTS", "yolov8s-pose.pt")
+MODEL_CACHE_DIR = os.environ.get("CV_MODEL_CACHE_DIR", "models")
+ONNX_INTRA_OP_THREADS = _env_int("CV_ONNX_INTRA_OP_THREADS", 0)
+ONNX_INTER_OP_THREADS = _env_int("CV_ONNX_INTER_OP_THREADS", 0)
+# "fp32" or "int8", the INT8 models are made and promoted by quantize.py.
+ONNX_PRECISION = os.environ.get("CV_ONNX_PRECISION", "fp32")
+
+# Side of the square the models letterbox their input to, frames are decoded
+# at the smallest JPEG scale that still covers it.
+INFERENCE_SIZE = _env_int("CV_INFERENCE_SIZE", 640)
+# Inference profile of a drill instead of its default, as
+# "drill=profile,drill=profile", see profiles.py.
+DRILL_PROFILES = os.environ.get("CV_DRILL_PROFILES", "")
+
+# Once a session has seen the ball and both ankles, pose runs on a crop around
+# them at POSE_ROI_SIZE instead of the full frame. POSE_ROI_PADDING is added on
+# each side of the crop, as a fraction of its largest side.
+POSE_ROI = _env_int("CV_POSE_ROI", 1) != 0
+POSE_ROI_SIZE = _env_int("CV_POSE_ROI_SIZE", 320)
+POSE_ROI_PADDING = _env_float("CV_POSE_ROI_PADDING", 0.5)
+
+# Between detector keyframes the ball is tracked, see tracker.py. The detector
+# runs every KEYFRAME_INTERVAL frames, or when the template match score of the
+# tracker falls below TRACKER_MIN_CONFIDENCE. The tracker searches a window
+# TRACKER_SEARCH_SCALE times the size of the ball around its predicted position.
+BALL_TRACKING = _env_int("CV_BALL_TRACKING", 1) != 0
+KEYFRAME_INTERVAL = _env_int("CV_KEYFRAME_INTERVAL", 5)
+TRACKER_MIN_CONFIDENCE = _env_float("CV_TRACKER_MIN_CONFIDENCE", 0.6)
+TRACKER_SEARCH_SCALE = _env_float("CV_TRACKER_SEARCH_SCALE", 3.0)
+
+# Filter the ball and the ankles of each session before the drills see them,
+# see estimator.py. Dropouts up to ESTIMATOR_MAX_PREDICTED_FRAMES frames are
+# filled with the prediction and the drills read directions from velocities.
+STATE_ESTIMATION = _env_int("CV_STATE_ESTIMATION", 0) != 0
+ESTIMATOR_MAX_PREDICTED_FRAMES = _env_int("CV_ESTIMATOR_MAX_PREDICTED_FRAMES", 5)
+
+# Forward passes of blank frames at each input shape before a worker reports
+# ready on /readyz, 0 reports ready as soon as the models are loaded.
+WARMUP_ITERATIONS = _env_int("CV_WARMUP_ITERATIONS", 2)
+
+########## Inference batching ##########
+
+# A batch is flushed as soon as it holds MAX_BATCH_SIZE frames or its oldest
+# frame has waited MAX_BATCH_WAIT_MS.
+MAX_BATCH_SIZE = _env_int("CV_MAX_BATCH_SIZE", 8)
+MAX_BATCH_WAIT_MS = _env_float("CV_MAX_BATCH_WAIT_MS", 15.0)
+# Frames waiting for a batch, submitters wait once it is full.
+MAX_QUEUE_DEPTH = _env_int("CV_MAX_QUEUE_DEPTH", 64)
+
+########## Frame pipeline ##########
+
+# Worker threads of each stage. Inference workers run detection and pose of a batch.
+DECODE_WORKERS = _env_int("CV_DECODE_WORKERS", 2)
+INFERENCE_WORKERS = _env_int("CV_INFERENCE_WORKERS", 2)
+TRIGGER_WORKERS = _env_int("CV_TRIGGER_WORKERS", 1)
+# Frames admitted into each stage at once, later frames wait for a slot.
+DECODE_QUEUE_DEPTH = _env_int("CV_DECODE_QUEUE_DEPTH", 8)
+INFERENCE_QUEUE_DEPTH = _env_int("CV_INFERENCE_QUEUE_DEPTH", MAX_QUEUE_DEPTH)
+TRIGGER_QUEUE_DEPTH = _env_int("CV_TRIGGER_QUEUE_DEPTH", 32)
+
+########## Ingestion ##########
+
+# Frames received from one connection but not yet processed, when full the
+# oldest one is replaced by the newest.
+SESSION_QUEUE_DEPTH = _env_int("CV_SESSION_QUEUE_DEPTH", 1)
+# Frames that waited longer than this in the session queue are skipped, 0 disables.
+MAX_FRAME_AGE_MS = _env_float("CV_MAX_FRAME_AGE_MS", 500.0)
+
+########## Sessions ##########
+
+# Frames of detection and pose results kept per session for the triggers and analytics.
+OBSERVATION_DEPTH = _env_int("CV_OBSERVATION_DEPTH", 256)
+
+########## Debug frames ##########
+
+# Keep one in every DEBUG_SAMPLE_EVERY_N frames and/or one frame every
+# DEBUG_SAMPLE_EVERY_SECONDS per session, sampling is off when both are 0.
+DEBUG_SAMPLE_EVERY_N = _env_int("CV_DEBUG_SAMPLE_EVERY_N", 0)
+DEBUG_SAMPLE_EVERY_SECONDS = _env_float("CV_DEBUG_SAMPLE_EVERY_SECONDS", 0.0)
+DEBUG_FRAME_DIR = os.environ.get("CV_DEBUG_FRAME_DIR", "debug_frames")
+# Sampled frames waiting to be written, further samples are dropped.
+DEBUG_QUEUE_DEPTH = _env_int("CV_DEBUG_QUEUE_DEPTH", 8)
+DEBUG_MAX_BYTES_PER_SESSION = _env_int("CV_DEBUG_MAX_BYTES_PER_SESSION", 50 * 1024 * 1024)
+
+########## Trajectory recording ##########
+
+# Write the ball and keypoints of every frame of every session to
+# TRAJECTORY_DIR/<session id>/ in chunks of TRAJECTORY_CHUNK_FRAMES frames,
+# see trajectory_recorder.py. Recording is off when TRAJECTORY_DIR is empty.
+TRAJECTORY_DIR = os.environ.get("CV_TRAJECTORY_DIR", "")
+TRAJECTORY_CHUNK_FRAMES = _env_int("CV_TRAJECTORY_CHUNK_FRAMES", 1024)
+# Chunks waiting to be written, further chunks are dropped.
+TRAJECTORY_QUEUE_DEPTH = _env_int("CV_TRAJECTORY_QUEUE_DEPTH", 16)
+
+########## Logging ##########
+
+# One log file, rotated into LOG_FILE.1 ... LOG_FILE.<LOG_BACKUP_COUNT> at LOG_MAX_BYTES.
+LOG_DIR = os.environ.get("CV_LOG_DIR", "logs")
+LOG_FILE = os.environ.get("CV_LOG_FILE", "server.log")
+LOG_LEVEL = os.environ.get("CV_LOG_LEVEL", "INFO")
+LOG_MAX_BYTES = _env_int("CV_LOG_MAX_BYTES", 10 * 1024 * 1024)
+LOG_BACKUP_COUNT = _env_int("CV_LOG_BACKUP_COUNT", 5)
+# Per-frame messages are logged for one in every FRAME_LOG_EVERY_N frames and
+# for triggers and errors, FRAME_LOGGING=0 removes them entirely.
+FRAME_LOGGING = _env_int("CV_FRAME_LOGGING", 1) != 0
+FRAME_LOG_EVERY_N = max(_env_int("CV_FRAME_LOG_EVERY_N", 30), 1)
+
+########## Multi-process serving ##########
+
+# Worker processes forked by serve.py, and the inference threads of each,
+# 0 splits the cores of the machine evenly between the workers.
+WORKERS = _env_int("CV_WORKERS", 1)
+WORKER_THREADS = _env_int("CV_WORKER_THREADS", 0)
+# "parallel" runs detection and pose of a batch side by side, each on half of
+# the cores of the worker, "sequential" one after the other on all of them,
+# "auto" times both at startup, see planner.py. CPU_AFFINITY pins each worker,
+# and with the onnx backend each model, to its cores.
+CONCURRENCY_MODE = os.environ.get("CV_CONCURRENCY_MODE", "auto")
+CONCURRENCY_BENCHMARK_ITERATIONS = _env_int("CV_CONCURRENCY_BENCHMARK_ITERATIONS", 3)
+CPU_AFFINITY = _env_int("CV_CPU_AFFINITY", 0) != 0
+# A worker that crashes sooner than this after being started is restarted after a pause.
+WORKER_RESTART_BACKOFF_SECONDS = _env_float("CV_WORKER_RESTART_BACKOFF_SECONDS", 1.0)
@@ -0,0 +1,40 @@
+"""
+The offline replay counts as the streaming path, on the synthetic sessions of
+bench_replay.py: the count reported after every frame is the same, with and
+without state estimation, and every drill counts reps on its drill sessions.
+
+    python -m pytest test_replay.py
+"""
+
+import logging
+
+import numpy as np
+import pytest
+
+from bench_replay import drill_session, noise_session, stream
+from counts import DRILLS
+from replay import Trajectory, estimate, replay
+
+FRAMES = 1500
+SESSIONS = 2
+
+# The log records of every count
+logging.getLogger("trigger").setLevel(logging.WARNING)
+
+
+@pytest.mark.parametrize("estimation", [False, True], ids=["raw", "estimated"])
+@pytest.mark.parametrize("drill_type", sorted(DRILLS))
+def test_replay_counts_as_streamed(drill_type, estimation):
+    rng = np.random.default_rng(0)
+    for make in (drill_session, noise_session):
+        for _ in range(SESSIONS):
+            trajectory = Trajectory(*make(rng, FRAMES, drill_type))
+            streamed, _ = stream(drill_type, trajectory, estimation)
+            result = replay(DRILLS[drill_type], estimate(trajectory) if estimation else trajectory)
+
+            mismatch = np.flatnonzero(streamed != result.counts)
+            assert not len(mismatch), (f"{make.__name__} frame {trajectory.frame_counts[mismatch[0]]}: streamed "
+                                       f"{streamed[mismatch[0]]}, replayed {result.counts[mismatch[0]]}")
+            # Matching counts of a session where nothing counts prove little
+            if make is drill_session:
+                assert result.final_count > 0
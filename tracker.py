@@ -0,0 +1,129 @@
+"""
+Ball tracking between detector keyframes.
+
+The detector runs on a keyframe, then the ball is followed on the frames in
+between: a constant-velocity Kalman filter predicts where it is, and the
+template cut from the last detection is matched inside a search window
+around that prediction. The detector runs again every KEYFRAME_INTERVAL
+frames, or on the frame where the match score drops below
+TRACKER_MIN_CONFIDENCE.
+"""
+
+import cv2
+
+from kalman import ConstantVelocityKalman
+from settings import BALL_TRACKING, KEYFRAME_INTERVAL, TRACKER_MIN_CONFIDENCE, TRACKER_SEARCH_SCALE
+
+# Standard deviations in pixels of a measured ball centre, and of the change
+# of its velocity from one frame to the next.
+MEASUREMENT_NOISE = 2.0
+ACCELERATION_NOISE = 8.0
+# Boxes smaller than this in pixels are too small to match reliably
+MIN_TEMPLATE_SIZE = 4
+
+
+class BallTracker:
+    """Keyframe policy and tracking of the ball of one session."""
+
+    __slots__ = ("keyframe_interval", "min_confidence", "search_scale", "kalman", "template",
+                 "box_size", "frame_shape", "last_frame", "predicted_frame", "since_keyframe", "confidence")
+
+    def __init__(self, keyframe_interval=KEYFRAME_INTERVAL, min_confidence=TRACKER_MIN_CONFIDENCE,
+                 search_scale=TRACKER_SEARCH_SCALE):
+        self.keyframe_interval = keyframe_interval
+        self.min_confidence = min_confidence
+        self.search_scale = search_scale
+        self.reset()
+
+    @classmethod
+    def from_settings(cls):
+        """A tracker configured from settings, or None when the detector runs on every frame."""
+        if not BALL_TRACKING or KEYFRAME_INTERVAL <= 1:
+            return None
+        return cls()
+
+    def reset(self):
+        self.kalman = None
+        self.template = None
+        self.box_size = None
+        self.frame_shape = None
+        self.last_frame = None
+        self.predicted_frame = None
+        self.since_keyframe = 0
+        self.confidence = 0.0
+
+    def track(self, frame, frame_count):
+        """
+        Follow the ball onto a frame, unless the detector is due on it.
+        Args:
+            frame (np.array): Decoded BGR frame.
+            frame_count (int): Client frame number.
+        Returns:
+            list: Normalised [x, y, w, h] of the ball, or None if the frame is
+                  a keyframe and the detector has to run on it.
+        """
+        if self.template is None or self.since_keyframe + 1 >= self.keyframe_interval:
+            return None
+        height, width = frame.shape[:2]
+        dt = frame_count - self.last_frame
+        if dt <= 0 or (height, width) != self.frame_shape:
+            return None
+
+        cx, cy = self.kalman.predict(dt)
+        self.predicted_frame = frame_count
+
+        template_height, template_width = self.template.shape
+        half_width = self.search_scale * template_width / 2
+        half_height = self.search_scale * template_height / 2
+        x0, y0 = max(int(cx - half_width), 0), max(int(cy - half_height), 0)
+        x1, y1 = min(int(cx + half_width) + 1, width), min(int(cy + half_height) + 1, height)
+        if x1 - x0 < template_width or y1 - y0 < template_height:
+            self.confidence = 0.0
+            return None
+
+        window = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+        scores = cv2.matchTemplate(window, self.template, cv2.TM_CCOEFF_NORMED)
+        _, self.confidence, _, (mx, my) = cv2.minMaxLoc(scores)
+        # Also rejects NaN, the score of a flat template
+        if not self.confidence >= self.min_confidence:
+            return None
+
+        cx, cy = self.kalman.update(x0 + mx + template_width / 2, y0 + my + template_height / 2)
+        self.last_frame = frame_count
+        self.since_keyframe += 1
+        return [cx / width, cy / height, self.box_size[0] / width, self.box_size[1] / height]
+
+    def update(self, frame, ball, frame_count):
+        """
+        Start over from the detection of a keyframe.
+        Args:
+            frame (np.array): Decoded BGR frame the detector ran on.
+            ball (list): Normalised [x, y, w, h] of the ball, None values if it was not found.
+            frame_count (int): Client frame number.
+        """
+        if ball[0] is None:
+            self.reset()
+            return
+
+        height, width = frame.shape[:2]
+        cx, cy, box_width, box_height = ball[0] * width, ball[1] * height, ball[2] * width, ball[3] * height
+        x0, y0 = max(int(round(cx - box_width / 2)), 0), max(int(round(cy - box_height / 2)), 0)
+        x1, y1 = min(int(round(cx + box_width / 2)), width), min(int(round(cy + box_height / 2)), height)
+        if x1 - x0 < MIN_TEMPLATE_SIZE or y1 - y0 < MIN_TEMPLATE_SIZE:
+            self.reset()
+            return
+
+        self.template = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+        if self.kalman is None or (height, width) != self.frame_shape or frame_count <= self.last_frame:
+            self.kalman = ConstantVelocityKalman(cx, cy, MEASUREMENT_NOISE, ACCELERATION_NOISE)
+        else:
+            if self.predicted_frame != frame_count:
+                self.kalman.predict(frame_count - self.last_frame)
+            self.kalman.update(cx, cy)
+
+        self.box_size = (box_width, box_height)
+        self.frame_shape = (height, width)
+        self.last_frame = frame_count
+        self.predicted_frame = frame_count
+        self.since_keyframe = 0
+        self.confidence = 1.0
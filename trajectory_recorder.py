@@ -0,0 +1,209 @@
+"""
+Append-only columnar recording of the observations of every frame of a session.
+
+The request path copies each observation into a row of preallocated column
+buffers. Every TRAJECTORY_CHUNK_FRAMES frames the full buffers are handed to
+one background thread, which writes each column of the chunk as a .npy
+file and then appends a line describing the chunk to index.jsonl:
+
+    trajectories/<session id>/
+        index.jsonl                 {"chunk": 0, "rows": 1024, "first_frame": 0, "last_frame": 1031, ...}
+        frame_count.000000.npy      (rows,) int64
+        ball.000000.npy             (rows, 4) float32
+        ...
+
+A chunk is only listed once all its files are written, so a session cut
+short leaves the chunks before it readable. Like the debug sampler, the
+writer's queue is bounded and chunks are dropped when it is full, a slow
+disk never slows down frame processing. TrajectoryRecording reads the
+columns back memory mapped.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+
+import numpy as np
+
+from observations import NUM_KEYPOINTS, R_ANKLE, L_ANKLE
+from replay import Trajectory
+from settings import TRAJECTORY_DIR, TRAJECTORY_CHUNK_FRAMES, TRAJECTORY_QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.jsonl"
+
+# Column -> (dtype, shape of one row)
+COLUMNS = {
+    "frame_count": (np.int64, ()),
+    "ball": (np.float32, (4,)),
+    "ball_confidence": (np.float32, ()),
+    "keypoints": (np.float32, (NUM_KEYPOINTS, 2)),
+    "keypoint_confidence": (np.float32, (NUM_KEYPOINTS,)),
+    # Whether the ball was tracked rather than detected
+    "tracked": (np.bool_, ()),
+}
+
+
+def _column_path(directory, name, chunk):
+    return os.path.join(directory, f"{name}.{chunk:06d}.npy")
+
+
+class ChunkWriter:
+    """Background thread writing full chunks."""
+
+    def __init__(self, max_queue=TRAJECTORY_QUEUE_DEPTH):
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def submit(self, recorder, chunk, columns, entry):
+        """Queue a chunk for writing, returns False if it was dropped."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trajectory-chunks", daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait((recorder, chunk, columns, entry))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _run(self):
+        while True:
+            recorder, chunk, columns, entry = self._queue.get()
+            try:
+                recorder.write(chunk, columns, entry)
+            except Exception as e:
+                logger.error("Error writing trajectory chunk: %s", e)
+
+
+writer = ChunkWriter()
+
+
+class TrajectoryRecorder:
+    """Buffers the observations of one session and hands full chunks to the writer."""
+
+    __slots__ = ("directory", "chunk_frames", "columns", "rows", "chunks", "drill_type", "written", "dropped")
+
+    def __init__(self, session_id, output_dir=TRAJECTORY_DIR, chunk_frames=TRAJECTORY_CHUNK_FRAMES):
+        if chunk_frames < 1:
+            raise ValueError("chunk_frames must be at least 1")
+        self.directory = os.path.join(output_dir, session_id)
+        self.chunk_frames = chunk_frames
+        self.columns = self._buffers()
+        # Rows filled in the current chunk, and chunks handed to the writer
+        self.rows = 0
+        self.chunks = 0
+        self.drill_type = None
+        self.written = 0
+        self.dropped = 0
+
+    @classmethod
+    def from_settings(cls, session_id):
+        """A recorder configured from settings, or None when recording is off."""
+        if not TRAJECTORY_DIR:
+            return None
+        return cls(session_id)
+
+    def _buffers(self):
+        return {name: np.empty((self.chunk_frames, *shape), dtype=dtype) for name, (dtype, shape) in COLUMNS.items()}
+
+    def append(self, frame_count, observation, drill_type=None):
+        """
+        Called for every frame, copies its observation into the current chunk.
+        Args:
+            frame_count (int): Client frame number.
+            observation (FrameObservation): Ball and keypoints of the frame.
+            drill_type (str): Drill being performed, kept in the index of the chunk.
+        """
+        row, columns = self.rows, self.columns
+        columns["frame_count"][row] = frame_count
+        columns["ball"][row] = observation.ball
+        columns["ball_confidence"][row] = observation.ball_confidence
+        columns["keypoints"][row] = observation.keypoints
+        columns["keypoint_confidence"][row] = observation.keypoint_confidence
+        columns["tracked"][row] = observation.source == "tracked"
+        if drill_type is not None:
+            self.drill_type = drill_type
+        self.rows = row + 1
+        if self.rows == self.chunk_frames:
+            self.flush()
+
+    def flush(self):
+        """Hand the rows buffered so far to the writer as a chunk."""
+        if self.rows == 0:
+            return
+        rows, columns = self.rows, self.columns
+        entry = {"chunk": self.chunks, "rows": rows, "first_frame": int(columns["frame_count"][0]),
+                 "last_frame": int(columns["frame_count"][rows - 1]), "drill_type": self.drill_type}
+        chunk = {name: values[:rows] for name, values in columns.items()}
+        if not writer.submit(self, self.chunks, chunk, entry):
+            self.dropped += 1
+            logger.warning("Dropped trajectory chunk %d of %s, the writer is behind", self.chunks, self.directory)
+        self.chunks += 1
+        # The submitted buffers belong to the writer now
+        self.columns = self._buffers()
+        self.rows = 0
+
+    def close(self):
+        """Write the last, partial chunk, at the end of the session."""
+        self.flush()
+
+    def write(self, chunk, columns, entry):
+        """Write the columns of a chunk and list it in the index, runs on the writer thread."""
+        os.makedirs(self.directory, exist_ok=True)
+        for name, values in columns.items():
+            np.save(_column_path(self.directory, name, chunk), values)
+        with open(os.path.join(self.directory, INDEX_FILE), "a") as file:
+            file.write(json.dumps(entry) + "\n")
+        self.written += 1
+
+
+class TrajectoryRecording:
+    """
+    The chunks of a recorded session, read memory mapped.
+    Args:
+        directory (str): Directory a TrajectoryRecorder wrote, holding index.jsonl.
+    """
+
+    __slots__ = ("directory", "entries")
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, INDEX_FILE)) as file:
+            entries = [json.loads(line) for line in file if line.strip()]
+        # The writer lists chunks as they are written, in order unless one was dropped
+        self.entries = sorted(entries, key=lambda entry: entry["chunk"])
+
+    def __len__(self):
+        return sum(entry["rows"] for entry in self.entries)
+
+    @property
+    def drill_type(self):
+        return self.entries[-1]["drill_type"] if self.entries else None
+
+    def chunks(self, name):
+        """The memory mapped arrays of a column, one per chunk."""
+        if name not in COLUMNS:
+            raise KeyError(f"Unknown column {name!r}, expected one of {sorted(COLUMNS)}")
+        return [np.load(_column_path(self.directory, name, entry["chunk"]), mmap_mode="r")
+                for entry in self.entries]
+
+    def column(self, name):
+        """A column over the whole session, memory mapped when it was written as a single chunk."""
+        chunks = self.chunks(name)
+        if len(chunks) == 1:
+            return chunks[0]
+        dtype, shape = COLUMNS[name]
+        return np.concatenate(chunks) if chunks else np.empty((0, *shape), dtype=dtype)
+
+    def trajectory(self):
+        """The ball and ankles of the session, as replay.Trajectory."""
+        keypoints = self.column("keypoints")
+        return Trajectory(self.column("frame_count"), self.column("ball"), keypoints[:, R_ANKLE],
+                          keypoints[:, L_ANKLE])
@@ -1,53 +1,40 @@
-from counts import (
-    toe_tap_trigger, push_pull_trigger, push_pull_left_trigger, 
-    push_pull_right_trigger, inside_tap_trigger, inside_outside_right_trigger, 
-    inside_outside_left_trigger, v_push_pull_trigger, roll_across_trigger
-)
+from log import logging, log_frame
+from counts import DRILLS
 
-# temp__ = [
-#     {
-#         "type": "toe",
-#         "func": toe_tap_trigger
-#     }
-# ]
-prev_count = 0
+logger = logging.getLogger(__name__)
 
 
-def get_trigger(drill_type, detection_results_dict, pose_results_dict, frame_count):
+def get_trigger(session, drill_type, frame_count):
+    """
+    Run the trigger of `drill_type` for one frame of a session.
+    Args:
+        session (DrillSession): Trigger state of the connection.
+        drill_type (str): Drill being performed.
+        frame_count (int): Frame to evaluate, its results must be in session.observations.
+    Returns:
+        tuple: A tuple of (count, trigger).
+    """
+    # Frames dropped before inference show up as a gap in the client's frame
+    # numbers, the triggers debounce on those numbers so the gap counts as time.
+    if session.last_frame_count is not None and frame_count > session.last_frame_count + 1:
+        session.frames_skipped += frame_count - session.last_frame_count - 1
+    session.last_frame_count = frame_count
 
-    global prev_count    
-    if frame_count in detection_results_dict and frame_count in pose_results_dict:
-        merged_data = {
-            'frame_count': frame_count,
-            'detection': detection_results_dict[frame_count],
-            'pose': pose_results_dict[frame_count]
-        }
-
-        if drill_type == "toe_taps":
-            count, trigger = toe_tap_trigger(merged_data, frame_count)
-        elif drill_type == "push_pull":
-            count, trigger = push_pull_trigger(merged_data, frame_count)
-        elif drill_type == "push_pull_left":
-            count, trigger = push_pull_left_trigger(merged_data, frame_count)
-        elif drill_type == "push_pull_right":
-            count, trigger = push_pull_right_trigger(merged_data, frame_count)
-        elif drill_type == "inside_taps":
-            count, trigger = inside_tap_trigger(merged_data, frame_count)
-        elif drill_type == "inside_outside_right":
-            count, trigger = inside_outside_right_trigger(merged_data, frame_count)
-        elif drill_type == "inside_outside_left":
-            count, trigger = inside_outside_left_trigger(merged_data, frame_count)
-        elif drill_type == "v_push_pull":
-            count, trigger = v_push_pull_trigger(merged_data, frame_count)
-        elif drill_type == "roll_across":
-            count, trigger = roll_across_trigger(merged_data, frame_count)
+    observation = session.observations.get(frame_count)
+    if observation is not None:
+        drill = DRILLS.get(drill_type)
+        if drill is not None:
+            count, trigger = drill.step(session, observation, frame_count)
         else:
             count, trigger = 0, False
 
+        # Always log the frames that change the count
+        counted = count > 0 and count != session.prev_count
         if count > 0:
-            prev_count = count    
+            session.prev_count = count    
 
-        print(f"Count is {prev_count} Trigger is {trigger} Frame Count is {frame_count}")
-        return prev_count, trigger
+        log_frame(logger, frame_count, "Count is %s Trigger is %s Frame Count is %s",
+                  session.prev_count, trigger, frame_count, force=trigger or counted)
+        return session.prev_count, trigger
    
-    return prev_count, False
+    return session.prev_count, False
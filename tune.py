@@ -0,0 +1,350 @@
+"""
+Sweep of the drill constants of counts.py over recorded, count-labelled sessions.
+
+    python tune.py recordings/ --param TOE_TAP_REACH=0.6:1.4:0.1 --param SIDE_VIEW_FRAME_THRESHOLD=6,9,12,15
+    python tune.py recordings/ --random 5000 --param PUSH_PULL_REACH=0.4:1.0 --workers 8
+
+1. The ball and ankles of every frame of a session are found once, by the
+   models with the inference profile of its drill, and kept in
+   trajectory.npz in the session directory. Later sweeps read them from
+   there, --refresh finds them again.
+2. Each drill with sessions is tuned on the constants of PARAMETERS that
+   change it. Every configuration is counted over all the sessions of the
+   drill with replay.replay, in a pool of processes. Each worker computes
+   the features of a session that do not depend on the constants once.
+3. A configuration is scored by its mean absolute count error against the
+   "count" of meta.json, and by the precision of its timing: the share of
+   the reps it counted within --tolerance frames of a rep of the session.
+   Timing is only scored over the sessions with "rep_frames" in their
+   meta.json, see recordings.py, and printed as n/a for a drill without any.
+4. The configurations no other one beats on both scores, the Pareto front,
+   are printed for each drill along with the current constants. Without
+   timing the front is the configuration with the lowest count error.
+
+Values are a comma separated list, or lo:hi:step for a grid. With --random
+configurations are drawn from the lists, or uniformly from lo:hi. Without
+--param every constant is swept over SPAN around its current value. State
+estimation is used as CV_STATE_ESTIMATION sets it for the server.
+"""
+
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+
+import counts
+from counts import DRILLS
+from model_config import detections_from_output, load_models, poses_from_output, preprocess_batch
+from observations import R_ANKLE, L_ANKLE
+from preprocess import decode_to_target
+from profiles import profile_for
+from recordings import load_sessions
+from replay import FeatureSeries, Trajectory, estimate, replay
+from settings import STATE_ESTIMATION
+
+TRAJECTORY_FILE = "trajectory.npz"
+
+# Constants of counts.py the sweep changes, with the drills each one changes
+PARAMETERS = {
+    "TOE_TAP_REACH": ("toe_taps",),
+    "PUSH_PULL_REACH": ("push_pull",),
+    "SIDE_VIEW_FRAME_THRESHOLD": ("toe_taps", "push_pull"),
+    "ROLL_ACROSS_FRAME_THRESHOLD": ("roll_across",),
+    "BALL_MOVEMENT_DIVISOR_INSIDE_OUTSIDE": ("inside_outside_right",),
+}
+# Read when the drills are declared, so set on the drills as Drill.frame_threshold too
+FRAME_THRESHOLDS = ("SIDE_VIEW_FRAME_THRESHOLD", "ROLL_ACROSS_FRAME_THRESHOLD")
+
+# Default sweep of a constant, its value times 1 - SPAN to 1 + SPAN in STEPS steps
+SPAN = 0.5
+STEPS = 11
+
+
+class TuningSession:
+    """The trajectory of a recorded session and what it is scored against."""
+
+    __slots__ = ("name", "drill_type", "trajectory", "count", "rep_frames", "features")
+
+    def __init__(self, name, drill_type, trajectory, count, rep_frames):
+        self.name = name
+        self.drill_type = drill_type
+        self.trajectory = trajectory
+        self.count = count
+        self.rep_frames = rep_frames
+        self.features = None
+
+
+def extract_trajectory(backend, recorded):
+    """Ball boxes and ankles of every frame of a recorded session, as the server finds them."""
+    profile = profile_for(recorded.drill_type)
+    balls, ankles = [], []
+    for _, jpeg in recorded.frames():
+        frame, _ = decode_to_target(jpeg, profile.decode_size)
+        batch = preprocess_batch([frame], profile.detection.imgsz)
+        ball, _ = detections_from_output(backend.detect(batch.images), batch, backend.detection_classes,
+                                         profile.detection)
+        if profile.pose.imgsz != profile.detection.imgsz:
+            batch = preprocess_batch([frame], profile.pose.imgsz)
+        keypoints, _ = poses_from_output(backend.pose(batch.images), batch, backend.pose_classes,
+                                         backend.kpt_shape, profile.pose)
+        balls.append(ball[0])
+        ankles.append(keypoints[0, [R_ANKLE, L_ANKLE]])
+    ankles = np.array(ankles, dtype=np.float32).reshape(-1, 2, 2)
+    return Trajectory(recorded.frame_counts, np.array(balls, dtype=np.float32).reshape(-1, 4),
+                      ankles[:, 0], ankles[:, 1])
+
+
+def rep_frames(trajectory, result):
+    """Frame numbers the count of a replay went up on."""
+    went_up = np.diff(result.counts, prepend=0) > 0
+    return trajectory.frame_counts[went_up]
+
+
+def load_tuning_sessions(paths, refresh):
+    """
+    The labelled sessions of the paths, grouped by drill, finding the
+    trajectories of those without a trajectory.npz.
+    """
+    backend = None
+    by_drill = {}
+    for recorded in load_sessions(paths):
+        if recorded.count is None:
+            print(f"Skipping {recorded.name}, its meta.json has no count")
+            continue
+        if recorded.drill_type not in DRILLS:
+            print(f"Skipping {recorded.name}, unknown drill {recorded.drill_type}")
+            continue
+        path = os.path.join(recorded.path, TRAJECTORY_FILE)
+        if refresh or not os.path.exists(path):
+            if backend is None:
+                backend = load_models()
+            started = time.perf_counter()
+            extract_trajectory(backend, recorded).save(path)
+            print(f"Found the trajectory of {recorded.name} in {time.perf_counter() - started:.1f}s")
+        trajectory = Trajectory.load(path)
+        if STATE_ESTIMATION:
+            trajectory = estimate(trajectory)
+
+        reps = None if recorded.rep_frames is None else sorted(recorded.rep_frames)
+        by_drill.setdefault(recorded.drill_type, []).append(
+            TuningSession(recorded.name, recorded.drill_type, trajectory, recorded.count, reps))
+    return by_drill
+
+
+def parse_values(name, spec, random):
+    """Values of a constant from the --param spec, (lo, hi) for a uniform draw with --random."""
+    integer = isinstance(getattr(counts, name), int)
+    kind = int if integer else float
+    if ":" not in spec:
+        return [kind(value) for value in spec.split(",")]
+    bounds = [float(value) for value in spec.split(":")]
+    if len(bounds) == 2 and random:
+        return tuple(bounds)
+    if len(bounds) != 3:
+        raise ValueError(f"{name}: expected lo:hi:step, got {spec!r}")
+    lo, hi, step = bounds
+    # Inclusive of hi despite rounding
+    values = np.arange(lo, hi + step / 2, step)
+    return sorted({kind(round(value)) if integer else round(float(value), 6) for value in values})
+
+
+def default_values(name):
+    """SPAN around the current value of a constant."""
+    current = getattr(counts, name)
+    values = np.linspace(current * (1 - SPAN), current * (1 + SPAN), STEPS)
+    if isinstance(current, int):
+        return sorted({max(int(round(value)), 1) for value in values})
+    return sorted({round(float(value), 6) for value in values})
+
+
+def configurations(space, random, rng):
+    """
+    Configurations of a space, all of them or `random` draws.
+    Args:
+        space (dict): Constant -> list of values, or (lo, hi) to draw uniformly from.
+        random (int): Number of configurations to draw, 0 for the whole grid.
+        rng (np.random.Generator): Random draws.
+    Returns:
+        list[tuple]: ((constant, value), ...) of each configuration, the current constants first.
+    """
+    names = sorted(space)
+    current = tuple((name, getattr(counts, name)) for name in names)
+    if random:
+        drawn = []
+        for _ in range(random):
+            config = []
+            for name in names:
+                values = space[name]
+                if isinstance(values, tuple):
+                    value = rng.uniform(*values)
+                    value = int(round(value)) if isinstance(getattr(counts, name), int) else round(value, 3)
+                else:
+                    value = values[rng.integers(len(values))]
+                config.append((name, value))
+            drawn.append(tuple(config))
+    else:
+        drawn = [tuple(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+    # Unique, in the order drawn
+    return list(dict.fromkeys([current, *drawn]))
+
+
+def apply(drill_type, config):
+    """
+    Set the constants of a configuration for a drill.
+    Returns:
+        tuple: The configuration the constants had before, to apply again to restore them.
+    """
+    previous = tuple((name, getattr(counts, name)) for name, _ in config)
+    for name, value in config:
+        setattr(counts, name, value)
+        if name in FRAME_THRESHOLDS:
+            DRILLS[drill_type].frame_threshold = value
+    return previous
+
+
+def match_reps(counted, expected, tolerance):
+    """Reps counted within tolerance frames of an expected one, each matched once, and their mean offset."""
+    matched, offsets = 0, 0
+    j = 0
+    for frame in counted.tolist():
+        while j < len(expected) and expected[j] < frame - tolerance:
+            j += 1
+        if j < len(expected) and expected[j] <= frame + tolerance:
+            matched += 1
+            offsets += abs(frame - expected[j])
+            j += 1
+    return matched, offsets
+
+
+# The sessions of the drills, set in each worker of the pool
+_sessions = None
+
+
+def _init_worker(by_drill):
+    global _sessions
+    _sessions = by_drill
+
+
+def evaluate(drill_type, tolerance, config):
+    """
+    Scores of a configuration over the sessions of a drill. The constants
+    are restored afterwards, as the features of the sessions are only
+    computed once.
+    Returns:
+        tuple: (config, mean absolute count error, timing precision, mean offset of the matched reps in frames),
+            precision and offset None when no session of the drill has labelled reps.
+    """
+    drill = DRILLS[drill_type]
+    error = counted = matched = offsets = labelled = 0
+    previous = apply(drill_type, config)
+    try:
+        for session in _sessions[drill_type]:
+            if session.features is None:
+                session.features = FeatureSeries(drill, session.trajectory)
+            result = replay(drill, session.trajectory, session.features)
+            error += abs(result.final_count - session.count)
+            if session.rep_frames is None:
+                continue
+            reps = rep_frames(session.trajectory, result)
+            hits, offset = match_reps(reps, session.rep_frames, tolerance)
+            labelled += 1
+            counted += len(reps)
+            matched += hits
+            offsets += offset
+    finally:
+        apply(drill_type, previous)
+    error /= len(_sessions[drill_type])
+    if not labelled:
+        return config, error, None, None
+    precision = matched / counted if counted else 0.0
+    return config, error, precision, offsets / matched if matched else 0.0
+
+
+def pareto_front(scores):
+    """
+    Scores no other one has a lower count error and a higher precision than,
+    by count error. Without a precision only the lowest count error is kept.
+    """
+    def precision(score):
+        return -1.0 if score[2] is None else score[2]
+
+    front = []
+    best_precision = -2.0
+    for score in sorted(scores, key=lambda score: (score[1], -precision(score), score[3] or 0.0)):
+        if precision(score) > best_precision:
+            front.append(score)
+            best_precision = precision(score)
+    return front
+
+
+def format_timing(precision, offset):
+    """Precision and offset columns of a score, n/a without labelled reps."""
+    if precision is None:
+        return f"{'n/a':>11}{'n/a':>8}"
+    return f"{precision:>11.2f}{offset:>8.1f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sessions", nargs="+", help="recorded sessions, or directories of them")
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=VALUES",
+                        help=f"values of a constant, one of {', '.join(PARAMETERS)}")
+    parser.add_argument("--random", type=int, default=0, help="configurations to draw, 0 sweeps the whole grid")
+    parser.add_argument("--tolerance", type=int, default=5, help="frames a rep may be counted off by")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--refresh", action="store_true", help="find the trajectories of all sessions again")
+    args = parser.parse_args()
+
+    for name in FRAME_THRESHOLDS:
+        for drill_type in PARAMETERS[name]:
+            if DRILLS[drill_type].frame_threshold != getattr(counts, name):
+                raise SystemExit(f"{drill_type} is not declared with frame_threshold={name}, update PARAMETERS")
+    space = {}
+    for param in args.param:
+        name, _, spec = param.partition("=")
+        if name not in PARAMETERS:
+            raise SystemExit(f"Unknown constant {name}, expected one of {', '.join(PARAMETERS)}")
+        space[name] = parse_values(name, spec, args.random)
+
+    by_drill = load_tuning_sessions(args.sessions, args.refresh)
+    if not by_drill:
+        raise SystemExit("No labelled sessions found")
+    rng = np.random.default_rng(args.seed)
+    print(f"State estimation {'on' if STATE_ESTIMATION else 'off'}, {args.workers} workers")
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(by_drill,)) as executor:
+        for drill_type, sessions in sorted(by_drill.items()):
+            names = [name for name, drills in PARAMETERS.items() if drill_type in drills
+                     and (name in space or not args.param)]
+            if not names:
+                print(f"\n{drill_type}: no constant to tune")
+                continue
+            configs = configurations({name: space[name] if name in space else default_values(name)
+                                      for name in names}, args.random, rng)
+            started = time.perf_counter()
+            chunksize = max(len(configs) // (4 * args.workers), 1)
+            scores = list(executor.map(partial(evaluate, drill_type, args.tolerance), configs, chunksize=chunksize))
+            elapsed = time.perf_counter() - started
+
+            labelled = sum(session.rep_frames is not None for session in sessions)
+            print(f"\n{drill_type}: {len(configs)} configurations of {', '.join(sorted(names))} over "
+                  f"{len(sessions)} sessions, {labelled} with labelled reps, in {elapsed:.1f}s")
+            header = "".join(f"{name:>{len(name) + 2}}" for name in sorted(names))
+            print(f"  {header}{'count error':>13}{'precision':>11}{'offset':>8}")
+            current = configs[0]
+            for config, error, precision, offset in pareto_front(scores):
+                values = "".join(f"{value:>{len(name) + 2}g}" for name, value in config)
+                print(f"{'*' if config == current else ' '} {values}{error:>13.2f}{format_timing(precision, offset)}")
+            if current not in [score[0] for score in pareto_front(scores)]:
+                _, error, precision, offset = scores[0]
+                values = "".join(f"{value:>{len(name) + 2}g}" for name, value in current)
+                print(f"* {values}{error:>13.2f}{format_timing(precision, offset)}  (current, dominated)")
+
+
+if __name__ == "__main__":
+    main()